@@ -0,0 +1,52 @@
+"""
+Compare cold (parse) and warm (cached) load times for a large config file.
+
+Usage::
+
+    python benchmarks/bench_cache.py [ENTRIES]
+
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+from rjgtoys.config._cache import ParsedConfigCache
+from rjgtoys.config._source import YamlFileConfigSource
+
+
+def make_config(path, entries):
+    """Write a synthetic config file with `entries` top-level sections."""
+
+    with open(path, 'w') as f:
+        for i in range(entries):
+            f.write(f"section{i}:\n")
+            f.write(f"  host: host{i}.example.com\n")
+            f.write(f"  port: {1000 + i}\n")
+            f.write("  tags: [alpha, beta, gamma]\n")
+            f.write("  limits: {cpu: 2, memory: 512}\n")
+
+
+def main(entries=5000, repeat=5):
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.conf')
+        make_config(path, entries)
+
+        cold = YamlFileConfigSource(path)
+        warm = YamlFileConfigSource(path, cache=ParsedConfigCache(os.path.join(tmp, 'cache')))
+
+        warm.fetch()    # populate the cache
+
+        t_cold = min(timeit.repeat(cold.fetch, number=1, repeat=repeat))
+        t_warm = min(timeit.repeat(warm.fetch, number=1, repeat=repeat))
+
+    print(f"{entries} sections, best of {repeat}")
+    print(f"  cold (YAML parse): {t_cold * 1000:8.2f} ms")
+    print(f"  warm (cached):     {t_warm * 1000:8.2f} ms")
+    print(f"  speedup:           {t_cold / t_warm:8.1f}x")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
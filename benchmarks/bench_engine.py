@@ -0,0 +1,236 @@
+"""
+Time the merge and normalisation operations on synthetic configurations
+that are deep (mappings nested many levels), wide (many keys at each
+level) or have many layers of defaults.
+
+Each operation is timed beside the recursive version that it replaced,
+which is reproduced here, so that the difference can be seen.
+
+Normalisation is timed with the cache of normalised layers disabled,
+then with it enabled, both when it starts empty (as for the first load)
+and when it holds the layers already (as for a reload).
+
+Usage::
+
+    python benchmarks/bench_engine.py [REPEAT]
+
+An operation that fails (for example by exceeding the recursion limit)
+is reported as such.
+"""
+
+import collections.abc
+import sys
+import timeit
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._index import ConfigIndex
+from rjgtoys.config._ops import (
+    config_merge,
+    config_normalise,
+    config_overlay,
+    config_resolve,
+    set_normalise_cache_size,
+)
+
+
+# The recursive versions, as they were
+
+def recursive_merge(part, result):
+
+    for (key, value) in part.items():
+        if not isinstance(value, collections.abc.Mapping):
+            result[key] = value
+            continue
+        try:
+            prev = result[key]
+        except KeyError:
+            result[key] = value
+            continue
+        recursive_merge(value, prev)
+
+
+def recursive_overlay(part, base):
+
+    if part is base or not part:
+        return base if isinstance(base, Thing) else Thing(base)
+
+    if not base:
+        return part if isinstance(part, Thing) else Thing(part)
+
+    result = Thing(base)
+
+    for (key, value) in part.items():
+        if isinstance(value, collections.abc.Mapping):
+            prev = result.get(key)
+            if isinstance(prev, collections.abc.Mapping):
+                value = recursive_overlay(value, prev)
+        result[key] = value
+
+    return result
+
+
+def recursive_normalise(raw):
+
+    result = Thing(raw)
+
+    try:
+        layers = raw.defaults
+    except AttributeError:
+        layers = ()
+
+    if isinstance(layers, collections.abc.Mapping):
+        layers = (layers,)
+
+    defaults = Thing() if layers else {}
+    for layer in layers:
+        defaults = recursive_overlay(recursive_normalise(layer), defaults)
+
+    result.defaults = defaults
+
+    view = defaults.get('__view__', {})
+    local_view = raw.get('__view__')
+
+    if local_view:
+        view = recursive_overlay(local_view, view)
+
+    result.__view__ = view
+
+    return result
+
+
+def recursive_resolve(raw):
+
+    try:
+        layers = raw.defaults
+    except AttributeError:
+        return raw
+
+    if isinstance(layers, collections.abc.Mapping):
+        layers = (layers,)
+
+    defaults = {}
+    for layer in layers:
+        recursive_merge(recursive_resolve(layer), defaults)
+
+    if not defaults:
+        return raw
+
+    del raw['defaults']
+    recursive_merge(raw, defaults)
+    return defaults
+
+
+class RecursiveIndex(ConfigIndex):
+    """A :class:`ConfigIndex` that indexes its chain of defaults by recursion."""
+
+    def __init__(self, data):
+
+        self._index_layer(data)
+
+        defaults = data.get('defaults')
+
+        self.defaults = RecursiveIndex(defaults) if defaults else None
+
+
+def deep(depth, leaf='x'):
+    """A chain of mappings `depth` levels deep, with a few values at each level."""
+
+    node = Thing(value=leaf)
+    for i in range(depth):
+        node = Thing(level=i, name=f"level{i}", child=node)
+    return node
+
+
+def wide(width, depth=3, leaf='x'):
+    """A tree with `width` keys at each of `depth` levels."""
+
+    if depth == 0:
+        return leaf
+    return Thing({f"k{i}": wide(width, depth - 1, leaf) for i in range(width)})
+
+
+def layered(layers, nesting):
+    """A config with `layers` defaults layers, each with defaults nested `nesting` deep."""
+
+    def layer(i, n):
+        result = None
+        for _ in range(n + 1):
+            part = Thing({f"l{i}_{j}": Thing(a=j, b=Thing(c=j)) for j in range(20)})
+            part.common = Thing(a=i, b=Thing(c=i))
+            if result is not None:
+                part.defaults = [result]
+            result = part
+        return result
+
+    return Thing(top=1, defaults=[layer(i, nesting) for i in range(layers)])
+
+
+CASES = [
+    ('deep', lambda: (deep(3000, 'a'), deep(3000, 'b'))),
+    ('wide', lambda: (wide(30, 3, 'a'), wide(30, 3, 'b'))),
+]
+
+LAYERED = [
+    ('many layers', lambda: (layered(300, 1),)),
+    ('nested layers', lambda: (layered(3, 1500),)),
+]
+
+
+def timed(fn, repeat, make):
+    """Time `fn(*make())`; the arguments are made afresh for each run,
+    because `fn` may modify them."""
+
+    times = []
+    try:
+        for _ in range(repeat):
+            args = make()
+            times.append(timeit.timeit(lambda: fn(*args), number=1))
+    except RecursionError:
+        return '%15s' % ('RecursionError',)
+    return '%12.2f ms' % (min(times) * 1e3)
+
+
+CACHE_SIZE = 128
+
+
+def emptied(make):
+    """Return a version of `make` that first empties the cache of normalised layers."""
+
+    def make_emptied():
+        set_normalise_cache_size(0)
+        set_normalise_cache_size(CACHE_SIZE)
+        return make()
+
+    return make_emptied
+
+
+def main(repeat=5):
+
+    def compare(label, recursive, iterative, make):
+        print(f"  {label:22}{timed(recursive, repeat, make)}{timed(iterative, repeat, make)}")
+
+    print(f"{'':24}{'recursive':>15}{'iterative':>15}")
+
+    for (name, make) in CASES:
+        print(f"{name}:")
+        compare('config_overlay', recursive_overlay, config_overlay, make)
+        compare('config_merge', recursive_merge, config_merge, make)
+
+    for (name, make) in LAYERED:
+
+        def make_normalised():
+            return (config_normalise(*make()),)
+
+        print(f"{name}:")
+        set_normalise_cache_size(0)
+        compare('config_normalise', recursive_normalise, config_normalise, make)
+        set_normalise_cache_size(CACHE_SIZE)
+        print(f"    first load, cached    {'':15}{timed(config_normalise, repeat, emptied(make))}")
+        print(f"    reload, cached        {'':15}{timed(config_normalise, repeat, make)}")
+        compare('config_resolve', recursive_resolve, config_resolve, make)
+        compare('ConfigIndex', RecursiveIndex, ConfigIndex, make_normalised)
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,113 @@
+"""
+Time a full :meth:`ConfigManager.load` of a large configuration file,
+compared with the baseline of just parsing the file.
+
+The rest of the load (normalising the data, indexing it and updating
+the proxies) is also timed on its own, using data that has been parsed
+already, both for a first load and for a reload of the same data,
+which is what a watcher does when a file is touched but not changed.
+
+The file has HOSTS host records, SECTIONS sections of FIELDS values
+each, a layer of defaults, and views for PROXIES proxies.
+
+Usage::
+
+    python benchmarks/bench_load.py [REPEAT]
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+from rjgtoys.config import Config
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._parsers import config_load_path
+from rjgtoys.config._proxy import ConfigProxy
+from rjgtoys.config._source import ConfigSource
+
+
+HOSTS = 20000
+SECTIONS = 2000
+FIELDS = 20
+PROXIES = 50
+
+
+# A model with FIELDS integer fields, f0, f1...
+
+Model = type('Model', (Config,), {
+    '__annotations__': {f"f{i}": int for i in range(FIELDS)},
+    '__module__': __name__,
+})
+
+
+class ParsedSource(ConfigSource):
+    """A source that provides data that has been parsed already."""
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+
+    def fetch(self):
+        return self.data
+
+
+def write_config(path):
+    """Write the configuration file to `path`."""
+
+    with open(path, 'w') as f:
+        f.write("hosts:\n")
+        for h in range(HOSTS):
+            f.write(f"  - {{name: host{h}, addr: 10.0.{h // 256}.{h % 256}, port: 22, tags: [a, b]}}\n")
+        for s in range(SECTIONS):
+            f.write(f"s{s}:\n")
+            for i in range(FIELDS):
+                f.write(f"  f{i}: {s + i}\n")
+        f.write("defaults:\n")
+        f.write("  s0: {extra: 1}\n")
+        f.write("  __view__:\n")
+        for p in range(PROXIES):
+            f.write(f"    view{p}:\n")
+            for i in range(FIELDS):
+                f.write(f"      f{i}: s{p}.f{i}\n")
+
+
+def main(repeat=5):
+
+    def best(fn):
+        return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1e3
+
+    def first_load():
+        ConfigManager.data = None
+        ConfigManager.load(always=True)
+
+    def reload():
+        ConfigManager.load(always=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'app.yaml')
+        write_config(path)
+
+        proxies = [ConfigProxy(Model, name=f"view{p}") for p in range(PROXIES)]
+
+        parse_time = best(lambda: config_load_path(path))
+
+        ConfigManager.set_path(path)
+        load_time = best(first_load)
+
+        assert proxies[1].f0 == 1
+
+        ConfigManager.source = ParsedSource(config_load_path(path))
+
+    install_time = best(first_load)
+    reinstall_time = best(reload)
+
+    print(f"parse only (baseline):    {parse_time:10.2f} ms")
+    print(f"ConfigManager.load():     {load_time:10.2f} ms")
+    print("without parsing:")
+    print(f"  first load              {install_time:10.2f} ms")
+    print(f"  reload, unchanged       {reinstall_time:10.2f} ms")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,85 @@
+"""
+Compare the memory used by configuration data held as
+:class:`rjgtoys.thing.Thing` objects and as frozen
+:class:`rjgtoys.config._node.ConfigNode` objects.
+
+Usage::
+
+    python benchmarks/bench_node_memory.py [RECORDS]
+
+"""
+
+import gc
+import sys
+import tracemalloc
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._node import config_freeze
+
+
+def make_config(records):
+    """Make some data that looks like a typical large configuration:
+    lists of records with the same fields, and some nested sections."""
+
+    return Thing(
+        hosts=[
+            Thing(
+                name=f"host{i}.example.com",
+                port=8000 + i % 100,
+                region=['eu-west', 'us-east', 'ap-south'][i % 3],
+                tags=['web', 'db'][i % 2:],
+                limits=Thing(cpu=i % 8, memory=f"{i % 16}G")
+            )
+            for i in range(records)
+        ],
+        services={
+            f"service{i}": Thing(
+                enabled=bool(i % 2),
+                replicas=i % 5,
+                options=Thing(timeout=30, retries=3)
+            )
+            for i in range(records // 10)
+        }
+    )
+
+
+def copy_things(data):
+    """Copy the containers in `data` as Things and lists, sharing everything else."""
+
+    if isinstance(data, dict):
+        return Thing((k, copy_things(v)) for (k, v) in data.items())
+    if isinstance(data, list):
+        return [copy_things(v) for v in data]
+    return data
+
+
+def measure(make):
+    """Return (result, bytes allocated and still live)."""
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = make()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (result, after - before)
+
+
+def main(records=20000):
+
+    data = make_config(records)
+
+    # Only the containers are counted; the keys and values are shared
+
+    (_, thing_size) = measure(lambda: copy_things(data))
+    (_, frozen_size) = measure(lambda: config_freeze(data))
+
+    print(f"{records} records")
+    print(f"  containers as Things:       {thing_size / 1e6:8.2f} MB")
+    print(f"  containers as ConfigNodes:  {frozen_size / 1e6:8.2f} MB")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,47 @@
+"""
+Compare the time taken to normalise a configuration whose defaults
+layers have been seen before, with and without the cache of normalised
+layers.
+
+Usage::
+
+    python benchmarks/bench_normalise_cache.py [LAYERS [REPEAT]]
+
+"""
+
+import sys
+import timeit
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._ops import config_normalise, set_normalise_cache_size
+
+
+def make_layer(i, depth=3):
+    """Make a defaults layer that has defaults of its own."""
+
+    layer = Thing(
+        {f"setting{i}_{j}": Thing(value=j, name=f"item {j}", tags=['a', 'b']) for j in range(50)},
+        __view__=Thing({f"view{i}_{j}": Thing(a=f"setting{i}_{j}.value") for j in range(20)})
+    )
+    if depth:
+        layer.defaults = [make_layer(i * 10 + k, depth - 1) for k in range(2)]
+    return layer
+
+
+def main(layers=10, repeat=20):
+
+    shared = [make_layer(i) for i in range(layers)]
+
+    def load():
+        # Only the top level is new each time
+        return config_normalise(Thing(top=1, defaults=list(shared)))
+
+    for size in (0, 128):
+        set_normalise_cache_size(size)
+        t = min(timeit.repeat(load, number=1, repeat=repeat))
+        print(f"cache size {size:3d}: {t * 1e3:8.2f} ms per load")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,69 @@
+"""
+Measure the memory used by normalising an alias-heavy configuration,
+compared with the memory used by the parsed data itself.
+
+Usage::
+
+    python benchmarks/bench_normalise_memory.py [LAYERS]
+
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from rjgtoys.config._ops import config_normalise
+from rjgtoys.config._parsers import config_load_path
+
+
+def make_config(path, layers):
+    """Write a config in which many defaults layers refer to the same big subtrees."""
+
+    with open(path, 'w') as f:
+        f.write("shared:\n")
+        f.write("  views: &views\n")
+        for i in range(200):
+            f.write(f"    view{i}: {{a: section{i}.a, b: section{i}.b}}\n")
+        f.write("  hosts: &hosts\n")
+        for i in range(500):
+            f.write(f"    host{i}: {{name: host{i}.example.com, port: {1000 + i}}}\n")
+        f.write("defaults:\n")
+        for i in range(layers):
+            f.write(f"  - layer{i}: {i}\n")
+            f.write("    hosts: *hosts\n")
+            f.write("    __view__: *views\n")
+            f.write("    defaults:\n")
+            f.write("      hosts: *hosts\n")
+            f.write("      __view__: *views\n")
+        f.write("hosts: *hosts\n")
+        f.write("__view__: *views\n")
+
+
+def traced(fn, *args):
+    """Return (result, bytes allocated and still live)."""
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn(*args)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (result, after - before)
+
+
+def main(layers=50):
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'aliases.yaml')
+        make_config(path, layers)
+
+        (raw, raw_size) = traced(config_load_path, path)
+        (_, normalised_size) = traced(config_normalise, raw)
+
+        print(f"{layers} layers, file {os.path.getsize(path) / 1e3:.1f} kB")
+        print(f"  parsed data:         {raw_size / 1e3:10.1f} kB")
+        print(f"  added by normalise:  {normalised_size / 1e3:10.1f} kB")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
@@ -0,0 +1,98 @@
+"""
+Compare parse throughput of the configuration file formats.
+
+Usage::
+
+    python benchmarks/bench_parsers.py [SECTIONS]
+
+"""
+
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+from rjgtoys.yaml import yaml_load_path
+
+from rjgtoys.config import _parsers
+from rjgtoys.config._node import config_thaw
+
+
+def make_data(sections):
+    """Return a synthetic configuration with `sections` top-level sections."""
+
+    return {
+        f"section{i}": {
+            "host": f"host{i}.example.com",
+            "port": 1000 + i,
+            "enabled": i % 2 == 0,
+            "ratio": i / 7,
+            "tags": ["alpha", "beta", "gamma"],
+            "limits": {"cpu": 2, "memory": 512},
+        }
+        for i in range(sections)
+    }
+
+
+def to_yaml(data):
+
+    lines = []
+    for (name, section) in data.items():
+        lines.append(f"{name}:")
+        for (key, value) in section.items():
+            lines.append(f"  {key}: {json.dumps(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def to_toml(data):
+
+    lines = []
+    for (name, section) in data.items():
+        lines.append(f"[{name}]")
+        for (key, value) in section.items():
+            if isinstance(value, dict):
+                value = "{ " + ", ".join(f"{k} = {json.dumps(v)}" for (k, v) in value.items()) + " }"
+            else:
+                value = json.dumps(value)
+            lines.append(f"{key} = {value}")
+    return "\n".join(lines) + "\n"
+
+
+def main(sections=2000, repeat=3):
+
+    data = make_data(sections)
+
+    files = {
+        'app.yaml': to_yaml(data),
+        'app.json': json.dumps(data, indent=2),
+        'app.toml': to_toml(data),
+    }
+
+    parsers = [
+        ('yaml (rjgtoys.yaml)', 'app.yaml', yaml_load_path),
+        ('yaml (registry)', 'app.yaml', _parsers.config_load_path),
+        ('json', 'app.json', _parsers.config_load_path),
+        ('toml', 'app.toml', _parsers.config_load_path),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for (name, text) in files.items():
+            with open(os.path.join(tmp, name), 'w') as f:
+                f.write(text)
+
+        print(f"{sections} sections, best of {repeat}")
+        for (label, name, parse) in parsers:
+            path = os.path.join(tmp, name)
+            if parse is _parsers.config_load_path and _parsers.find_format(path) not in name:
+                print(f"  {label:22} unavailable")
+                continue
+            # The registry's parsers return read-only data
+            assert config_thaw(parse(path)) == data
+            t = min(timeit.repeat(lambda: parse(path), number=1, repeat=repeat))
+            size = os.path.getsize(path)
+            print(f"  {label:22} {t * 1000:9.2f} ms  {size / t / 1e6:8.2f} MB/s")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
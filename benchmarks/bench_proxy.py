@@ -0,0 +1,110 @@
+"""
+Time the building of proxy values from normalised configuration data
+that has several layers of defaults, as done by each load, and the
+reading of values through a proxy, with and without binding
+(see :meth:`ConfigManager.set_bind_values`), compared with reading
+them from the model instance.
+
+Usage::
+
+    python benchmarks/bench_proxy.py [REPEAT]
+"""
+
+import sys
+import timeit
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config import Config
+from rjgtoys.config._index import ConfigIndex
+from rjgtoys.config._ops import config_normalise
+from rjgtoys.config._proxy import ConfigProxy
+
+
+FIELDS = 20
+PROXIES = 200
+LAYERS = 4
+
+
+# A model with FIELDS integer fields, f0, f1...
+
+Model = type('Model', (Config,), {
+    '__annotations__': {f"f{i}": int for i in range(FIELDS)},
+    '__module__': __name__,
+})
+
+
+class StandaloneProxy(ConfigProxy):
+    """A proxy that isn't registered with the manager."""
+
+    class manager_type:
+
+        bind_values = False
+
+        @staticmethod
+        def attach(proxy):
+            pass
+
+        @staticmethod
+        def load():
+            pass
+
+        @staticmethod
+        def trusted_values(name, definition, fingerprint):
+            return None
+
+
+def layered():
+    """Configuration data for PROXIES views of the model, each taking its
+    fields from a section that has a value in each of LAYERS layers."""
+
+    def layer(n):
+        part = Thing({
+            f"s{p}": Thing({f"f{i}": n for i in range(FIELDS)})
+            for p in range(PROXIES)
+        })
+        part.__view__ = Thing({
+            f"view{p}": Thing({f"f{i}": f"s{p}.f{i}" for i in range(FIELDS)})
+            for p in range(PROXIES)
+        })
+        return part
+
+    data = layer(0)
+    data.defaults = [layer(n) for n in range(1, LAYERS)]
+    return config_normalise(data)
+
+
+def update_all(proxies, data):
+    index = ConfigIndex(data)
+    for p in proxies:
+        p.update(data, index)
+
+
+def main(repeat=5):
+
+    data = layered()
+    proxies = [StandaloneProxy(Model, name=f"view{p}") for p in range(PROXIES)]
+
+    update_all(proxies, data)
+    assert proxies[0]._value.f0 == 0
+
+    t = min(timeit.repeat(lambda: update_all(proxies, data), number=1, repeat=repeat))
+    print(f"update {PROXIES} proxies: {t * 1e3:10.2f} ms")
+
+    proxy = proxies[0]
+    model = proxy._value
+
+    def access(obj):
+        return min(timeit.repeat(lambda: obj.f0, number=100000, repeat=repeat)) * 1e4
+
+    print(f"read model attribute:     {access(model):7.1f} ns")
+    print(f"read proxy attribute:     {access(proxy):7.1f} ns")
+
+    StandaloneProxy.manager_type.bind_values = True
+    proxy._bind()
+
+    print(f"read bound attribute:     {access(proxy):7.1f} ns")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
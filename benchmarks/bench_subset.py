@@ -0,0 +1,80 @@
+"""
+Compare full and demand-driven loading of a large config file, in time and
+peak memory, when a program uses only one section of it.
+
+Usage::
+
+    python benchmarks/bench_subset.py [SECTIONS]
+
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from rjgtoys.config import Config
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._proxy import ConfigProxy
+
+
+class SectionModel(Config):
+
+    host: str
+    port: int
+
+
+def make_config(path, sections):
+
+    with open(path, 'w') as f:
+        for i in range(sections):
+            f.write(f"section{i}:\n")
+            f.write(f"  host: host{i}.example.com\n")
+            f.write(f"  port: {1000 + i}\n")
+            f.write("  tags: [alpha, beta, gamma]\n")
+            f.write("  limits: {cpu: 2, memory: 512}\n")
+        f.write("__view__:\n")
+        f.write("  bench.section:\n")
+        f.write("    host: section7.host\n")
+        f.write("    port: section7.port\n")
+
+
+def measure(demand_driven):
+
+    ConfigManager.set_demand_driven(demand_driven)
+
+    # Time and memory are measured separately, because tracing
+    # allocations distorts the timing
+
+    start = time.perf_counter()
+    ConfigManager.load(always=True)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    ConfigManager.load(always=True)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (elapsed, peak)
+
+
+def main(sections=5000):
+
+    cfg = ConfigProxy(SectionModel, name='bench.section')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.yaml')
+        make_config(path, sections)
+
+        ConfigManager.set_path(path)
+
+        print(f"{sections} sections, {os.path.getsize(path) / 1e6:.1f} MB")
+        for (label, demand_driven) in (('full', False), ('demand-driven', True)):
+            (elapsed, peak) = measure(demand_driven)
+            assert cfg.host == 'host7.example.com'
+            print(f"  {label:14} {elapsed * 1000:9.2f} ms  peak {peak / 1e6:7.2f} MB")
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:2]))
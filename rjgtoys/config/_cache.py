@@ -0,0 +1,189 @@
+"""
+
+Parsed configuration cache
+--------------------------
+
+Parsing a large YAML file can take a significant fraction of the startup
+time of a short-lived program.   A :class:`ParsedConfigCache` keeps
+the parsed form of each configuration file in a directory, so that
+if the file has not changed since it was last parsed, the YAML parser
+need not be run at all.
+
+.. autoclass:: ParsedConfigCache
+   :members: load, file_key
+
+"""
+
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+
+from rjgtoys.config._parsers import record_reads
+
+
+# A marker for 'no cached value', because None is a valid configuration
+
+_MISSING = object()
+
+
+class ParsedConfigCache:
+    """An on-disk cache of parsed configuration data.
+
+    Each entry is keyed on the identity of the file it was parsed from:
+    its real path, inode number, size and modification time (in nanoseconds).
+    If any of those change, the entry is stale and the file is parsed again.
+
+    Each entry also records the identities of the other files that were
+    read by the parse (see :func:`rjgtoys.config._parsers.record_reads`), such as
+    those pulled in by an ``!include`` tag, and is stale if any of
+    them has changed.   A file that includes a directory is not cached,
+    because there's no cheap way to tell whether the directory has changed.
+
+    The entries are stored using :mod:`pickle`, so the cache directory
+    must be no less trustworthy than the configuration files themselves.
+    """
+
+    # Bump this if the layout of an entry changes
+
+    FORMAT = 2
+
+    def __init__(self, directory):
+        """
+        `directory`
+          The directory in which to keep cache entries.  It is
+          created if necessary.
+        """
+
+        self.directory = directory
+
+    @staticmethod
+    def file_key(path):
+        """Return the key that identifies the current content of `path`.
+
+        Returns `None` if `path` is not a regular file, because the
+        identity of a directory says nothing about the files it contains.
+        """
+
+        realpath = os.path.realpath(path)
+        s = os.stat(realpath)
+
+        if not stat.S_ISREG(s.st_mode):
+            return None
+
+        return (realpath, s.st_ino, s.st_size, s.st_mtime_ns)
+
+    @classmethod
+    def parse_recording(cls, path, parse):
+        """Return ``(data, dependencies)``, where `data` is ``parse(path)``,
+        and `dependencies` is a tuple of the keys of the other files that
+        were read (see :meth:`file_key`), or `None` if some of them can't be checked.
+        """
+
+        with record_reads() as paths:
+            data = parse(path)
+
+        realpath = os.path.realpath(path)
+
+        dependencies = []
+        for p in dict.fromkeys(paths):
+            try:
+                key = cls.file_key(p)
+            except OSError:
+                return (data, None)
+            if key is None:
+                return (data, None)
+            if key[0] != realpath:
+                dependencies.append(key)
+
+        return (data, tuple(dependencies))
+
+    @classmethod
+    def is_current(cls, dependencies):
+        """Return `True` if none of the files whose keys are in `dependencies` has changed."""
+
+        for key in dependencies:
+            try:
+                if cls.file_key(key[0]) != key:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+    def _entry_path(self, realpath):
+        """Return the path of the cache entry for a file."""
+
+        name = hashlib.sha1(realpath.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.directory, name + '.cache')
+
+    def get(self, key):
+        """Return the cached data for `key`, or `_MISSING` if there is none.
+
+        Stale or unreadable entries are treated as missing.
+        """
+
+        try:
+            with open(self._entry_path(key[0]), 'rb') as f:
+                (fmt, stored_key, dependencies, data) = pickle.load(f)
+        except Exception:
+            # Absent, truncated, corrupt or from an incompatible version
+            return _MISSING
+
+        if fmt != self.FORMAT or stored_key != key or not self.is_current(dependencies):
+            return _MISSING
+
+        return data
+
+    def put(self, key, data, dependencies=()):
+        """Store `data` under `key`, noting that it depends on the files
+        whose keys are in `dependencies` (see :meth:`parse_recording`).
+
+        The entry is written to a temporary file and renamed into place, so
+        that concurrent readers never see a partial entry.   Failure to
+        write is not an error; the cache is only an optimisation.
+        """
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            (fd, tmp) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError:
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((self.FORMAT, key, dependencies, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._entry_path(key[0]))
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def load(self, path, parse):
+        """Return the data in `path`, from the cache if possible.
+
+        `parse` is called with `path` to do a real parse if there is
+        no valid cache entry, and the result is then cached.   Only the files
+        that `parse` reads with :func:`rjgtoys.config._parsers.config_load_path`
+        can be recorded as dependencies of the entry.
+        """
+
+        try:
+            key = self.file_key(path)
+        except OSError:
+            key = None
+
+        if key is None:
+            # Let the parser report the problem (or read the directory)
+            return parse(path)
+
+        data = self.get(key)
+        if data is not _MISSING:
+            return data
+
+        (data, dependencies) = self.parse_recording(path, parse)
+        if dependencies is not None:
+            self.put(key, data, dependencies)
+        return data
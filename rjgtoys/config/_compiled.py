@@ -0,0 +1,195 @@
+"""
+
+Compiled configuration snapshots
+--------------------------------
+
+A snapshot holds configuration data that has already been fetched
+and normalised, in a compact binary form that can be loaded without
+running the YAML parser or :func:`rjgtoys.config._ops.config_normalise`.
+
+This is useful where configuration is deployed as an immutable artifact:
+the parsing and normalisation can be done once, when the artifact is built,
+instead of in every process that uses it.
+
+A snapshot file consists of a fixed header followed by a :mod:`pickle`
+of the normalised data.   The header carries a magic number and a format
+version, so that a snapshot written by an incompatible version of this
+package is rejected rather than misread.
+
+A snapshot written by :meth:`ConfigManager.compile` also records the
+values of the models that were validated against the data, each keyed
+by the model, a digest of its definition and a fingerprint of its input
+(see :meth:`rjgtoys.config._proxy.ConfigProxy.update`).   A proxy whose
+input has the same fingerprint when the snapshot is loaded, and whose
+model has the same definition, builds its model from those values without
+validating them again.   Each entry is pickled separately, so that one
+whose model can't be imported doesn't prevent the snapshot from being used.
+
+.. autofunction:: compile_config
+
+.. autofunction:: write_snapshot
+
+.. autofunction:: read_snapshot
+
+.. autoclass:: CompiledConfigSource
+
+.. autoexception:: ConfigSnapshotInvalid
+
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+from rjgtoys.xc import Error, Title
+
+from rjgtoys.config._ops import config_normalise
+from rjgtoys.config._source import ConfigSource, resolve_noop
+
+
+SNAPSHOT_MAGIC = b'RJGTCFG\0'
+
+SNAPSHOT_VERSION = 2
+
+# magic, version, payload length
+
+_HEADER = struct.Struct('<8sHQ')
+
+
+class ConfigSnapshotInvalid(Error):
+    """Raised when a configuration snapshot can't be used."""
+
+    path: str = Title('Path of the snapshot file')
+    reason: str = Title('What is wrong with it')
+
+    detail = "Configuration snapshot {path} is invalid: {reason}"
+
+
+def write_snapshot(path, data, validated=None):
+    """Write normalised configuration `data` to a snapshot file at `path`.
+
+    `validated`, if not `None`, is a :class:`dict` of pickled model values,
+    keyed by (model name, model definition digest, fingerprint).
+
+    The file is written under a temporary name and then renamed into place,
+    so that a process loading the snapshot never sees a partial file.
+    """
+
+    payload = pickle.dumps((data, validated or {}), protocol=pickle.HIGHEST_PROTOCOL)
+
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(payload))
+
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_snapshot(path):
+    """Read normalised configuration data from the snapshot file at `path`.
+
+    Raises :exc:`ConfigSnapshotInvalid` if the file is not a snapshot,
+    was written by an incompatible version, or is truncated or corrupt.
+    """
+
+    return _read_snapshot(path)[0]
+
+
+def _read_snapshot(path):
+    """Return ``(data, validated)`` from the snapshot file at `path`;
+    see :func:`write_snapshot`."""
+
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ConfigSnapshotInvalid(path=path, reason="file is empty")
+
+    with mm:
+        if len(mm) < _HEADER.size:
+            raise ConfigSnapshotInvalid(path=path, reason="file is too short")
+
+        (magic, version, length) = _HEADER.unpack_from(mm, 0)
+
+        if magic != SNAPSHOT_MAGIC:
+            raise ConfigSnapshotInvalid(path=path, reason="not a configuration snapshot")
+
+        if version != SNAPSHOT_VERSION:
+            raise ConfigSnapshotInvalid(
+                path=path,
+                reason=f"format version {version}, expected {SNAPSHOT_VERSION}"
+            )
+
+        end = _HEADER.size + length
+        if len(mm) != end:
+            raise ConfigSnapshotInvalid(path=path, reason="file is truncated or has trailing data")
+
+        with memoryview(mm) as view, view[_HEADER.size:end] as payload:
+            try:
+                content = pickle.loads(payload)
+            except Exception as e:
+                raise ConfigSnapshotInvalid(path=path, reason=f"payload is corrupt ({e})")
+
+    if not (isinstance(content, tuple) and len(content) == 2):
+        raise ConfigSnapshotInvalid(path=path, reason="payload has the wrong structure")
+
+    return content
+
+
+def compile_config(source, path, intern=None):
+    """Fetch data from a :class:`ConfigSource`, normalise it and write a snapshot.
+
+    `intern` is passed to :func:`rjgtoys.config._ops.config_normalise`.
+
+    Returns the normalised data.
+    """
+
+    data = source.fetch()
+    if not source.normalised:
+        data = config_normalise(data, intern)
+
+    write_snapshot(path, data)
+
+    return data
+
+
+class CompiledConfigSource(ConfigSource):
+    """This :class:`ConfigSource` implementation reads a snapshot written
+    by :func:`compile_config` or :meth:`ConfigManager.compile`.
+
+    The data it delivers is already normalised, and :attr:`validated` holds
+    the model values that were recorded with it, if any.
+    """
+
+    normalised = True
+
+    def __init__(self, path, resolve=None):
+        """
+        `path`
+          The path to the snapshot file.
+
+        `resolve`
+          If not `None`, a callable that will be passed `path` to
+          'resolve' it to an absolute pathname, as for
+          :class:`rjgtoys.config._source.YamlFileConfigSource`.
+        """
+
+        super().__init__()
+        self.path = path
+        self.resolve = resolve or resolve_noop
+
+    def fetch(self):
+
+        (data, self.validated) = _read_snapshot(self.resolve(self.path))
+        return data
+
+    def watch_paths(self):
+
+        return [self.resolve(self.path)]
@@ -0,0 +1,133 @@
+"""
+
+Differences between configurations
+----------------------------------
+
+When configuration data is reloaded, usually little of it has changed.
+:func:`config_diff` returns a :class:`ConfigChanges` that can say whether
+the values at particular dotted paths differ between the old and new
+(normalised) data, so that the :class:`ConfigManager` need only rebuild
+those proxies whose view depends on something that changed.
+
+Nothing is compared until it's asked about, and then only the values at
+the paths in question, so the cost of a reload depends on what the proxies
+use, not on the size of the data.   The values at a path are looked up in
+each layer of the :class:`rjgtoys.config._index.ConfigIndex` of each version
+of the data, stopping at a value that hides those below it, just as for
+:meth:`rjgtoys.config._index.ConfigIndex.flatten`, and the path is affected
+if any of them differ.   That may report a change that is hidden by
+the merging of defaults, but never misses one.
+
+A path such as ``__view__.name`` refers to the view mapping for `name`,
+which is compared in every layer, because a proxy's view is built from
+the view mapping in each layer (see :meth:`rjgtoys.config._proxy.ConfigProxy.update`).
+The caller must ask about the paths used by both the old and the new
+view mappings.
+
+.. autofunction:: config_diff
+
+.. autoclass:: ConfigChanges
+   :members: affects, affects_any
+
+"""
+
+import collections.abc
+
+
+# Stands for a value that is missing from one side
+
+_MISSING = object()
+
+# Paths that start with this refer to the view mapping for a proxy
+
+_VIEW_PREFIX = '__view__.'
+
+
+class ConfigChanges:
+    """Describes the differences between two versions of some configuration data."""
+
+    def __init__(self, old, new):
+        """
+        `old`, `new`
+          The :class:`rjgtoys.config._index.ConfigIndex` of each version of the data.
+        """
+
+        self.old = old.data
+        self.new = new.data
+
+        self.old_index = old
+        self.new_index = new
+
+        # The answers given so far, by path
+
+        self._affected = {}
+
+    def affects(self, path):
+        """Is the value at dotted `path` changed?
+
+        A path such as ``__view__.name`` refers to the view mappings for `name`
+        in all the layers of the data.
+        """
+
+        try:
+            return self._affected[path]
+        except KeyError:
+            pass
+
+        old = _lookup(self.old_index, path)
+        new = _lookup(self.new_index, path)
+
+        affected = len(old) != len(new) or any(a is not b and a != b for (a, b) in zip(old, new))
+
+        self._affected[path] = affected
+        return affected
+
+    def affects_any(self, paths):
+        """Is the value at any of `paths` changed?"""
+
+        return any(self.affects(path) for path in paths)
+
+
+def config_diff(old, new):
+    """Return a :class:`ConfigChanges` that describes the differences between
+    two versions of some normalised configuration data, given
+    the :class:`rjgtoys.config._index.ConfigIndex` of each.
+    """
+
+    return ConfigChanges(old, new)
+
+
+def _lookup(index, path):
+    """Return a tuple of the values at `path` in the layers of `index` that
+    contribute to its value with defaults applied, outermost first.
+
+    For a view mapping, return the mapping in each layer, or `_MISSING` for
+    a layer that has none, so that a mapping moving between layers is seen.
+    """
+
+    values = []
+
+    if path.startswith(_VIEW_PREFIX):
+        name = path[len(_VIEW_PREFIX):]
+        while index is not None:
+            values.append(index.data.get('__view__', {}).get(name, _MISSING))
+            index = index.defaults
+
+        # Trailing layers with no mapping make no difference
+
+        while values and values[-1] is _MISSING:
+            values.pop()
+        return tuple(values)
+
+    while index is not None:
+        value = index.paths.get(path, _MISSING)
+        if value is not _MISSING:
+            values.append(value)
+
+            # A value that isn't a mapping hides any below it
+
+            if not isinstance(value, collections.abc.Mapping):
+                break
+        index = index.defaults
+
+    return tuple(values)
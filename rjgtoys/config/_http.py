@@ -0,0 +1,255 @@
+"""
+
+Configuration over HTTP
+-----------------------
+
+An :class:`HttpConfigSource` fetches configuration data from a URL.
+
+It makes conditional requests (using ``If-None-Match`` and
+``If-Modified-Since``) so that an unchanged document is not transferred
+or parsed again, and it keeps its connection open between fetches.
+
+It can also keep a copy of the last document that it fetched successfully,
+so that a program can still start if the server is slow or unavailable.
+
+The format of the document is identified by the ``Content-Type`` of
+the response, or by sniffing it; see :mod:`rjgtoys.config._parsers`.
+The document is not trusted: a YAML document can't include local files
+or construct Python objects.
+
+.. autoclass:: HttpConfigSource
+
+.. autoexception:: ConfigFetchFailed
+
+"""
+
+import http.client
+import json
+import os
+import tempfile
+import threading
+import urllib.parse
+
+from rjgtoys.xc import Error, Title
+
+from rjgtoys.config._parsers import config_loads
+from rjgtoys.config._source import ConfigSource
+
+
+class ConfigFetchFailed(Error):
+    """Raised when configuration data can't be fetched, and there is no copy to use instead."""
+
+    url: str = Title('The URL that was requested')
+    reason: str = Title('What went wrong')
+
+    detail = "Failed to fetch configuration from {url}: {reason}"
+
+
+class HttpConfigSource(ConfigSource):
+    """This :class:`ConfigSource` implementation fetches a configuration
+    document from an HTTP or HTTPS URL."""
+
+    def __init__(self, url, cache_path=None, timeout=5.0, headers=None):
+        """
+        `url`
+          The URL of the configuration document.
+
+        `cache_path`
+          If not `None`, the path of a file in which to keep the last
+          document that was fetched successfully.  It is used if the
+          server can't be reached, or answers with an error.
+
+        `timeout`
+          How long to wait for the server, in seconds.
+
+        `headers`
+          Any additional request headers (such as ``Authorization``).
+        """
+
+        super().__init__()
+        self.url = url
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL scheme: %s" % (url,))
+
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        self._lock = threading.Lock()
+        self._conn = None
+
+        # The validators and parsed data from the last good response
+
+        self._etag = None
+        self._last_modified = None
+        self._data = None
+
+        # How the last fetch was satisfied: 'fetched', 'not-modified' or 'cached'
+
+        self.last_result = None
+
+    def _connect(self):
+        """Return the persistent connection, making it if necessary."""
+
+        if self._conn is None:
+            if self._scheme == 'https':
+                self._conn = http.client.HTTPSConnection(self._netloc, timeout=self.timeout)
+            else:
+                self._conn = http.client.HTTPConnection(self._netloc, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        """Close the connection to the server."""
+
+        with self._lock:
+            self._close()
+
+    def _close(self):
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _request(self, headers):
+        """Make a GET request; return (status, headers, body).
+
+        A connection that was kept open may have been closed by the server
+        in the meantime, so one failure on a reused connection is retried
+        on a fresh one.
+        """
+
+        for attempt in (1, 2):
+            reused = self._conn is not None
+            conn = self._connect()
+            try:
+                conn.request('GET', self._target, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._close()
+                if reused and attempt == 1:
+                    continue
+                raise
+            except BaseException:
+                self._close()
+                raise
+            if response.will_close:
+                self._close()
+            return (response.status, response.headers, body)
+
+    def fetch(self):
+
+        with self._lock:
+            return self._fetch()
+
+    def _fetch(self):
+
+        if self._data is None:
+            self._load_cache()
+
+        headers = dict(self.headers)
+        headers.setdefault('Accept', 'application/json, application/yaml;q=0.9, */*;q=0.5')
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+
+        try:
+            (status, response_headers, body) = self._request(headers)
+        except (OSError, http.client.HTTPException) as e:
+            return self._fallback(str(e) or e.__class__.__name__)
+
+        if status == 304 and self._data is not None:
+            self.last_result = 'not-modified'
+            return self._data
+
+        if status != 200:
+            return self._fallback("HTTP status %d" % (status,))
+
+        content_type = response_headers.get('Content-Type')
+
+        try:
+            data = config_loads(body, content_type, safe=True)
+        except Exception as e:
+            return self._fallback("can't parse response: %s" % (e,))
+
+        self._etag = response_headers.get('ETag')
+        self._last_modified = response_headers.get('Last-Modified')
+        self._data = data
+        self.last_result = 'fetched'
+
+        self._save_cache(body, content_type)
+
+        return data
+
+    def _fallback(self, reason):
+        """Return the last good data, or raise :exc:`ConfigFetchFailed` if there is none."""
+
+        if self._data is None:
+            raise ConfigFetchFailed(url=self.url, reason=reason)
+
+        self.last_result = 'cached'
+        return self._data
+
+    def _load_cache(self):
+        """Load the last good document from the cache file, if there is one.
+
+        The file holds a line of JSON containing the response metadata,
+        followed by the body of the response.
+        """
+
+        if not self.cache_path:
+            return
+
+        try:
+            with open(self.cache_path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+            data = config_loads(body, meta.get('content_type'), safe=True)
+        except Exception:
+            # Missing or damaged; it's only a fallback
+            return
+
+        if meta.get('url') != self.url:
+            return
+
+        self._etag = meta.get('etag')
+        self._last_modified = meta.get('last_modified')
+        self._data = data
+
+    def _save_cache(self, body, content_type):
+        """Save the last good document to the cache file."""
+
+        if not self.cache_path:
+            return
+
+        meta = dict(
+            url=self.url,
+            etag=self._etag,
+            last_modified=self._last_modified,
+            content_type=content_type
+        )
+
+        try:
+            (fd, tmp) = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.cache_path)),
+                suffix='.tmp'
+            )
+        except OSError:
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8') + b'\n')
+                f.write(body)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
@@ -0,0 +1,217 @@
+"""
+
+Included files
+--------------
+
+An entry in the ``defaults`` of a configuration file may be the path of
+another file, rather than a mapping; the content of that file is used
+as that layer of defaults.   A relative path is relative to the directory
+of the file that includes it, and an included file may include others in
+the same way::
+
+    defaults:
+      - common/logging.yaml
+      - common/database.yaml
+      - local: values
+        go: here
+
+Included files are read by an :class:`IncludeCache`, which keeps the
+parsed content of each file until the file changes, so a fragment that
+is included from many places, or by each reload, is parsed only once.
+The files needed at each level of inclusion are read concurrently.
+
+A file that includes itself, directly or indirectly, is an error
+(:exc:`ConfigIncludeCycle`).
+
+.. autoclass:: IncludeCache
+   :members: load, expand
+
+.. autoexception:: ConfigIncludeCycle
+
+"""
+
+import collections.abc
+import concurrent.futures
+import os
+import threading
+from typing import List
+
+from rjgtoys.xc import Error, Title
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._cache import ParsedConfigCache
+from rjgtoys.config._parsers import config_load_path
+
+
+class ConfigIncludeCycle(Error):
+    """Raised when a configuration file includes itself."""
+
+    path: str = Title('The file that includes itself')
+    chain: List[str] = Title('The chain of included files that leads back to it')
+
+    detail = "Configuration file {path} includes itself, via {chain}"
+
+
+class IncludeCache:
+    """Reads and remembers included configuration files.
+
+    Each file is remembered along with its identity (see
+    :meth:`rjgtoys.config._cache.ParsedConfigCache.file_key`) and those of
+    any files it includes in turn, and parsed again only if one of those changes.
+
+    The data that is returned is shared, and must not be modified.
+    """
+
+    def __init__(self, parse=None, max_workers=None):
+        """
+        `parse`
+          If not `None`, a callable that is passed a path and returns
+          the data in the file.   The default is
+          :func:`rjgtoys.config._parsers.config_load_path`.
+
+        `max_workers`
+          The maximum number of threads used to read files;
+          the default is as for :class:`concurrent.futures.ThreadPoolExecutor`.
+        """
+
+        self.parse = parse or config_load_path
+        self.max_workers = max_workers
+
+        self.hits = 0
+        self.misses = 0
+
+        # Real path -> (file key, dependencies, data)
+
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """Return the data in the file at `path`."""
+
+        key = ParsedConfigCache.file_key(path)
+
+        with self._lock:
+            entry = self._entries.get(key[0]) if key is not None else None
+        if entry is not None and entry[0] == key and ParsedConfigCache.is_current(entry[1]):
+            with self._lock:
+                self.hits += 1
+            return entry[2]
+
+        with self._lock:
+            self.misses += 1
+
+        (data, dependencies) = ParsedConfigCache.parse_recording(path, self.parse)
+
+        if key is not None and dependencies is not None:
+            with self._lock:
+                self._entries[key[0]] = (key, dependencies, data)
+
+        return data
+
+    def expand(self, data, path):
+        """Replace included files in the defaults of `data` by their content.
+
+        `data` was read from `path`.   Returns ``(data, included)`` where `data`
+        is the expanded data (or the original, if nothing was included)
+        and `included` is a list of the paths of the files that were included.
+
+        The original `data` is not modified.
+        """
+
+        path = os.path.realpath(path)
+
+        # Read all the files that are needed, a level at a time
+
+        loaded = {}
+
+        pending = _includes(data, path)
+        while pending:
+            batch = [p for p in dict.fromkeys(pending) if p not in loaded]
+            if len(batch) > 1:
+                with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+                    parts = list(pool.map(self.load, batch))
+            else:
+                parts = [self.load(p) for p in batch]
+
+            pending = []
+            for (p, part) in zip(batch, parts):
+                loaded[p] = part
+                pending.extend(_includes(part, p))
+
+        if not loaded:
+            return (data, [])
+
+        return (_expand(data, path, loaded), list(loaded))
+
+
+def _layers(data):
+    """Return the list of defaults layers in `data`."""
+
+    if not isinstance(data, collections.abc.Mapping):
+        return ()
+
+    defaults = data.get('defaults')
+
+    if isinstance(defaults, (str, collections.abc.Mapping)):
+        return (defaults,)
+
+    return defaults or ()
+
+
+def _includes(data, path):
+    """Return the real paths of the files included by `data`, which was read from `path`."""
+
+    base = os.path.dirname(path)
+
+    return [
+        os.path.realpath(os.path.join(base, layer))
+        for layer in _layers(data)
+        if isinstance(layer, str)
+    ]
+
+
+def _expand(data, path, loaded):
+    """Return `data` with its includes replaced by the content of the
+    files in `loaded`, checking for cycles."""
+
+    expanded = {}
+
+    # Each entry on the stack is (data, its path, the chain of
+    # files that led to it, its layers, the layers expanded so far)
+
+    stack = [(data, path, (path,), _layers(data), [])]
+
+    while True:
+        (data, path, chain, layers, done) = stack[-1]
+
+        while len(done) < len(layers):
+            layer = layers[len(done)]
+            if not isinstance(layer, str):
+                done.append(layer)
+                continue
+
+            included = os.path.realpath(os.path.join(os.path.dirname(path), layer))
+            if included in chain:
+                raise ConfigIncludeCycle(path=included, chain=list(chain))
+
+            if included not in expanded:
+                part = loaded[included]
+                stack.append((part, included, chain + (included,), _layers(part), []))
+                break
+
+            done.append(expanded[included])
+        else:
+            stack.pop()
+
+            if any(isinstance(layer, str) for layer in layers):
+                result = Thing(data)
+                result.defaults = done
+            else:
+                result = data
+
+            if not stack:
+                return result
+
+            expanded[path] = result
+            stack[-1][4].append(result)
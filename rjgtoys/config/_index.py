@@ -0,0 +1,261 @@
+"""
+
+Path indexes
+------------
+
+View mappings refer to configuration values by dotted paths, such
+as ``db.primary.host``.   Keys may themselves contain dots, so a path
+can be split in more than one way: ``a.b.c`` might mean ``data['a']['b']['c']``,
+``data['a.b']['c']``, ``data['a']['b.c']`` or ``data['a.b.c']``.
+
+A :class:`ConfigIndex` is built once for each load of the (normalised)
+configuration data, and maps every dotted path that can be reached in the
+data directly to its value, so that each lookup is a single dictionary access.
+
+Where a path can be reached in more than one way, the preference is
+the same as it always was: at each level, a key that matches all of
+the remaining path wins, and otherwise the shortest key wins.   Unlike
+the old search, the index will find a value by a longer key if the
+shorter one doesn't lead anywhere.
+
+Values are looked up through the whole chain of defaults by
+:meth:`ConfigIndex.get_defaulted`, or, for many paths at once, by
+:meth:`ConfigIndex.get_many`.   The first such lookup flattens the chain
+into a single table (see :meth:`ConfigIndex.flatten`) that holds, for each
+path, the values from every layer that contribute to it; the defaulted
+value of each path is then worked out once, and remembered, so that every
+lookup after that, by any proxy, is a single dictionary access.
+
+.. autoclass:: ConfigIndex
+   :members: get_defaulted, get_many, flatten
+
+"""
+
+import collections.abc
+
+from rjgtoys.config._node import config_freeze
+from rjgtoys.config._ops import config_overlay
+
+
+class ConfigIndex:
+    """An index of all the dotted paths in one layer of normalised configuration data,
+    with a chain of indexes for its ``defaults``.
+
+    The ``defaults`` and ``__view__`` entries are indexed as top-level
+    keys but their content is not, because ``defaults`` has an index of
+    its own, and nothing should look up values inside ``__view__``.
+    Keys that are not strings can't be part of a path, and are ignored.
+    """
+
+    # Top-level entries whose content is not indexed
+
+    UNINDEXED = ('defaults', '__view__')
+
+    def __init__(self, data):
+        """
+        `data`
+          The normalised configuration data to index.
+        """
+
+        self._index_layer(data)
+
+        # The chain of defaults may be deeper than the recursion
+        # limit, so it's indexed a layer at a time, not by recursion
+
+        index = self
+        defaults = data.get('defaults')
+        while defaults:
+            index.defaults = ConfigIndex.__new__(ConfigIndex)
+            index = index.defaults
+            index._index_layer(defaults)
+            defaults = defaults.get('defaults')
+
+    def _index_layer(self, data):
+        """Index just one layer, `data`, without its defaults."""
+
+        self.data = data
+        self.paths = {}
+        self.defaults = None
+
+        # The flattened chain (see flatten), and the defaulted
+        # values that have been worked out from it
+
+        self._flat = None
+        self._resolved = {}
+
+        self._build(data)
+
+    def __getitem__(self, path):
+        """Return the value at dotted `path`, or raise :exc:`KeyError`."""
+
+        return self.paths[path]
+
+    def __contains__(self, path):
+
+        return path in self.paths
+
+    def __len__(self):
+
+        return len(self.paths)
+
+    def flatten(self):
+        """Return the flattened chain of defaults: a :class:`dict` that maps
+        each path in this layer or any below it to a tuple of the values
+        that contribute to its defaulted value, outermost first.
+
+        The table is made once, and shared by all the lookups.
+        """
+
+        if self._flat is not None:
+            return self._flat
+
+        # Flatten the layers below first, starting from the innermost,
+        # each building on the one below it
+
+        chain = []
+        index = self
+        while index is not None and index._flat is None:
+            chain.append(index)
+            index = index.defaults
+
+        below = index._flat if index is not None else {}
+
+        for index in reversed(chain):
+
+            # A value that isn't a mapping, where the layer below has one,
+            # hides everything beneath that mapping too
+
+            hiding = {
+                path for (path, value) in index.paths.items()
+                if not isinstance(value, collections.abc.Mapping)
+                and isinstance(below.get(path, (None,))[0], collections.abc.Mapping)
+            }
+
+            if hiding:
+                flat = {
+                    path: values for (path, values) in below.items()
+                    if not _hidden_by(path, hiding)
+                }
+            else:
+                flat = dict(below)
+
+            for (path, value) in index.paths.items():
+
+                # A value that isn't a mapping hides any below it
+
+                if isinstance(value, collections.abc.Mapping):
+                    flat[path] = (value,) + below.get(path, ())
+                else:
+                    flat[path] = (value,)
+
+            index._flat = below = flat
+
+        return below
+
+    def get_defaulted(self, path):
+        """Return the value at dotted `path`, with defaults applied,
+        or raise :exc:`KeyError`.
+
+        The value is shared by every caller, so it's read-only.
+        """
+
+        try:
+            return self._resolved[path]
+        except KeyError:
+            pass
+
+        value = config_freeze(_fold(self.flatten()[path]))
+        self._resolved[path] = value
+        return value
+
+    def get_many(self, paths):
+        """Return a :class:`dict` that maps each of `paths` to its value,
+        with defaults applied.   Paths that have no value are left out.
+        """
+
+        result = {}
+        for path in paths:
+            try:
+                result[path] = self.get_defaulted(path)
+            except KeyError:
+                pass
+        return result
+
+    def _build(self, data):
+
+        # The 'rank' of each path that has been seen so far,
+        # used to choose between different ways to reach it.
+        # A rank has an element for each key along the path:
+        # (1, len(key)) for a key with more to follow, and (0,)
+        # for the final key, so that the preferred way sorts first.
+
+        ranks = {}
+
+        # The mappings are visited depth first using an explicit stack
+        # of (iterator over a mapping, its path prefix, its rank, its id).
+        # 'active' holds the ids of the mappings on the stack, to guard
+        # against recursive structures made by YAML aliases.
+
+        active = {id(data)}
+        stack = [(iter(data.items()), '', (), id(data))]
+
+        while stack:
+            (items, prefix, rank, ident) = stack[-1]
+            for (key, value) in items:
+                if not isinstance(key, str):
+                    continue
+                path = prefix + key
+                self._add(ranks, path, rank + ((0,),), value)
+
+                if not isinstance(value, collections.abc.Mapping) or id(value) in active:
+                    continue
+                if not prefix and key in self.UNINDEXED:
+                    continue
+
+                active.add(id(value))
+                stack.append((iter(value.items()), path + '.', rank + ((1, len(key)),), id(value)))
+                break
+            else:
+                stack.pop()
+                active.discard(ident)
+
+    def _add(self, ranks, path, rank, value):
+
+        prev = ranks.get(path)
+        if prev is not None and prev <= rank:
+            return
+
+        ranks[path] = rank
+        self.paths[path] = value
+
+
+def _hidden_by(path, hiding):
+    """Is some proper prefix of dotted `path` in the set `hiding`?"""
+
+    i = path.find('.')
+    while i >= 0:
+        if path[:i] in hiding:
+            return True
+        i = path.find('.', i + 1)
+    return False
+
+
+def _fold(values):
+    """Return the result of applying a list of values, outermost first,
+    each as the default for the one before it."""
+
+    # Override defaults from explicit values, starting from the
+    # innermost, and leaving the data itself alone.   An explicit
+    # mapping replaces a default that isn't one.
+
+    if len(values) == 1:
+        return values[0]
+
+    result = values[-1]
+    for value in reversed(values[:-1]):
+        if isinstance(value, collections.abc.Mapping) and isinstance(result, collections.abc.Mapping):
+            result = config_overlay(value, result)
+        else:
+            result = value
+
+    return result
@@ -1,7 +1,12 @@
 
 
+import asyncio
+import functools
+import logging
 import os
+import pickle
 import sys
+import threading
 
 from typing import List, Any
 
@@ -9,8 +14,17 @@ import weakref
 
 from rjgtoys.xc import Error, Title
 
+from rjgtoys.config._cache import ParsedConfigCache
+from rjgtoys.config._compiled import write_snapshot
+from rjgtoys.config._diff import config_diff
+from rjgtoys.config._index import ConfigIndex
+from rjgtoys.config._node import config_freeze
 from rjgtoys.config._source import YamlFileConfigSource, SearchPathConfigSource
 from rjgtoys.config._ops import config_normalise
+from rjgtoys.config._watch import WatchingConfigSource
+
+
+log = logging.getLogger(__name__)
 
 
 def default_app_name():
@@ -58,6 +72,10 @@ class ConfigManager:
 
     source = None
 
+    # An optional cache of parsed configuration files (see set_cache)
+
+    cache = None
+
     # Has the data been loaded?
 
     loaded = False
@@ -66,10 +84,61 @@ class ConfigManager:
 
     data = None
 
+    # ...and this is an index of the paths in it (see rjgtoys.config._index)
+
+    index = None
+
+    # Counts of proxies rebuilt and skipped by the last load (see update_stats)
+
+    _update_stats = dict(rebuilt=0, skipped=0)
+
+    # Counts of the ways in which proxies made their values, since the
+    # counts were last reset (see validation_stats)
+
+    _validation_stats = dict(validated=0, reused=0, trusted=0)
+
+    # Model values that were validated against the current data in
+    # some earlier process, from the source (see trusted_values)
+
+    _trusted = {}
+
     # List of registered proxies that need to be notified when data is loaded
 
     proxies = []
 
+    # Serialises loads, which may happen on a background thread (see watch)
+
+    _lock = threading.RLock()
+
+    # In-progress asynchronous loads, by event loop (see aload)
+
+    _inflight = {}
+
+    # If True, fetch only the data that the live proxies need (see set_demand_driven)
+
+    demand_driven = False
+
+    # The top-level keys that were requested by the last demand-driven
+    # load, or None if all the data was loaded
+
+    _wanted = None
+
+    # If not None, string values no longer than this are interned (see set_intern_strings)
+
+    intern_strings = None
+
+    # If True, proxies are updated when they're first used (see set_lazy)
+
+    lazy = False
+
+    # If True, proxies bind their values as attributes (see set_bind_values)
+
+    bind_values = False
+
+    # If watching for changes, the WatchingConfigSource (see watch)
+
+    watcher = None
+
     # Default list of places to search
 
     DEFAULT_SEARCH = [
@@ -96,8 +165,7 @@ class ConfigManager:
         if path is None:
             return
 
-        cls.source = YamlFileConfigSource(path, resolve=cls._resolve_path)
-        cls.loaded = False
+        cls._set_source(YamlFileConfigSource(path, resolve=cls._resolve_path, cache=cls.cache))
 
     @classmethod
     def set_search(cls, *paths):
@@ -106,8 +174,66 @@ class ConfigManager:
         if not paths:
             return
 
-        cls.source = SearchPathConfigSource(*paths, resolve=cls._resolve_path)
-        cls.loaded = False
+        cls._set_source(
+            SearchPathConfigSource(
+                *paths,
+                resolve=cls._resolve_path,
+                loader=cls._get_loader(),
+                env=cls.get_search_env
+            )
+        )
+
+    @classmethod
+    def _set_source(cls, source):
+        """Use a new source for subsequent loads."""
+
+        watching = cls.watcher is not None
+        if watching:
+            cls.unwatch()
+
+        with cls._lock:
+            cls.source = source
+            cls._unload()
+
+        if watching:
+            cls.watch()
+
+    @classmethod
+    def _get_source(cls):
+        """Return the source, creating the default search if necessary."""
+
+        if cls.source is None:
+#            print("Using default search %s" % (cls.DEFAULT_SEARCH))
+            cls.source = SearchPathConfigSource(
+                *cls.DEFAULT_SEARCH,
+                cls.FALLBACK_PATH,
+                resolve=cls._resolve_path,
+                loader=cls._get_loader(),
+                env=cls.get_search_env
+            )
+        return cls.source
+
+    @classmethod
+    def set_cache(cls, directory):
+        """Keep parsed configuration files in `directory`.
+
+        Subsequent loads of an unchanged file will use the cached data
+        rather than parsing the file again.   Pass `None` to stop using
+        a cache.
+
+        This applies to sources created after the call, so it should be
+        called before :meth:`set_path` or :meth:`set_search`.
+        """
+
+        cls.cache = ParsedConfigCache(directory) if directory else None
+
+    @classmethod
+    def _get_loader(cls):
+        """Return the loader to be used for each file on a search path."""
+
+        if cls.cache is None:
+            return None
+        return functools.partial(YamlFileConfigSource, cache=cls.cache)
 
     @classmethod
     def _resolve_path(cls, path):
@@ -118,6 +244,67 @@ class ConfigManager:
     def set_app_name(cls, name):
         cls.app_name = name
 
+    @classmethod
+    def set_demand_driven(cls, enable=True):
+        """Choose whether to load only the data that the live proxies need.
+
+        When enabled, the source is asked (see :meth:`ConfigSource.fetch_subset`)
+        for only those top-level entries that are mentioned by the view
+        mappings of the registered proxies.  For a large configuration file
+        that is shared by many programs, that can save a lot of time and memory.
+
+        If a proxy that needs more data is registered after loading,
+        the data is loaded again.
+        """
+
+        if enable != cls.demand_driven:
+            cls.demand_driven = enable
+            cls._unload()
+
+    @classmethod
+    def set_bind_values(cls, enable=True):
+        """Choose whether proxies bind the values of their fields as attributes.
+
+        Normally, reading an attribute of a :class:`ConfigProxy` makes sure
+        that the data is loaded, and then reads the attribute of the model
+        instance.   When binding is enabled, each proxy copies the values
+        of the fields of its model instance into its own attributes as it's
+        updated, so that they can be read as quickly as those of
+        the model instance itself.
+
+        Each load replaces the values, and anything that makes the
+        data stale (such as :meth:`set_path`) removes them, so that the next
+        read loads the data again.
+        """
+
+        with cls._lock:
+            cls.bind_values = enable
+            for p in cls._live_proxies():
+                p._bind()
+
+    @classmethod
+    def _unload(cls):
+        """Forget that the data was loaded, so that the next use loads it again."""
+
+        cls.loaded = False
+
+        for p in cls._live_proxies():
+            p._unbind()
+
+    @classmethod
+    def set_intern_strings(cls, max_length=64):
+        """Choose whether to intern short string values when the data is loaded.
+
+        Configuration data often repeats the same strings (host names,
+        regions, enumerated values) many times; if `max_length` is not `None`,
+        each string value no longer than that is interned, so that only
+        one copy of it is kept.   `None` turns interning off.
+
+        Keys are interned in any case.   The setting takes effect at the next load.
+        """
+
+        cls.intern_strings = max_length
+
     @classmethod
     def load(cls, always=False):
         """Ensure the data is loaded."""
@@ -125,21 +312,320 @@ class ConfigManager:
         if cls.loaded and not always:
             return
 
-        if cls.source is None:
-#            print("Using default search %s" % (cls.DEFAULT_SEARCH))
-            cls.source = SearchPathConfigSource(
-                *cls.DEFAULT_SEARCH,
-                cls.FALLBACK_PATH,
-                resolve=cls._resolve_path
-            )
+        with cls._lock:
+            if cls.loaded and not always:
+                return
+            cls._load()
+
+    @classmethod
+    def _load(cls):
+        """Load the data and update the proxies; the caller holds the lock."""
+
+        source = cls._get_source()
+
+        cls._install(source, cls._fetch(source))
+
+    @classmethod
+    def _fetch(cls, source):
+        """Fetch data from `source`, or as much as is needed."""
+
+        cls._wanted = None
+
+        if not cls.demand_driven:
+            return source.fetch()
+
+        return source.fetch_subset(cls._wanted_keys)
+
+    @classmethod
+    def _wanted_keys(cls, partial):
+        """Return the top-level keys needed by the live proxies.
+
+        `partial` contains just the ``defaults`` and ``__view__`` entries
+        of the data.
+        """
+
+        data = config_normalise(partial, cls.intern_strings)
+
+        keys = set()
+        for p in cls._live_proxies():
+            keys.update(p._wanted_keys(data))
+
+        cls._wanted = keys
+
+        return keys
+
+    @classmethod
+    async def aload(cls, always=False):
+        """Ensure the data is loaded, without blocking the event loop.
+
+        The data is fetched by :meth:`ConfigSource.afetch`, and the
+        normalisation and proxy updates are run in the default executor.
+
+        Concurrent calls share a single load: if one is already in
+        progress, later callers wait for it to finish rather than
+        starting another.
+        """
+
+        if cls.loaded and not always:
+            return
+
+        loop = asyncio.get_running_loop()
+
+        task = cls._inflight.get(loop)
+        if task is None:
+            task = loop.create_task(cls._aload())
+            cls._inflight[loop] = task
+            task.add_done_callback(lambda _: cls._inflight.pop(loop, None))
+
+        # Don't let one impatient caller cancel the load for everyone
+
+        await asyncio.shield(task)
+
+    @classmethod
+    async def _aload(cls):
+
+        loop = asyncio.get_running_loop()
+
+        source = cls._get_source()
 
-        data = cls.source.fetch()
+        if cls.demand_driven:
+            data = await loop.run_in_executor(None, cls._fetch, source)
+        else:
+            cls._wanted = None
+            data = await source.afetch()
 
-        cls.data = config_normalise(data)
+        await loop.run_in_executor(None, cls._install_locked, source, data)
+
+    @classmethod
+    def _install_locked(cls, source, data):
+        with cls._lock:
+            cls._install(source, data)
+
+    @classmethod
+    def _install(cls, source, data):
+        """Install newly fetched data and update the proxies; the caller holds the lock."""
+
+        # The data must be read-only, because it's shared with the
+        # proxies and perhaps a cache; normalising makes it so, and
+        # freezing something that's already frozen does nothing
+
+        if source.normalised:
+            data = config_freeze(data)
+        else:
+            data = config_normalise(data, cls.intern_strings)
+
+        index = ConfigIndex(data)
+
+        # Note what has changed, so that proxies that are
+        # not affected needn't be rebuilt
+
+        old = cls.index
+        changes = config_diff(old, index) if old is not None and old.data is cls.data else None
+
+        cls.data = data
+        cls.index = index
+
+        cls._trusted = source.validated or {}
 
         cls.loaded = True
 
-        # Figure out which proxies are still live, and update them
+        cls._update_stats = dict(rebuilt=0, skipped=0)
+
+        proxies = cls._live_proxies()
+
+        if cls.lazy:
+            # Each proxy will be updated when it's first used (see materialise)
+
+            for p in proxies:
+                p._mark_stale(cls.data, cls.index, changes)
+            return
+
+        errors = []
+        for p in proxies:
+            try:
+                cls._update_proxy(p, cls.data, cls.index, changes)
+            except Exception as e:
+                #raise
+                errors.append((p, e))
+
+        # Report any errors
+
+        if errors:
+            raise ConfigUpdateError(errors=errors)
+
+    @classmethod
+    def _update_proxy(cls, proxy, data, index, changes):
+        """Update `proxy` and count what it did; the caller holds the lock."""
+
+        stats = cls._update_stats
+
+        try:
+            rebuilt = proxy.update(data, index, changes)
+        except Exception:
+            stats['rebuilt'] += 1
+            raise
+
+        if rebuilt:
+            stats['rebuilt'] += 1
+            cls._validation_stats[proxy._validation] += 1
+        else:
+            stats['skipped'] += 1
+
+    @classmethod
+    def set_lazy(cls, enable=True):
+        """Choose whether proxies are updated as each load happens, or when they're used.
+
+        Normally each load updates every registered proxy, which means
+        validating each of their models.   In lazy mode, a load only
+        marks the proxies as stale, and each is updated when an attribute
+        is first read from it (see :meth:`materialise`), so a program
+        pays only for the configuration that it uses.
+
+        The catch is that an error in the data for a proxy is not reported
+        by the load, but by the first read from the proxy.   A program
+        that would rather fail early can call :meth:`validate_all`.
+        """
+
+        cls.lazy = enable
+
+    @classmethod
+    def materialise(cls, proxy):
+        """Update `proxy` if it is stale (see :meth:`set_lazy`).
+
+        Raises :exc:`ConfigUpdateError` if that fails; the proxy remains
+        stale, so the next attempt to use it will fail in the same way.
+        """
+
+        with cls._lock:
+            pending = proxy._pending
+            if pending is None:
+                return
+
+            try:
+                cls._update_proxy(proxy, *pending)
+            except Exception as e:
+                raise ConfigUpdateError(errors=[(proxy, e)])
+
+    @classmethod
+    def validate_all(cls):
+        """Load the data if necessary, and update every stale proxy now.
+
+        Raises :exc:`ConfigUpdateError` listing all the proxies that could
+        not be updated.   In lazy mode (see :meth:`set_lazy`), this is a way to
+        find out at startup whether all the configuration is valid; otherwise
+        the load has done it already.
+        """
+
+        cls.load()
+
+        errors = []
+
+        with cls._lock:
+            for p in cls._live_proxies():
+                pending = p._pending
+                if pending is None:
+                    continue
+                try:
+                    cls._update_proxy(p, *pending)
+                except Exception as e:
+                    errors.append((p, e))
+
+        if errors:
+            raise ConfigUpdateError(errors=errors)
+
+    @classmethod
+    def update_stats(cls):
+        """Return a :class:`dict` of counters describing the work done by the last load.
+
+        `rebuilt`
+          The number of proxies whose values were built from the new data.
+        `skipped`
+          The number of proxies whose values were kept, because nothing
+          that they depend upon had changed.
+
+        In lazy mode (see :meth:`set_lazy`) the counts grow as
+        stale proxies are used.
+        """
+
+        return dict(cls._update_stats)
+
+    @classmethod
+    def validation_stats(cls, reset=False):
+        """Return a :class:`dict` of counters describing how the proxies
+        made their values, over all the loads since the counters were last reset.
+
+        `validated`
+          The number of times a model was validated.
+        `reused`
+          The number of times a proxy kept its value because the input
+          to its model was the same as before.
+        `trusted`
+          The number of times a model was made from values that were
+          validated before (see :meth:`trusted_values`).
+
+        If `reset` is true, the counters are set to zero afterwards.
+        """
+
+        stats = dict(cls._validation_stats)
+
+        if reset:
+            cls._validation_stats = dict.fromkeys(stats, 0)
+
+        return stats
+
+    @classmethod
+    def trusted_values(cls, name, definition, fingerprint):
+        """Return the values that the model called `name` had when it
+        was validated against input with `fingerprint`, as
+        ``(field values, names of fields that were set)``, or `None`.
+
+        `definition` is a digest of the definition of the model (see
+        :func:`rjgtoys.config._proxy._model_digest`); values that were
+        validated by a model with a different definition, perhaps one
+        with a new validator, are not trusted.
+
+        These come from the source of the data (see :attr:`ConfigSource.validated`);
+        a snapshot written by :meth:`compile` records the values of all the
+        proxies that were live when it was written.
+        """
+
+        values = cls._trusted.get((name, definition, fingerprint))
+        if values is None:
+            return None
+
+        try:
+            return pickle.loads(values)
+        except Exception:
+            # Perhaps the model has changed
+            log.debug("Can't use the recorded values of %s", name, exc_info=True)
+            return None
+
+    @classmethod
+    def get_many(cls, paths):
+        """Return the values at a number of dotted `paths`, with defaults applied.
+
+        This is for settings that don't fit a model; the result is
+        a :class:`dict` that maps each path to its value, and paths that
+        have no value are left out.   The data is loaded if necessary.
+
+        All the paths are looked up together (see
+        :meth:`rjgtoys.config._index.ConfigIndex.get_many`), which is much
+        quicker than looking them up one at a time.
+
+        In demand-driven mode (see :meth:`set_demand_driven`) only the
+        data needed by the registered proxies is loaded, and
+        nothing else can be found.
+        """
+
+        cls.load()
+
+        # Read the index just once, in case a reload replaces it
+
+        return cls.index.get_many(paths)
+
+    @classmethod
+    def _live_proxies(cls):
+        """Return the proxies that are still live, and forget the others."""
 
         live_proxies = []
         real_proxies = []
@@ -152,31 +638,105 @@ class ConfigManager:
 
         cls.proxies = live_proxies
 
-        errors = []
-        for p in real_proxies:
-            try:
-                p.update(cls.data)
-            except Exception as e:
-                #raise
-                errors.append((p, e))
+        return real_proxies
 
-        # Report any errors
+    @classmethod
+    def watch(cls, debounce=0.25, poll_interval=1.0):
+        """Reload the data in the background whenever the source changes.
 
-        if errors:
-            raise ConfigUpdateError(errors=errors)
+        The current source is wrapped in a
+        :class:`rjgtoys.config._watch.WatchingConfigSource`, which watches
+        the files it depends on; see there for the meaning of the parameters.
+        """
+
+        with cls._lock:
+            if cls.watcher is not None:
+                return
+
+            source = cls._get_source()
+            if not isinstance(source, WatchingConfigSource):
+                source = WatchingConfigSource(
+                    source,
+                    debounce=debounce,
+                    poll_interval=poll_interval
+                )
+                cls.source = source
+
+            source.subscribe(cls._reload)
+            source.start()
+            cls.watcher = source
+
+    @classmethod
+    def unwatch(cls):
+        """Stop reloading data in the background."""
+
+        with cls._lock:
+            watcher = cls.watcher
+            if watcher is None:
+                return
+            cls.watcher = None
+            watcher.unsubscribe(cls._reload)
+            cls.source = watcher.source
+
+        # Don't hold the lock while the watcher finishes, because
+        # it may be waiting for it
+
+        watcher.stop()
+
+    @classmethod
+    def _reload(cls):
+        """Called by the watcher when the source has changed."""
+
+        try:
+            cls.load(always=True)
+        except Exception:
+            log.exception("Failed to reload configuration")
+
+    @classmethod
+    def compile(cls, path):
+        """Load the configuration and write it to a snapshot file at `path`.
+
+        The snapshot can be loaded later, without parsing or normalisation,
+        by a :class:`rjgtoys.config._compiled.CompiledConfigSource`.   It
+        includes the values of the live proxies, so that proxies whose
+        input is unchanged when it is loaded needn't validate it again.
+        """
+
+        cls.validate_all()
+
+        validated = {}
+        for p in cls._live_proxies():
+            entry = p._validated_values()
+            if entry is not None:
+                validated[entry[0]] = entry[1]
+
+        write_snapshot(path, cls.data, validated)
 
     @classmethod
     def attach(cls, proxy):
         """Register a proxy."""
 
-        cls.proxies.append(weakref.ref(proxy))
+        with cls._lock:
+            cls.proxies.append(weakref.ref(proxy))
+
+            # If we already have data, update the new proxy
+            # (because it missed being called when we loaded)
+
+            if not cls.loaded:
+                return
+
+            # If only part of the data was loaded, it may not be enough
+
+            if cls._wanted is not None and not proxy._wanted_keys(cls.data) <= cls._wanted:
+                cls.load(always=True)
+                return
 
-        # If we already have data, update the new proxy
-        # (because it missed being called when we loaded)
+            if cls.lazy:
+                proxy._mark_stale(cls.data, cls.index, None)
+                return
 
-        if cls.loaded:
             try:
-                proxy.update(cls.data)
+                cls._update_proxy(proxy, cls.data, cls.index, None)
             except Exception as e:
-                raise ConfigUpdateError([(proxy, e)])
+                raise ConfigUpdateError(errors=[(proxy, e)])
 
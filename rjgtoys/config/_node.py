@@ -0,0 +1,397 @@
+"""
+
+Frozen configuration data
+-------------------------
+
+Once configuration data has been normalised, nothing should change it:
+the same data may be held by a cache (see :mod:`rjgtoys.config._ops`),
+read by several threads at once, and compared with the next version when
+the configuration is reloaded (see :mod:`rjgtoys.config._diff`).
+
+:func:`config_freeze` makes a read-only copy of some configuration data,
+in which each mapping is a :class:`ConfigNode` and each list is a :class:`tuple`.
+Data that is already frozen is not copied again, and data that is referred
+to from several places (for example by YAML aliases) is copied only once,
+so the copy is no bigger than it needs to be.   The parsers (see
+:mod:`rjgtoys.config._parsers`) build frozen data directly, so most of
+the data that is loaded needs no copying at all.
+
+Keys, and optionally short string values, are interned, so that a string
+that appears many times is stored only once.
+
+Frozen data is for the library's own use.   The values that are given to
+a model are first turned back into ordinary containers by :func:`config_thaw`,
+so that code that uses the model (to serialise it, say) sees the same
+types that it always did.
+
+.. autofunction:: config_freeze
+
+.. autofunction:: config_thaw
+
+.. autoclass:: ConfigNode
+
+"""
+
+import collections.abc
+import sys
+import weakref
+
+from rjgtoys.thing import Thing
+
+
+class _Shape:
+    """The keys of a :class:`ConfigNode`, which are shared by all the
+    nodes that have the same keys in the same order."""
+
+    __slots__ = ('keys', 'index', '__weakref__')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = {k: i for (i, k) in enumerate(keys)}
+
+
+# All the shapes that are in use, by their keys
+
+_shapes = weakref.WeakValueDictionary()
+
+
+def _get_shape(keys):
+    """Return the :class:`_Shape` for a tuple of `keys`."""
+
+    shape = _shapes.get(keys)
+    if shape is None:
+        keys = tuple(sys.intern(k) if k.__class__ is str else k for k in keys)
+        shape = _shapes.setdefault(keys, _Shape(keys))
+    return shape
+
+
+class _Items(collections.abc.ItemsView):
+
+    def __iter__(self):
+        node = self._mapping
+        return zip(node._shape.keys, node._values)
+
+
+class _Values(collections.abc.ValuesView):
+
+    def __iter__(self):
+        return iter(self._mapping._values)
+
+
+class ConfigNode(collections.abc.Mapping):
+    """A compact, read-only mapping.
+
+    Like a :class:`rjgtoys.thing.Thing`, its items can also be read as
+    attributes, and an item whose name contains dots is looked up as a path
+    if there is no item by that name.
+
+    Each node holds just a tuple of values, and a reference to its keys, which
+    are shared with all the other nodes that have the same keys.   That makes
+    a node a fraction of the size of a :class:`dict`, and configuration data
+    tends to contain many mappings with the same keys (lists of records, for
+    example).
+
+    Any attempt to modify one raises :exc:`TypeError`.
+    """
+
+    __slots__ = ('_shape', '_values')
+
+    def __init__(self, data=()):
+        """
+        `data`
+          A mapping, or an iterable of (key, value) pairs.
+        """
+
+        if not isinstance(data, collections.abc.Mapping):
+            data = dict(data)
+
+        object.__setattr__(self, '_shape', _get_shape(tuple(data.keys())))
+        object.__setattr__(self, '_values', tuple(data.values()))
+
+    def __getitem__(self, name):
+        """Get an item, allowing dots to separate path components."""
+
+        try:
+            return self._values[self._shape.index[name]]
+        except KeyError:
+            if name.__class__ is not str or '.' not in name:
+                raise
+
+        (prefix, tail) = name.split('.', 1)
+
+        try:
+            return self[prefix][tail]
+        except (TypeError, KeyError):
+            raise KeyError(name)
+
+    def __getattr__(self, name):
+        """As __getitem__ but raise AttributeError rather than KeyError"""
+
+        # Don't recurse if the slots aren't set yet
+
+        if name in ConfigNode.__slots__:
+            raise AttributeError(name)
+
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, name):
+        return name in self._shape.index
+
+    def __iter__(self):
+        return iter(self._shape.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, name, default=None):
+        try:
+            return self._values[self._shape.index[name]]
+        except KeyError:
+            return default
+
+    def items(self):
+        return _Items(self)
+
+    def values(self):
+        return _Values(self)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Configuration data is read-only")
+
+    __setitem__ = __delitem__ = _read_only
+    __setattr__ = __delattr__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (_make_node, (self._shape.keys, self._values))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _make_node(keys, values):
+    """Make a :class:`ConfigNode` (used when unpickling)."""
+
+    node = ConfigNode.__new__(ConfigNode)
+    object.__setattr__(node, '_shape', _get_shape(keys))
+    object.__setattr__(node, '_values', values)
+    return node
+
+
+def config_freeze(data, memo=None, intern=None):
+    """Return a read-only copy of configuration `data`.
+
+    `memo`, if not `None`, is a :class:`dict` that is used to remember
+    the copies made of each object, so that several calls can share
+    them.
+
+    `intern`, if not `None`, is a length: string values no longer than
+    that are replaced by the equivalent interned string (see :func:`sys.intern`),
+    so that all the copies of a string that's repeated many times (a host
+    name, say, or some enumerated value) become one.   Keys are always
+    interned.   Interning values means that data that is already frozen
+    has to be copied again.
+
+    A structure that contains itself (which YAML aliases can produce)
+    can't be copied; the inner reference is left pointing at the original.
+    """
+
+    if memo is None:
+        memo = {}
+
+    # A limit that no string can meet means 'intern nothing'
+
+    limit = -1 if intern is None else intern
+
+    # Frozen containers need copying only to intern their values
+
+    atoms = _ATOMS if limit < 0 else _INTERN_ATOMS
+
+    frozen = _frozen(data, memo, atoms)
+    if frozen is not _UNFROZEN:
+        return frozen
+
+    # Copy the containers depth first using an explicit stack,
+    # because the data may be deeply nested.   Each entry holds an
+    # original container, the content of its copy, an iterator over
+    # the original's (key, value) pairs, and the key of the value that
+    # is being copied further up the stack.   Each copy is made when its
+    # content is complete.
+
+    active = {id(data)}
+    stack = [_freeze_start(data)]
+
+    while True:
+        entry = stack[-1]
+        (original, content, items, _) = entry
+        for (key, value) in items:
+            if value.__class__ in atoms:
+                if value.__class__ is str and len(value) <= limit:
+                    value = sys.intern(value)
+                content[key] = value
+                continue
+            frozen = _frozen(value, memo, atoms)
+            if frozen is _UNFROZEN:
+                frozen = _freeze_leaf(value, memo, limit, atoms)
+            if frozen is _UNFROZEN:
+                if id(value) in active:
+                    frozen = value
+                else:
+                    entry[3] = key
+                    active.add(id(value))
+                    stack.append(_freeze_start(value))
+                    break
+            content[key] = frozen
+        else:
+            stack.pop()
+            active.discard(id(original))
+
+            if isinstance(content, dict):
+                frozen = ConfigNode(content)
+            else:
+                frozen = tuple(content)
+
+            # Keep the original, so that its id isn't reused
+
+            memo[id(original)] = (original, frozen)
+
+            if not stack:
+                return frozen
+
+            parent = stack[-1]
+            parent[1][parent[3]] = frozen
+
+
+# Types of value that never need copying
+
+_ATOMS = frozenset((str, int, float, bool, type(None), bytes, ConfigNode, tuple))
+
+# ... and those that never need copying when values are being interned
+
+_INTERN_ATOMS = _ATOMS.difference((ConfigNode, tuple))
+
+# Means 'this needs to be copied'
+
+_UNFROZEN = object()
+
+
+def _frozen(value, memo, atoms=_ATOMS):
+    """Return the frozen form of `value` if there is no copying to do, or `_UNFROZEN`.
+
+    `atoms` is the set of types that need no copying.
+    """
+
+    if value.__class__ in atoms:
+        return value
+
+    if not isinstance(value, (collections.abc.Mapping, list)) and value.__class__ is not tuple:
+        return value
+
+    try:
+        return memo[id(value)][1]
+    except KeyError:
+        return _UNFROZEN
+
+
+def _freeze_leaf(value, memo, limit, atoms=_ATOMS):
+    """Return a frozen copy of `value` if it contains no containers, or `_UNFROZEN`.
+
+    Strings no longer than `limit` are interned, and `atoms` is as for :func:`_frozen`.
+
+    This is just a quicker way to deal with the most common case.
+    """
+
+    if isinstance(value, collections.abc.Mapping):
+        for v in value.values():
+            if v.__class__ not in atoms:
+                return _UNFROZEN
+        if limit >= 0:
+            frozen = ConfigNode((k, _intern(v, limit)) for (k, v) in value.items())
+        else:
+            frozen = ConfigNode(value)
+    else:
+        for v in value:
+            if v.__class__ not in atoms:
+                return _UNFROZEN
+        if limit >= 0:
+            frozen = tuple(_intern(v, limit) for v in value)
+        else:
+            frozen = tuple(value)
+
+    memo[id(value)] = (value, frozen)
+    return frozen
+
+
+def _intern(value, limit):
+    """Return the interned equivalent of `value` if it's a string no longer than `limit`."""
+
+    if value.__class__ is str and len(value) <= limit:
+        return sys.intern(value)
+    return value
+
+
+def _freeze_start(value):
+    """Return a stack entry for copying `value`."""
+
+    # A list's copy is filled in by index, like a dict's
+
+    if isinstance(value, collections.abc.Mapping):
+        return [value, {}, iter(value.items()), None]
+    return [value, [None] * len(value), enumerate(value), None]
+
+
+def config_thaw(data):
+    """Return a modifiable copy of frozen configuration `data`, in which
+    each mapping is a :class:`rjgtoys.thing.Thing` and each tuple
+    is a :class:`list`.
+
+    Data that is shared within `data` is copied only once, and
+    stays shared in the copy.
+    """
+
+    if not _thawable(data):
+        return data
+
+    # Each copy is made empty, and filled in when it's taken from the stack,
+    # so the order doesn't matter, and deep nesting is no problem
+
+    result = _thaw_start(data)
+    memo = {id(data): result}
+    stack = [(data, result)]
+
+    while stack:
+        (original, copy) = stack.pop()
+        items = original.items() if isinstance(original, collections.abc.Mapping) else enumerate(original)
+        for (key, value) in items:
+            if _thawable(value):
+                thawed = memo.get(id(value))
+                if thawed is None:
+                    thawed = memo[id(value)] = _thaw_start(value)
+                    stack.append((value, thawed))
+                value = thawed
+            copy[key] = value
+
+    return result
+
+
+def _thawable(value):
+    """Is `value` a container that :func:`config_thaw` should copy?"""
+
+    return value.__class__ is tuple or isinstance(value, (collections.abc.Mapping, list))
+
+
+def _thaw_start(value):
+    """Return an empty copy of container `value`, ready to be filled in."""
+
+    if isinstance(value, collections.abc.Mapping):
+        return Thing()
+    return [None] * len(value)
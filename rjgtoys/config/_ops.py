@@ -3,74 +3,321 @@ Operations on config data
 
 """
 
+import collections
 import collections.abc
+import hashlib
+import pickle
+import threading
 
 from rjgtoys.thing import Thing
 
-from copy import deepcopy
+from rjgtoys.config._node import ConfigNode, config_freeze
 
 
-def config_normalise(raw):
+def config_normalise(raw, intern=None):
     """Normalise a config object to make it easier to process later.
 
     Ensure it has both 'defaults' and '__view__' entries, that
     'defaults' is a single map, and '__view__' represents a merge
     of any 'local' '__view__' with that of the 'defaults'.
-    """
 
-    result = Thing(raw)
+    Nothing in `raw` is modified.  The result is read-only (see
+    :func:`rjgtoys.config._node.config_freeze`), so that it can be
+    shared safely.   Merged mappings share whatever they can with their
+    inputs (see :func:`config_overlay`), and data that YAML aliases refer
+    to from many places is copied only once, so the normalised tree is
+    not much bigger than `raw` itself.
+
+    Normalised layers of defaults are remembered (see :class:`_NormalisedLayers`)
+    so that a layer that has been seen before, perhaps in another file or
+    in an earlier load, is not normalised again.   Each layer is identified
+    by a digest of its own content and the digests of its defaults, so
+    each is hashed just once, however deeply it's nested (see :func:`_layer_keys`).
+
+    Defaults may be nested to any depth: they're dealt with using an
+    explicit stack of :class:`_NormaliseFrame`, not by recursion.
+
+    `intern`, if not `None`, is the length of the longest string value that
+    is interned (see :func:`rjgtoys.config._node.config_freeze`); data
+    that repeats the same short strings many times then holds just one copy of each.
+    """
 
-    defaults = normalise_defaults(raw)
+    # Remembers the frozen copies of everything, so that data that
+    # is shared in `raw` is shared (and so recognisably the same)
+    # in the result
 
-    result.defaults = defaults
+    memo = {}
 
-    view = deepcopy(defaults.get('__view__', {}))
-    local_view = raw.get('__view__')
+    keys = _layer_keys(raw, intern)
 
-    if local_view:
-        config_merge(local_view, view)
+    stack = [_NormaliseFrame(raw, keys, intern)]
 
-    result.__view__ = view
+    while True:
+        frame = stack[-1]
+        if frame.pending():
+            stack.append(_NormaliseFrame(frame.layers[frame.pos], keys, intern))
+            continue
 
-    return result
+        stack.pop()
+        result = frame.finish(memo)
+        if not stack:
+            return result
+        stack[-1].add_layer(result)
 
 
 def normalise_defaults(raw):
+    """Return the normalised and merged 'defaults' of `raw`."""
+
+    return config_normalise(raw).defaults
+
+
+class _NormaliseFrame:
+    """The state of the normalisation of one layer of configuration data."""
+
+    __slots__ = ('raw', 'intern', 'layers', 'keys', 'key', 'pos', 'defaults')
+
+    def __init__(self, raw, keys, intern=None):
+        """
+        `raw`
+          The layer to be normalised.
+        `keys`
+          The keys of all the layers, as returned by :func:`_layer_keys`.
+        `intern`
+          As for :func:`config_normalise`.
+        """
+
+        self.raw = raw
+        self.intern = intern
+        self.pos = 0
+        self.key = None
+
+        layers = _defaults_layers(raw)
+        if layers is None:
+            self.layers = self.keys = ()
+            self.defaults = {}
+            return
+
+        self.layers = layers
+        self.defaults = Thing()
+
+        keys = [keys.get(id(layer)) for layer in layers]
+
+        # If any layer can't be hashed, don't try to remember anything
+
+        if not keys or None in keys:
+            self.keys = [None] * len(layers)
+            return
+
+        self.keys = keys
+
+        # The merge of all of them may be known already
+
+        key = b''.join(keys)
+
+        defaults = _normalised_layers.get(key)
+        if defaults is None:
+            self.key = key
+        else:
+            self.layers = self.keys = ()
+            self.defaults = defaults
+
+    def pending(self):
+        """Merge any layers that have already been normalised, and
+        return `True` if the next one needs to be normalised."""
+
+        while self.pos < len(self.layers):
+            key = self.keys[self.pos]
+            if key is None:
+                return True
+            normalised = _normalised_layers.get(key)
+            if normalised is None:
+                return True
+            self.defaults = config_overlay(normalised, self.defaults)
+            self.pos += 1
+
+        return False
+
+    def add_layer(self, normalised):
+        """Merge the next layer, which has just been normalised."""
+
+        key = self.keys[self.pos]
+        if key is not None:
+            _normalised_layers.put(key, normalised)
+
+        self.defaults = config_overlay(normalised, self.defaults)
+        self.pos += 1
+
+    def finish(self, memo):
+        """Return the normalised data, now that all its defaults have been merged.
+
+        `memo` is passed to :func:`config_freeze`.
+        """
+
+        raw = self.raw
+        intern = self.intern
+        defaults = config_freeze(self.defaults, memo, intern)
+
+        if self.key is not None:
+            _normalised_layers.put(self.key, defaults)
+
+        result = Thing(raw)
+
+        result.defaults = defaults
+
+        view = defaults.get('__view__', {})
+        local_view = config_freeze(raw.get('__view__'), memo, intern)
+
+        if local_view:
+            view = config_overlay(local_view, view)
+
+        result.__view__ = view
+
+        return config_freeze(result, memo, intern)
+
+
+class _NormalisedLayers:
+    """A bounded LRU cache of normalised defaults, keyed by a hash of their content.
+
+    The normalised data is shared by everything that uses it, and
+    so it's read-only.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, layer, layer_keys=(), intern=None):
+        """Return a digest of the content of `layer`, or `None` if
+        that can't be done or the cache is disabled.
+
+        `layer_keys` are the keys of the defaults of `layer`, which stand
+        in for their content, so that nested defaults aren't hashed again
+        for each level.
+
+        `intern` is the option passed to :func:`config_normalise`; a layer
+        that was normalised without interning isn't reused by a call that asks for it.
+        """
+
+        if self.size <= 0 or None in layer_keys:
+            return None
+
+        if layer_keys:
+            layer = {k: v for (k, v) in layer.items() if k != 'defaults'}
+
+        try:
+            content = pickle.dumps((intern, layer, tuple(layer_keys)), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Something unusual in there; don't remember it
+            return None
+
+        return hashlib.blake2b(content, digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if self.size <= 0:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def resize(self, size):
+        with self._lock:
+            self.size = size
+            while len(self._entries) > max(size, 0):
+                self._entries.popitem(last=False)
+
+
+_normalised_layers = _NormalisedLayers(128)
+
+
+def _defaults_layers(raw):
+    """Return the sequence of the defaults layers of `raw`, or `None`
+    if it has no defaults."""
 
     try:
-        defaults = raw.defaults
+        layers = raw.defaults
     except AttributeError:
-        return {}
+        return None
 
     # If only a single set of defaults, work around it
 
-    if isinstance(defaults, collections.abc.Mapping):
-        return config_normalise(defaults)
+    if isinstance(layers, collections.abc.Mapping):
+        layers = (layers,)
 
-    result = {}
-    for layer in defaults:
-        layer = config_normalise(layer)
-        config_merge(layer, result)
+    return layers
 
-    return result
 
+def _layer_keys(raw, intern=None):
+    """Return a :class:`dict` that maps the id of each defaults layer
+    within `raw`, at any depth, to its key (see :meth:`_NormalisedLayers.key`).
 
-def config_resolve(raw):
-    """Resolve 'defaults' in some raw config data."""
+    The layers are visited bottom-up, using an explicit stack, so that
+    the key of each layer can be made from its own content and the keys of its
+    defaults.   A layer that appears more than once is hashed only once.
+    """
 
-    # If there are no defaults to apply, just return the raw data
+    keys = {}
 
-    defaults = resolve_defaults(raw)
-    if not defaults:
-        return raw
+    if _normalised_layers.size <= 0:
+        return keys
 
-    del raw['defaults']
+    stack = [(raw, _defaults_layers(raw) or (), 0)]
 
-    # override defaults with raw data, return result
+    while True:
+        (layer, layers, pos) = stack[-1]
 
-    config_merge(raw, defaults)
+        while pos < len(layers) and id(layers[pos]) in keys:
+            pos += 1
 
-    return defaults
+        if pos < len(layers):
+            stack[-1] = (layer, layers, pos + 1)
+            child = layers[pos]
+            stack.append((child, _defaults_layers(child) or (), 0))
+            continue
+
+        stack.pop()
+        if not stack:
+            return keys
+
+        keys[id(layer)] = _normalised_layers.key(
+            layer,
+            [keys[id(child)] for child in layers],
+            intern
+        )
+
+
+def set_normalise_cache_size(size):
+    """Set the number of normalised defaults layers that are remembered.
+
+    Zero disables the cache.
+    """
+
+    _normalised_layers.resize(size)
+
+
+def config_resolve(raw):
+    """Resolve 'defaults' in some raw config data.
+
+    Nothing in `raw` is modified; the result is read-only (see
+    :func:`rjgtoys.config._node.config_freeze`).
+    """
+
+    return config_freeze(_resolve(raw, _resolve_finish))
 
 
 def resolve_defaults(raw):
@@ -78,48 +325,160 @@ def resolve_defaults(raw):
 
     # If there are no defaults to apply, just return an empty dict
 
-#    print("resolve_defaults %s" % (raw))
+    return config_freeze(_resolve(raw, lambda raw, defaults: defaults))
+
+
+def _resolve(raw, finish):
+    """Resolve the defaults of `raw`, and of all the layers within them,
+    and return `finish(raw, defaults)`.
+
+    Nested defaults are dealt with using an explicit stack rather than by
+    recursion; each entry holds a layer, an iterator over its defaults,
+    and the merge of those that have been resolved so far.
+    """
+
+    stack = [[raw, _resolve_layers(raw), Thing()]]
+
+    while True:
+        (raw, layers, result) = stack[-1]
+
+        layer = next(layers, _NO_LAYER)
+        if layer is not _NO_LAYER:
+            stack.append([layer, _resolve_layers(layer), Thing()])
+            continue
+
+        stack.pop()
+        if not stack:
+            return finish(raw, result)
+
+        parent = stack[-1]
+        parent[2] = config_overlay(_resolve_finish(raw, result), parent[2])
+
+
+# Marks the end of a list of layers
+
+_NO_LAYER = object()
+
+
+def _resolve_layers(raw):
+    """Return an iterator over the 'defaults' layers of `raw`."""
 
     try:
         defaults = raw.defaults
     except AttributeError:
-        return {}
+        return iter(())
 
     # If only a single set of defaults, work around it
 
     if isinstance(defaults, collections.abc.Mapping):
         defaults = (defaults,)
 
-    result = {}
-    for layer in defaults:
-        layer = config_resolve(layer)
-        config_merge(layer, result)
+    return iter(defaults)
+
+
+def _resolve_finish(raw, defaults):
+    """Return `raw` with its resolved `defaults` applied."""
+
+    # If there are no defaults to apply, just return the raw data
+
+    if not defaults:
+        return raw
+
+    # override defaults with raw data, return result
+
+    return config_overlay(
+        Thing((k, v) for (k, v) in raw.items() if k != 'defaults'),
+        defaults
+    )
 
-    return result
 
 def config_merge(part, result):
     """Merge a set of defaults 'part' into 'result'."""
 
-    for (key, value) in part.items():
-        # If value is a mapping, any
-        # existing value in result had better
-        # be a mapping too.
-        # Merge the mappings.
-        # Otherwise, just override
-        if not isinstance(value, collections.abc.Mapping):
-            result[key] = value
-            continue
+    # The mappings are visited depth first, just as if this
+    # were recursive, but using an explicit stack of
+    # (iterator over part, result) pairs.
 
-        # See if there's an existing value
+    stack = [(iter(part.items()), result)]
 
-        try:
-            prev = result[key]
-        except KeyError:
-            # No, just override
-            result[key] = value
-            continue
+    while stack:
+        (items, result) = stack[-1]
+        for (key, value) in items:
+            # If value is a mapping, any
+            # existing value in result had better
+            # be a mapping too.
+            # Merge the mappings.
+            # Otherwise, just override
+            if not isinstance(value, collections.abc.Mapping):
+                result[key] = value
+                continue
+
+            # See if there's an existing value
+
+            try:
+                prev = result[key]
+            except KeyError:
+                # No, just override
+                result[key] = value
+                continue
+
+            # Merge prev and new, then carry on here
+
+            stack.append((iter(value.items()), prev))
+            break
+        else:
+            stack.pop()
+
+
+def config_overlay(part, base):
+    """Return the result of merging `part` into `base`, without modifying either.
+
+    The result is as if :func:`config_merge` had been applied to a copy
+    of `base`, except that a mapping in `part` replaces rather than
+    merges with a non-mapping in `base`.   Only the mappings on the
+    paths to values in `part` are copied; the rest are shared with `base`.
+    """
+
+    result = _overlay_trivial(part, base)
+    if result is not None:
+        return result
+
+    result = Thing(base)
+
+    # As for config_merge, an explicit stack of (iterator over part, result)
+
+    stack = [(iter(part.items()), result)]
+
+    while stack:
+        (items, target) = stack[-1]
+        for (key, value) in items:
+            if isinstance(value, collections.abc.Mapping):
+                prev = target.get(key)
+                if isinstance(prev, collections.abc.Mapping):
+                    merged = _overlay_trivial(value, prev)
+                    if merged is None:
+                        merged = Thing(prev)
+                        target[key] = merged
+                        stack.append((iter(value.items()), merged))
+                        break
+                    value = merged
+            target[key] = value
+        else:
+            stack.pop()
+
+    return result
+
+
+def _overlay_trivial(part, base):
+    """Return the result of merging mapping `part` into mapping `base`
+    if that needs no work, otherwise `None`."""
+
+    # Merging a mapping with itself, or with nothing, changes nothing
 
-        # Merge prev and new
+    if part is base or not part:
+        return base if isinstance(base, (Thing, ConfigNode)) else Thing(base)
 
-        config_merge(value, prev)
+    if not base:
+        return part if isinstance(part, (Thing, ConfigNode)) else Thing(part)
 
+    return None
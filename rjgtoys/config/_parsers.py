@@ -0,0 +1,691 @@
+"""
+
+Configuration file formats
+--------------------------
+
+Configuration files are read by a parser chosen according to the
+format of the file.   The format is identified by the file extension
+or, for an extension that isn't recognised (such as ``.conf``),
+by 'sniffing' the start of the file.   Sniffing is only a guess, and
+YAML can look like JSON or TOML, so if a file whose format was guessed
+can't be read in that format it is read as YAML instead.
+
+The following formats are known:
+
+`yaml`
+  Read by the libyaml C parser if PyYAML was built with it, and otherwise by
+  :func:`rjgtoys.yaml.yaml_load_path`.   Both follow the YAML 1.2 rules
+  for plain scalars (so ``yes`` is a string, and ``012`` is twelve),
+  and both support the ``!include`` tag.  This is the default format.
+
+  Data that comes from elsewhere (see :func:`config_loads`) is read by
+  a safe loader that supports only the standard tags, and not ``!include``.
+`json`
+  Read by the standard library :mod:`json` module.
+`toml`
+  Read by :mod:`tomllib` (or the `tomli` package on Python
+  versions before 3.11), if available.
+
+Whichever parser is used, the data is returned read-only, as it would
+be made by :func:`rjgtoys.config._node.config_freeze`: mappings are
+instances of :class:`rjgtoys.config._node.ConfigNode` and lists are tuples.
+The YAML and JSON parsers build those directly, so the data never
+needs to be copied to make it safe to share.
+
+.. autofunction:: config_load_path
+
+.. autofunction:: config_loads
+
+.. autofunction:: config_load_path_subset
+
+.. autofunction:: register_format
+
+.. autofunction:: find_format
+
+.. autofunction:: record_reads
+
+"""
+
+import collections
+import collections.abc
+import contextlib
+import datetime
+import json
+import os
+import re
+import stat
+import threading
+
+from rjgtoys.thing import Thing
+from rjgtoys.yaml import YamlCantLoad, IncludeLoader
+
+from rjgtoys.config._node import ConfigNode, config_freeze
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import yaml as pyyaml
+except ImportError:
+    pyyaml = None
+
+import ruamel.yaml
+
+
+_Format = collections.namedtuple(
+    '_Format',
+    'name parse extensions sniff loads media_types subset safe_loads'
+)
+
+# Known formats, most recently registered first
+
+_formats = []
+
+# How much of a file to look at when sniffing
+
+SNIFF_SIZE = 512
+
+DEFAULT_FORMAT = 'yaml'
+
+
+def register_format(
+    name, parse,
+    extensions=(), sniff=None, loads=None, media_types=(), subset=None,
+    safe_loads=None
+):
+    """Register a parser for a configuration file format.
+
+    `name`
+      The name of the format.  Registering a name again replaces
+      the earlier registration.
+    `parse`
+      A callable that is passed a path and returns the data
+      in the file.
+    `extensions`
+      File name extensions (including the dot) that identify the format.
+    `sniff`
+      If not `None`, a callable that is passed the first few bytes
+      of a file with an unrecognised extension, and returns `True`
+      if they look like this format.
+    `loads`
+      If not `None`, a callable that is passed a :class:`bytes` object
+      containing data in this format, and returns the data.
+    `media_types`
+      Media types (as in an HTTP ``Content-Type`` header) that identify
+      the format.
+    `subset`
+      If not `None`, a callable that can read just part of a file;
+      see :func:`config_load_path_subset`.   It is passed the same
+      parameters, and may return `_SUBSET_UNSUPPORTED` if it can't
+      handle a particular file.
+    `safe_loads`
+      If not `None`, a callable like `loads` for data that can't be
+      trusted: it must not read files or construct arbitrary objects.
+      If `None`, `loads` is assumed to be safe.
+    """
+
+    _formats[:] = [f for f in _formats if f.name != name]
+    _formats.insert(
+        0,
+        _Format(
+            name, parse, tuple(extensions), sniff, loads, tuple(media_types), subset,
+            safe_loads
+        )
+    )
+
+
+def _get_format(name):
+
+    for f in _formats:
+        if f.name == name:
+            return f
+    raise KeyError(name)
+
+
+def find_format(path):
+    """Return the name of the format of the file at `path`."""
+
+    return _find_format(path)[0].name
+
+
+def _find_format(path):
+    """Return ``(format, sniffed)`` for the file at `path`, where `sniffed`
+    is `True` if the format was guessed from its content."""
+
+    ext = os.path.splitext(path)[1].lower()
+
+    for f in _formats:
+        if ext in f.extensions:
+            return (f, False)
+
+    try:
+        with open(path, 'rb') as stream:
+            head = stream.read(SNIFF_SIZE)
+    except OSError:
+        return (_get_format(DEFAULT_FORMAT), False)
+
+    return (_get_format(_sniff(head)), True)
+
+
+def _read(f, sniffed, read):
+    """Return `read(f)`, or if the format `f` was only guessed, and the
+    data can't be read that way, `read` of the default format."""
+
+    if not sniffed or f.name == DEFAULT_FORMAT:
+        return read(f)
+
+    try:
+        return read(f)
+    except Exception:
+        # It only looked like that format
+        return read(_get_format(DEFAULT_FORMAT))
+
+
+def _sniff(head):
+    """Return the name of the format that `head` appears to be in."""
+
+    for f in _formats:
+        if f.sniff is not None and f.sniff(head):
+            return f.name
+
+    return DEFAULT_FORMAT
+
+
+def config_loads(data, media_type=None, safe=False):
+    """Parse configuration data from :class:`bytes`.
+
+    The format is identified by `media_type` if possible, and otherwise
+    by sniffing the data.
+
+    If `safe` is true, the data is treated as untrusted (it came from
+    the network, say): it can't include files, or construct
+    anything other than plain data.
+    """
+
+    def loads(f):
+        return (f.safe_loads or f.loads) if safe else f.loads
+
+    if media_type:
+        media_type = media_type.split(';', 1)[0].strip().lower()
+        for f in _formats:
+            if media_type in f.media_types and f.loads is not None:
+                return loads(f)(data)
+
+    f = _get_format(_sniff(data[:SNIFF_SIZE]))
+    if f.loads is None:
+        raise ValueError("Format %s can't be parsed from a string" % (f.name,))
+    return _read(f, True, lambda f: loads(f)(data))
+
+
+# The lists of paths that are being recorded by record_reads, in each thread
+
+_recording = threading.local()
+
+
+@contextlib.contextmanager
+def record_reads():
+    """A context manager that records the paths read by :func:`config_load_path`.
+
+    It yields a list, to which the path of each file or directory that is read in
+    this thread, including those read because of an ``!include`` tag, is appended.
+    """
+
+    stack = _recording.__dict__.setdefault('stack', [])
+    paths = []
+    stack.append(paths)
+    try:
+        yield paths
+    finally:
+        stack.pop()
+
+
+def config_load_path(path):
+    """Load configuration data from a path, using the best parser for its format.
+
+    As for :func:`rjgtoys.yaml.yaml_load_path`, if `path` is a directory,
+    all the files in it are read and a list of their contents is returned.
+    """
+
+    for paths in getattr(_recording, 'stack', ()):
+        paths.append(path)
+
+    s = os.stat(path)
+
+    if stat.S_ISDIR(s.st_mode):
+        return list(config_load_path(os.path.join(path, part)) for part in os.listdir(path))
+
+    if not stat.S_ISREG(s.st_mode):
+        raise YamlCantLoad(path=path)
+
+    (f, sniffed) = _find_format(path)
+
+    return _read(f, sniffed, lambda f: f.parse(path))
+
+
+# Top-level keys that are always needed, because they
+# determine which other keys are needed
+
+SUBSET_ALWAYS = ('defaults', '__view__')
+
+# Returned by a subset parser that can't handle a file
+
+_SUBSET_UNSUPPORTED = object()
+
+
+def _subset_filter(data, wanted):
+    """Reduce fully parsed `data` to the subset that `wanted` asks for."""
+
+    if not isinstance(data, collections.abc.Mapping):
+        return data
+
+    partial = Thing((k, data[k]) for k in SUBSET_ALWAYS if k in data)
+    keys = set(wanted(partial))
+
+    return Thing((k, v) for (k, v) in data.items() if k in keys or k in SUBSET_ALWAYS)
+
+
+def config_load_path_subset(path, wanted):
+    """Load part of the configuration data in a file.
+
+    Only top-level entries whose keys are needed are built;
+    ``defaults`` and ``__view__`` are always included, because they
+    determine what is needed.
+
+    `wanted` is called with a mapping containing just those entries (if present)
+    and returns the collection of other top-level keys that are needed.
+
+    For YAML files, when libyaml is available, the file is parsed as a
+    stream of events, and no objects are built for the entries that are not
+    needed.  That needs two passes over the file, one to find ``defaults``
+    and ``__view__`` and one to build the wanted entries.
+    A file that can't be handled that way, for example because a wanted
+    entry refers to an anchor in an unwanted one, is parsed in full.
+
+    Other formats are parsed in full and then reduced to the subset, which
+    saves memory, but not time.
+    """
+
+    s = os.stat(path)
+
+    if not stat.S_ISREG(s.st_mode):
+        return config_load_path(path)
+
+    def read(f):
+        if f.subset is not None:
+            data = f.subset(path, wanted)
+            if data is not _SUBSET_UNSUPPORTED:
+                return data
+
+        return _subset_filter(f.parse(path), wanted)
+
+    (f, sniffed) = _find_format(path)
+
+    return _read(f, sniffed, read)
+
+
+#
+# YAML
+#
+
+if pyyaml is not None and pyyaml.__with_libyaml__:
+
+    class _LibYamlLoader(pyyaml.CSafeLoader):
+        """A libyaml-based loader that produces the same results as
+        :class:`rjgtoys.yaml.IncludeLoader`: YAML 1.2 plain scalars,
+        and support for ``!include``, except that mappings are
+        :class:`ConfigNode` and sequences are tuples.
+        """
+
+        # Start from an empty set of resolvers rather than PyYAML's YAML 1.1 rules
+
+        yaml_implicit_resolvers = {}
+
+        root = os.path.curdir
+
+    def _construct_node(loader, node):
+        loader.flatten_mapping(node)
+        return ConfigNode(loader.construct_pairs(node))
+
+    def _construct_tuple(loader, node):
+        return tuple(loader.construct_sequence(node))
+
+    def _construct_int(loader, node):
+        """Construct an int following YAML 1.2, where a leading zero doesn't mean octal."""
+
+        value = loader.construct_scalar(node).replace('_', '')
+        sign = 1
+        if value[0] in '+-':
+            if value[0] == '-':
+                sign = -1
+            value = value[1:]
+        base = 10
+        if value[:2] in ('0b', '0o', '0x'):
+            base = dict(b=2, o=8, x=16)[value[1]]
+            value = value[2:]
+        return sign * int(value, base)
+
+    def _construct_timestamp(loader, node):
+        """Construct a timestamp; like ruamel.yaml, represent time zones by converting to UTC."""
+
+        value = pyyaml.constructor.SafeConstructor.construct_yaml_timestamp(loader, node)
+        if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value
+
+    def _construct_include(loader, node):
+        return config_load_path(os.path.join(loader.root, loader.construct_scalar(node)))
+
+    _LibYamlLoader.add_constructor('tag:yaml.org,2002:map', _construct_node)
+    _LibYamlLoader.add_constructor('tag:yaml.org,2002:seq', _construct_tuple)
+    _LibYamlLoader.add_constructor('tag:yaml.org,2002:int', _construct_int)
+    _LibYamlLoader.add_constructor('tag:yaml.org,2002:timestamp', _construct_timestamp)
+    _LibYamlLoader.add_constructor('!include', _construct_include)
+
+    for (tag, regexp, first) in (
+        (
+            'bool',
+            r'^(?:true|True|TRUE|false|False|FALSE)$',
+            'tTfF'
+        ),
+        (
+            'float',
+            r'''^(?:
+                [-+]?(?:[0-9][0-9_]*)\.[0-9_]*(?:[eE][-+]?[0-9]+)?
+                |[-+]?(?:[0-9][0-9_]*)(?:[eE][-+]?[0-9]+)
+                |[-+]?\.[0-9_]+(?:[eE][-+][0-9]+)?
+                |[-+]?\.(?:inf|Inf|INF)
+                |\.(?:nan|NaN|NAN))$''',
+            '-+0123456789.'
+        ),
+        (
+            'int',
+            r'''^(?:[-+]?0b[0-1_]+
+                |[-+]?0o?[0-7_]+
+                |[-+]?[0-9_]+
+                |[-+]?0x[0-9a-fA-F_]+)$''',
+            '-+0123456789'
+        ),
+        (
+            'merge',
+            r'^(?:<<)$',
+            '<'
+        ),
+        (
+            'null',
+            r'^(?:~|null|Null|NULL|)$',
+            ['~', 'n', 'N', '']
+        ),
+        (
+            'timestamp',
+            r'''^(?:[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]
+                |[0-9][0-9][0-9][0-9]-[0-9][0-9]?-[0-9][0-9]?
+                (?:[Tt]|[ \t]+)[0-9][0-9]?
+                :[0-9][0-9]:[0-9][0-9](?:\.[0-9]*)?
+                (?:[ \t]*(?:Z|[-+][0-9][0-9]?(?::[0-9][0-9])?))?)$''',
+            '0123456789'
+        ),
+    ):
+        _LibYamlLoader.add_implicit_resolver(
+            'tag:yaml.org,2002:' + tag,
+            re.compile(regexp, re.X),
+            list(first)
+        )
+
+    def _yaml_load(stream, root):
+        """Load YAML from a file or string using libyaml."""
+
+        loader = _LibYamlLoader(stream)
+        loader.root = root
+        try:
+            return loader.get_single_data()
+        finally:
+            loader.dispose()
+
+    def _yaml_load_path(path):
+
+        with open(path, 'rb') as stream:
+            return _yaml_load(stream, os.path.dirname(path))
+
+    def _yaml_loads(data):
+
+        return _yaml_load(data, os.path.curdir)
+
+    class _SafeLibYamlLoader(_LibYamlLoader):
+        """As :class:`_LibYamlLoader`, but without ``!include``."""
+
+    def _refuse_include(loader, node):
+        raise pyyaml.constructor.ConstructorError(
+            None, None, "!include is not allowed here", node.start_mark
+        )
+
+    _SafeLibYamlLoader.add_constructor('!include', _refuse_include)
+
+    def _yaml_safe_loads(data):
+
+        loader = _SafeLibYamlLoader(data)
+        try:
+            return loader.get_single_data()
+        finally:
+            loader.dispose()
+
+    class _SubsetLoader(_LibYamlLoader, pyyaml.composer.Composer):
+        """A libyaml-based loader that can build nodes one at a time.
+
+        The C parser doesn't provide a way to compose a single node
+        from the middle of a document, so that is done by the Python
+        composer, reading the events produced by the C parser.
+        """
+
+        def __init__(self, stream):
+            super().__init__(stream)
+            pyyaml.composer.Composer.__init__(self)
+
+    class _Unsuitable(Exception):
+        """Raised when a YAML file can't be read as a subset."""
+
+    def _skip_node(loader):
+        """Consume the events for a node without building anything."""
+
+        event = loader.get_event()
+        if not isinstance(event, (pyyaml.MappingStartEvent, pyyaml.SequenceStartEvent)):
+            return
+
+        depth = 1
+        while depth:
+            event = loader.get_event()
+            if isinstance(event, (pyyaml.MappingStartEvent, pyyaml.SequenceStartEvent)):
+                depth += 1
+            elif isinstance(event, (pyyaml.MappingEndEvent, pyyaml.SequenceEndEvent)):
+                depth -= 1
+
+    def _yaml_scan(path, want):
+        """Build a :class:`Thing` of the top-level entries for which `want(key)` is true.
+
+        Returns `None` for an empty file.
+        """
+
+        with open(path, 'rb') as stream:
+            loader = _SubsetLoader(stream)
+            loader.root = os.path.dirname(path)
+            try:
+                loader.get_event()      # StreamStart
+                if loader.check_event(pyyaml.StreamEndEvent):
+                    return None
+                loader.get_event()      # DocumentStart
+
+                if not loader.check_event(pyyaml.MappingStartEvent):
+                    raise _Unsuitable()
+
+                event = loader.get_event()
+                if event.anchor is not None or not event.implicit:
+                    raise _Unsuitable()
+
+                result = Thing()
+                while not loader.check_event(pyyaml.MappingEndEvent):
+                    event = loader.peek_event()
+                    if isinstance(event, pyyaml.ScalarEvent) and event.anchor is None:
+                        if event.value == '<<' and event.implicit[0]:
+                            # A merge could supply anything
+                            raise _Unsuitable()
+                        if not want(event.value):
+                            loader.get_event()
+                            _skip_node(loader)
+                            continue
+
+                    key_node = loader.compose_node(None, None)
+                    value_node = loader.compose_node(key_node, None)
+                    result[loader.construct_document(key_node)] = loader.construct_document(value_node)
+
+                return result
+            except pyyaml.composer.ComposerError:
+                # Probably an alias to an anchor that was skipped
+                raise _Unsuitable()
+            finally:
+                loader.dispose()
+
+    def _yaml_load_subset(path, wanted):
+
+        try:
+            partial = _yaml_scan(path, SUBSET_ALWAYS.__contains__)
+            if partial is None:
+                return None
+
+            keys = set(wanted(partial)).difference(SUBSET_ALWAYS)
+
+            result = _yaml_scan(path, keys.__contains__)
+        except _Unsuitable:
+            return _SUBSET_UNSUPPORTED
+
+        result.update(partial)
+        return result
+
+else:
+    class _IncludeLoader(IncludeLoader):
+        """As :class:`rjgtoys.yaml.IncludeLoader`, but reading included
+        files with :func:`config_load_path`, and making :class:`ConfigNode`
+        for mappings and tuples for sequences, as the libyaml loader does."""
+
+        DEFAULT_MAPPING_TYPE = ConfigNode
+
+        def _include(self, loader, node):
+            return config_load_path(os.path.join(self.root, loader.construct_scalar(node)))
+
+    def _construct_tuple(loader, node):
+        return tuple(loader.construct_sequence(node))
+
+    _IncludeLoader.add_constructor('tag:yaml.org,2002:seq', _construct_tuple)
+
+    def _yaml_load_path(path):
+
+        with open(path) as stream:
+            return ruamel.yaml.load(stream, _IncludeLoader)
+
+    def _yaml_loads(data):
+
+        return ruamel.yaml.load(data.decode('utf-8'), _IncludeLoader)
+
+    def _yaml_safe_loads(data):
+
+        # The rjgtoys.yaml loader can construct arbitrary objects
+
+        return config_freeze(ruamel.yaml.YAML(typ='safe', pure=True).load(data.decode('utf-8')))
+
+    _yaml_load_subset = None
+
+register_format(
+    'yaml',
+    _yaml_load_path,
+    extensions=('.yaml', '.yml'),
+    loads=_yaml_loads,
+    media_types=('application/yaml', 'application/x-yaml', 'text/yaml', 'text/x-yaml'),
+    subset=_yaml_load_subset,
+    safe_loads=_yaml_safe_loads
+)
+
+
+#
+# JSON
+#
+
+def _json_node(pairs):
+    """Make a :class:`ConfigNode` from the (key, value) pairs of a JSON object.
+
+    The objects within it have been made already, but the arrays are lists.
+    """
+
+    return ConfigNode((k, config_freeze(v) if v.__class__ is list else v) for (k, v) in pairs)
+
+
+def _json_load_path(path):
+
+    with open(path, 'rb') as stream:
+        return config_freeze(json.load(stream, object_pairs_hook=_json_node))
+
+
+def _json_loads(data):
+
+    return config_freeze(json.loads(data, object_pairs_hook=_json_node))
+
+
+def _json_sniff(head):
+
+    return head.lstrip()[:1] == b'{'
+
+
+register_format(
+    'json',
+    _json_load_path,
+    extensions=('.json',),
+    sniff=_json_sniff,
+    loads=_json_loads,
+    media_types=('application/json',)
+)
+
+
+#
+# TOML
+#
+
+if tomllib is not None:
+
+    def _toml_load_path(path):
+
+        with open(path, 'rb') as stream:
+            return config_freeze(tomllib.load(stream))
+
+    def _toml_loads(data):
+
+        return config_freeze(tomllib.loads(data.decode('utf-8')))
+
+    # A TOML file starts with table headers and key = value pairs.
+    # A key = value pair is not YAML, but a table header on its
+    # own is also a YAML flow sequence, so that's not enough
+
+    _TOML_TABLE = re.compile(rb'''^\[\[?\s*[\w."' -]+\s*\]\]?\s*$''')
+    _TOML_KEY_VALUE = re.compile(rb'''^[\w."'-]+\s*=[^=].*$''')
+
+    def _toml_sniff(head):
+
+        for line in head.splitlines():
+            line = line.strip()
+            if not line or line.startswith(b'#'):
+                continue
+            if _TOML_KEY_VALUE.match(line):
+                return True
+            if not _TOML_TABLE.match(line):
+                return False
+        return False
+
+    register_format(
+        'toml',
+        _toml_load_path,
+        extensions=('.toml',),
+        sniff=_toml_sniff,
+        loads=_toml_loads,
+        media_types=('application/toml',)
+    )
@@ -0,0 +1,105 @@
+"""
+
+View plans
+----------
+
+To build its value, a proxy needs to know which field of its model
+comes from which dotted path in each layer of the configuration data.
+That depends only on the model and on the view mapping for it (if any)
+in the ``__view__`` of the layer, and those rarely change between loads,
+so the answer is worked out once and remembered as a :class:`ViewPlan`.
+
+In particular the model's schema, which is expensive to generate,
+is consulted just once for each model.
+
+.. autofunction:: get_view_plan
+
+.. autofunction:: get_model_schema
+
+.. autoclass:: ViewPlan
+
+"""
+
+import functools
+
+
+class ViewPlan:
+    """Describes how to build a view of one layer of configuration data.
+
+    `fields`
+      The names of the fields of the model, as used in its schema.
+    `mapping`
+      A :class:`dict` that maps each field name to the dotted path of its
+      value; a field that isn't mentioned by the view mapping comes from the
+      path that is its own name.
+    `paths`
+      The set of all the paths in `mapping`.
+    `keys`
+      The set of top-level keys that the paths might refer to: a path such
+      as ``a.b.c`` might refer to any of ``a``, ``a.b`` or ``a.b.c``.
+
+    A plan is shared, and must not be modified.
+    """
+
+    __slots__ = ('fields', 'mapping', 'paths', 'keys')
+
+    def __init__(self, fields, view):
+        """
+        `fields`
+          The names of the fields of the model.
+        `view`
+          The view mapping, as an iterable of (field, path) pairs.
+        """
+
+        mapping = dict(view)
+        mapping.update((n, n) for n in fields if n not in mapping)
+
+        self.fields = fields
+        self.mapping = mapping
+        self.paths = frozenset(mapping.values())
+
+        keys = set()
+        for path in self.paths:
+            parts = path.split('.')
+            keys.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        self.keys = frozenset(keys)
+
+
+def get_view_plan(model, viewname, data):
+    """Return the :class:`ViewPlan` for `model` in one layer of normalised `data`.
+
+    `viewname` is the name by which the view mapping for `model` is found
+    in the ``__view__`` of `data`.
+    """
+
+    try:
+        view = tuple(dict(data['__view__'][viewname]).items())
+    except KeyError:
+        view = ()
+
+    try:
+        return _view_plan(model, view)
+    except TypeError:
+        # Something in the view can't be hashed; don't remember it
+        return ViewPlan(_model_fields(model), view)
+
+
+@functools.lru_cache(maxsize=1024)
+def _view_plan(model, view):
+    """Return the :class:`ViewPlan` for `model` and a tuple of view mapping items."""
+
+    return ViewPlan(_model_fields(model), view)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_model_schema(model):
+    """Return the schema of `model`.   The schema is shared, and must not be modified."""
+
+    return model.schema()
+
+
+@functools.lru_cache(maxsize=1024)
+def _model_fields(model):
+    """Return a tuple of the names of the fields of `model`, as used in its schema."""
+
+    return tuple(get_model_schema(model).get('properties', ()))
@@ -11,12 +11,20 @@ document it.
 
 """
 
+import hashlib
+import json
 import os
+import pickle
+import types
+import weakref
 from argparse import Action
-import collections
 
+import pydantic
+
+from rjgtoys.config._index import ConfigIndex
 from rjgtoys.config._manager import ConfigManager
-from rjgtoys.config._ops import config_merge
+from rjgtoys.config._node import config_thaw
+from rjgtoys.config._plan import get_model_schema, get_view_plan
 
 
 class _ConfigAction(Action):
@@ -54,6 +62,90 @@ def getConfig(model,  name=None, manager_type=None):
     return ConfigProxy(model=model, name=name, manager_type=manager_type)
 
 
+def _model_name(model):
+    """Return the default name of a configuration model class."""
+
+    return "%s.%s" % (model.__module__, model.__qualname__)
+
+
+def _view_fingerprint(view):
+    """Return a digest of the content of a view, or `None` if that can't be done."""
+
+    try:
+        content = pickle.dumps(view, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+# Digests of model definitions, by model class (see _model_digest)
+
+_model_digests = weakref.WeakKeyDictionary()
+
+
+def _model_digest(model):
+    """Return a digest of the definition of a model class, or `None` if
+    that can't be done.
+
+    The digest covers the name of the class, its schema (the fields,
+    their types and defaults), the code of its validators and the version
+    of pydantic, so that values validated by one definition of a model
+    aren't trusted by another (see :meth:`ConfigManager.trusted_values`).
+    """
+
+    try:
+        return _model_digests[model]
+    except KeyError:
+        pass
+
+    h = hashlib.blake2b(digest_size=16)
+
+    try:
+        schema = json.dumps(get_model_schema(model), sort_keys=True, default=repr)
+        for part in (pydantic.VERSION, _model_name(model), schema):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        for func in _model_validators(model):
+            h.update(func.__qualname__.encode('utf-8'))
+            _code_digest(h, func.__code__)
+    except Exception:
+        # Perhaps a field has a type that has no schema
+        digest = None
+    else:
+        digest = h.digest()
+
+    _model_digests[model] = digest
+    return digest
+
+
+def _model_validators(model):
+    """Return the functions that validate instances of a model class."""
+
+    funcs = [v.func for (_, vs) in sorted(model.__validators__.items()) for v in vs]
+    funcs.extend(model.__pre_root_validators__)
+    funcs.extend(f for (_, f) in model.__post_root_validators__)
+
+    # Unwrap any decorators that kept the original (e.g. functools.wraps)
+
+    return [getattr(f, '__wrapped__', f) for f in funcs]
+
+
+def _code_digest(h, code):
+    """Add the content of a code object to the hash `h`."""
+
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        h.update(code.co_code)
+        h.update(repr(code.co_names).encode('utf-8'))
+        for c in code.co_consts:
+            if isinstance(c, types.CodeType):
+                stack.append(c)
+            else:
+                h.update(repr(c).encode('utf-8'))
+
+
 class ConfigProxy:
     """This class implements a 'proxy' for the configuration data needed by a client module,
     and is what you get back when you call :func:`getConfig`, although it
@@ -72,10 +164,29 @@ class ConfigProxy:
 
     def __init__(self, model, name=None, manager_type=None):
         self._model = model
-        self._modelname = name or "%s.%s" % (model.__module__, model.__qualname__)
+        self._modelname = name or _model_name(model)
 
         self._value = None
 
+        # The data from which _value was built
+
+        self._data = None
+
+        # A fingerprint of the view from which _value was built,
+        # and how it was built (see _validate)
+
+        self._fingerprint = None
+        self._validation = None
+
+        # If not None, the arguments for a deferred call of update (see _mark_stale)
+
+        self._pending = None
+
+        # The names of the values of _value that are bound into
+        # this object's __dict__ (see _bind)
+
+        self._bound = ()
+
         self._manager = manager_type or self.manager_type
 
         self._manager.attach(self)
@@ -87,133 +198,206 @@ class ConfigProxy:
 
     __repr__ = __str__
 
-    def update(self, data):
-        """Called (by a :class:`ConfigManager`) when new configuration data is available."""
-
-        self._value = self._get_view(data, self._modelname, self._model)
+    def update(self, data, index=None, changes=None):
+        """Called (by a :class:`ConfigManager`) when new configuration data is available.
 
-    def _get_view(self, data, viewname, model):
+        `index` is a :class:`rjgtoys.config._index.ConfigIndex` of `data`;
+        if `None`, one is built.
 
-        schema = model.schema()
+        `changes`, if not `None`, is a :class:`rjgtoys.config._diff.ConfigChanges`
+        that describes how `data` differs from some earlier data.   If this
+        proxy was last updated from that earlier data, and none of the changes
+        affect it, the value is not rebuilt.
 
-        view = self._get_view_dict(data, viewname, schema)
-        #print("_get_view %s is %s" % (viewname, view))
-        return model(**view)
+        Otherwise the view is built from the data, and if it has the same
+        fingerprint as the view from which the value was last built, the
+        value is kept as it is; if not, a new value is made by :meth:`_validate`.
 
-    def _get_view_dict(self, data, viewname, schema):
+        Returns `True` if the view was rebuilt.
+        """
 
-        # Do we have any defaults?
+        if index is None:
+            index = ConfigIndex(data)
 
-        defaults = data['defaults']
+        if changes is not None and self._data is changes.old:
+            paths = self._view_paths(index) | self._view_paths(changes.old_index)
+            if not changes.affects_any(paths):
+                self._data = data
+                self._pending = None
+                if not self._bound:
+                    self._bind()
+                return False
 
-        #print("*** START ***")
-        #print("_get_view_dict data %s defaults %s" % (data, defaults))
+        view = self._get_view_dict(index, self._modelname, self._model)
+        fingerprint = _view_fingerprint(view)
 
-        #print("Get default view dict")
-        if defaults:
-            data_defaults = self._get_view_dict(defaults, viewname, schema)
+        if fingerprint is not None and fingerprint == self._fingerprint:
+            self._validation = 'reused'
         else:
-            data_defaults = {}
+            self._value = self._validate(view, fingerprint)
 
-        #print("Got default view dict")
-        #print("data_defaults: %s" % (data_defaults,))
+        self._fingerprint = fingerprint
+        self._data = data
+        self._pending = None
 
-        view = self._get_view_mapping(data, viewname, schema)
+        self._bind()
 
-        #print("Use view: %s" % (view))
+        return True
 
-        for n, k in view.items():
-            try:
-                data_defaults[n] = self._get_defaulted(data, k)
-            except KeyError:
-                pass
+    def _mark_stale(self, data, index=None, changes=None):
+        """Note that new data is available, but don't use it until
+        this proxy is next read (see :meth:`ConfigManager.set_lazy`).
 
-        return data_defaults
+        The arguments are as for :meth:`update`.
+        """
 
-    def _get_view_mapping(self, data, viewname, schema):
-        """Get the view mapping for viewname."""
+        self._pending = (data, index, changes)
+        self._unbind()
 
-        # Get the view mapping, if any
-        # defaults have already been applied
+    def _validate(self, view, fingerprint):
+        """Return an instance of the model made from `view`, which has `fingerprint`.
 
-        try:
-            view = data['__view__'][viewname]
-        except KeyError:
-            view = {}
+        If the manager knows the values that the model had when it was
+        validated against the same input before (see :meth:`ConfigManager.trusted_values`),
+        the instance is made from them without validating it again.
+        """
 
-        # Fill in any missing fields; those map directly to their names in the data
+        definition = _model_digest(self._model)
 
-        view.update({ n: n for n in schema['properties'].keys() if n not in view })
+        if fingerprint is not None and definition is not None:
+            values = self._manager.trusted_values(_model_name(self._model), definition, fingerprint)
+            if values is not None:
+                self._validation = 'trusted'
+                (fields, fields_set) = values
+                return self._model.construct(fields_set, **fields)
 
-        #print("view_mapping(%s)" % (viewname))
-        #print("data: %s" % (data))
-        #print("view mapping: %s" % (view))
+        self._validation = 'validated'
+        return self._model(**config_thaw(view))
 
-        return view
+    def _validated_values(self):
+        """Return ``(key, values)`` describing the current value, for
+        :meth:`ConfigManager.trusted_values`, or `None`."""
 
-    def _get_defaulted(self, data, item):
-        """Get an item from data, using defaults if available."""
+        definition = _model_digest(self._model)
+
+        if self._value is None or self._fingerprint is None or definition is None:
+            return None
 
-        missing = True
         try:
-            value = self._getitem(data, item)
-            missing = False
-        except KeyError:
-            pass
+            values = pickle.dumps(
+                (dict(vars(self._value)), set(self._value.__fields_set__)),
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        except Exception:
+            # Something in there can't be saved
+            return None
+
+        return ((_model_name(self._model), definition, self._fingerprint), values)
+
+    def _bind(self):
+        """If the manager asks for it (see :meth:`ConfigManager.set_bind_values`),
+        copy the field values of the model instance into this object's
+        ``__dict__``, so that reading them is as quick as reading any
+        other attribute, and :meth:`__getattr__` isn't involved.
+
+        Names that are used by this class, such as :meth:`update`, are
+        not bound, and are still read through :meth:`__getattr__`.
+        """
 
-        # Try to return the default instead
+        if not self._manager.bind_values or self._value is None:
+            self._unbind()
+            return
 
-        defaults = data['defaults']
+        cls = type(self)
 
-        if not defaults:
-            if missing:
-                raise KeyError(item)
-            return value
+        bound = {
+            name: value
+            for (name, value) in vars(self._value).items()
+            if not name.startswith('_') and not hasattr(cls, name)
+        }
 
-        try:
-            default = self._get_defaulted(defaults, item)
-            # If there was no explicit value, then the default
-            # is the answer
-            if missing:
-                return default
-        except KeyError:
-            # No default.  If also no explicit value, we've no answer.
-            # otherwise, use the explicit value.
-            if missing:
-                raise
-            else:
-                return value
+        # Replace the old values without a moment when none are bound
 
-        # Not missing, and there's a default.
+        d = self.__dict__
+        for name in self._bound:
+            if name not in bound:
+                del d[name]
 
-        # If it's not a mapping, we return the explicit value
+        d.update(bound)
 
-        if not isinstance(value, collections.abc.Mapping):
-            return value
+        self._bound = tuple(bound)
 
-        # Override default from explicit, return the result
-        # TODO?  Exception is default is not also a Mapping?
+    def _unbind(self):
+        """Remove any values bound by :meth:`_bind`, so that
+        reading them goes through :meth:`__getattr__` again."""
 
-        config_merge(value, default)
+        d = self.__dict__
+        for name in self._bound:
+            del d[name]
 
-        return default
+        self._bound = ()
 
-    def _getitem(self, data, path):
-        """Like getitem, but understands paths: m['a.b'] = m['a']['b']
+    def _wanted_keys(self, data):
+        """Return the set of top-level keys in `data` that this proxy might use.
 
-        Also understands that some dicts have keys that contain dots.
+        A view mapping path such as ``a.b.c`` might refer to any
+        of the keys ``a``, ``a.b`` or ``a.b.c``, so all are included.
         """
 
-        try:
-            return data[path]
-        except KeyError:
-            if '.' not in path:
-                raise
+        return set(get_view_plan(self._model, self._modelname, data).keys)
+
+    def _view_paths(self, index):
+        """Return the dotted paths of the values in the indexed data that
+        this proxy's value depends on, including its view mapping."""
+
+        paths = {'__view__.' + self._modelname}
+
+        while index is not None:
+            paths.update(get_view_plan(self._model, self._modelname, index.data).paths)
+            index = index.defaults
+
+        return paths
 
-        (p, q) = path.split('.',1)
+    def _get_view(self, data, viewname, model, index=None):
 
-        data = data[p]
-        return self._getitem(data, q)
+        if index is None:
+            index = ConfigIndex(data)
+
+        view = self._get_view_dict(index, viewname, model)
+        #print("_get_view %s is %s" % (viewname, view))
+        return model(**config_thaw(view))
+
+    def _get_view_dict(self, index, viewname, model):
+
+        # Collect the chain of defaults, so that they can be applied
+        # starting from the innermost
+
+        chain = []
+        while index is not None:
+            chain.append(index)
+            index = index.defaults
+
+        #print("*** START ***")
+
+        data_defaults = {}
+
+        for index in reversed(chain):
+            plan = get_view_plan(model, viewname, index.data)
+
+            #print("Use view: %s" % (plan.mapping))
+
+            for n, k in plan.mapping.items():
+                try:
+                    data_defaults[n] = self._get_defaulted(index, k)
+                except KeyError:
+                    pass
+
+        return data_defaults
+
+    def _get_defaulted(self, index, item):
+        """Get an item from indexed data, using defaults if available."""
+
+        return index.get_defaulted(item)
 
     def __getattr__(self, name):
         """Attribute access to a :class:`ConfigProxy` is delegated to an
@@ -227,9 +411,18 @@ class ConfigProxy:
 
         The proxy object ensures that configuration data has actually been
         loaded and parsed before returning the attribute value.
+
+        In lazy mode (see :meth:`ConfigManager.set_lazy`), the model
+        instance is made by the first read after each load.
+
+        Once the data has been loaded, the fields of the model can be
+        bound to the proxy itself (see :meth:`ConfigManager.set_bind_values`),
+        so that reading them doesn't come here at all.
         """
 
         self._manager.load()
+        if self._pending is not None:
+            self._manager.materialise(self)
         return getattr(self._value, name)
 
     def add_arguments(self, parser, default=None, adjacent_to=None):
@@ -11,16 +11,27 @@ These fetch data from configuration files.
 
 .. autoclass:: SearchPathConfigSource
 
+.. autoclass:: LayeredConfigSource
+
+.. autoclass:: EnvironmentConfigSource
+
 .. autoexception:: ConfigSearchFailed
 
 """
 
+import asyncio
+import concurrent.futures
+import glob
 import os
 from typing import List
 
 from rjgtoys.xc import Error, Title
 
-from rjgtoys.yaml import yaml_load_path
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._include import IncludeCache
+from rjgtoys.config._parsers import config_load_path, config_load_path_subset
+from rjgtoys.config._ops import config_overlay
 
 
 class ConfigSearchFailed(Error):
@@ -37,17 +48,83 @@ class ConfigSource:
 
     It provides one method, :meth:`fetch` that should be
     overridden by subclasses to deliver data from some source.
+    For the benefit of :mod:`asyncio` programs there is also
+    :meth:`afetch`, which by default runs :meth:`fetch` in an executor.
+    A source that can save work by delivering only part of its
+    data can override :meth:`fetch_subset`.
+
+    A source whose data has already been through
+    :func:`rjgtoys.config._ops.config_normalise` sets :attr:`normalised`
+    so that the :class:`ConfigManager` doesn't do it again.
+    Such a source may also be able to say what values were produced when
+    models were validated against the data before; if so, after each
+    fetch :attr:`validated` holds a table of them (see
+    :class:`rjgtoys.config._compiled.CompiledConfigSource`), so that proxies
+    need not validate the same input again.
+
+    A source can also tell interested parties when its data may
+    have changed: callables registered with :meth:`subscribe` are called
+    by :meth:`notify`.   Sources that read files report the paths
+    they depend on from :meth:`watch_paths`, so that something like
+    :class:`rjgtoys.config._watch.WatchingConfigSource` can watch them.
     """
 
-    # One day we'll need a pub-sub sort of interface
-    # so a source can notify that it's been updated.
-    # For now, this will do
+    normalised = False
+
+    validated = None
+
+    def __init__(self):
+        self._subscribers = []
 
     def fetch(self):
         """Fetches the current data from the source."""
 
         return {}
 
+    async def afetch(self):
+        """Fetches the current data from the source, without blocking the event loop.
+
+        Sources that can do their I/O asynchronously may override this;
+        the default runs :meth:`fetch` in the default executor.
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.fetch)
+
+    def fetch_subset(self, wanted):
+        """Fetches the part of the current data that is wanted.
+
+        `wanted` is a callable that is passed a mapping containing just the
+        top-level ``defaults`` and ``__view__`` entries of the data, and returns
+        the other top-level keys that are needed.   See
+        :func:`rjgtoys.config._parsers.config_load_path_subset`.
+
+        This is only a hint: the default implementation returns everything.
+        """
+
+        return self.fetch()
+
+    def watch_paths(self):
+        """Returns a list of the paths whose content determines the data."""
+
+        return []
+
+    def subscribe(self, callback):
+        """Arrange for `callback` to be called (with no parameters) when the data changes."""
+
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Cancel a previous :meth:`subscribe`."""
+
+        self._subscribers.remove(callback)
+
+    def notify(self):
+        """Tell subscribers that the data may have changed."""
+
+        for callback in list(getattr(self, '_subscribers', ())):
+            callback()
+
 
 def resolve_noop(path):
     """The default 'resolve path' action; just returns the path it was given."""
@@ -57,9 +134,21 @@ def resolve_noop(path):
 
 class YamlFileConfigSource(ConfigSource):
     """This :class:`ConfigSource` implementation reads a configuration from
-    a file containing YAML."""
+    a file containing YAML.
+
+    By default, the file is read by
+    :func:`rjgtoys.config._parsers.config_load_path`, so files in
+    other formats (such as JSON or TOML) can also be read.
+
+    Files named in its ``defaults`` are included; see :mod:`rjgtoys.config._include`.
+    """
+
+    # The include cache used if none is specified: shared, so that
+    # files that are included by several sources are read only once
+
+    shared_includes = IncludeCache()
 
-    def __init__(self, path, resolve=None):
+    def __init__(self, path, resolve=None, cache=None, parse=None, includes=None):
         """
         `path`
           The path to the file to be read.
@@ -70,26 +159,90 @@ class YamlFileConfigSource(ConfigSource):
           The library function :func:`os.path.expanduser` would be a possible
           candidate.
 
+        `cache`
+          If not `None`, a :class:`rjgtoys.config._cache.ParsedConfigCache`
+          that holds previously parsed copies of the file, so that an unchanged
+          file need not be parsed again.
+
+        `parse`
+          If not `None`, a callable that is passed the resolved path and
+          returns the data in the file.   The default is
+          :func:`rjgtoys.config._parsers.config_load_path`.
+
+        `includes`
+          If not `None`, the :class:`rjgtoys.config._include.IncludeCache`
+          used to read included files.  The default is :attr:`shared_includes`.
+
         """
 
         super().__init__()
         self.path = path
         self.resolve = resolve or resolve_noop
+        self.cache = cache
+        self.parse = parse or config_load_path
+        self.includes = includes or self.shared_includes
+
+        # The files that were included by the last fetch
+
+        self._included = []
 
     def fetch(self):
 
         path = self.resolve(self.path)
 
-        data = yaml_load_path(path)
+        if self.cache is not None:
+            data = self.cache.load(path, self.parse)
+        else:
+            data = self.parse(path)
+
+        return self._expand(data, path)
+
+    def fetch_subset(self, wanted):
+
+        # A cached copy is cheap to load in full, and a custom parser
+        # may not know how to load a subset
+
+        if self.cache is not None or self.parse is not config_load_path:
+            return self.fetch()
+
+        path = self.resolve(self.path)
+
+        # The included defaults may help decide what's wanted
+
+        def wanted_expanded(partial):
+            return wanted(self.includes.expand(partial, path)[0])
+
+        return self._expand(config_load_path_subset(path, wanted_expanded), path)
+
+    def _expand(self, data, path):
+        """Include any files named in the defaults of `data`."""
+
+        (data, self._included) = self.includes.expand(data, path)
         return data
 
+    def watch_paths(self):
+
+        return [self.resolve(self.path)] + self._included
+
 
 class SearchPathConfigSource(ConfigSource):
-    """Searches a number of places for a configuration file."""
+    """Searches a number of places for a configuration file.
+
+    The resolved list of candidate paths (the 'search plan') is computed
+    once, and recomputed only if the values returned by `env` change,
+    or the current directory changes (because a candidate may be relative).
+
+    Candidates that were found not to exist are remembered, along
+    with the modification time of the nearest directory above them that
+    does exist.  On the next search, a candidate is only probed again
+    if that directory has changed, so repeated searches cost one
+    :func:`os.stat` of a directory that is known to exist per missing
+    candidate, rather than a failed lookup.   See :meth:`stats`.
+    """
 
     DEFAULT_LOADER = YamlFileConfigSource
 
-    def __init__(self, *paths, resolve=None, loader=None):
+    def __init__(self, *paths, resolve=None, loader=None, env=None):
         """
         `paths`
           A list of paths to be tried, in order.
@@ -106,23 +259,342 @@ class SearchPathConfigSource(ConfigSource):
           load each possible path.   Must be a class or callable that
           can accept a single pathname parameter.  The default
           is ``self.DEFAULT_LOADER``, which is :class:`YamlFileConfigSource`.
+
+        `env`
+          If not `None`, a callable that returns a :class:`dict` of the
+          values that `resolve` depends upon.  The search plan is
+          recomputed whenever the result changes.   If `None`, `resolve`
+          is assumed always to produce the same results.
         """
 
+        super().__init__()
         self.loader = loader or self.DEFAULT_LOADER
         self.resolve = resolve or resolve_noop
+        self.env = env
         self.paths = [p for p in paths if p]
 
+        self._plan_key = None
+        self._plan = None
+
+        # Maps a missing candidate path to (directory, mtime) of its
+        # nearest existing ancestor when it was found to be missing
+
+        self._missing = {}
+
+        # The source for the file found by the last fetch
+
+        self._found = None
+
+        self._stats = dict(plans=0, probes=0, cached=0, validations=0)
+
+    def stats(self):
+        """Return a :class:`dict` of counters describing the work done by searches.
+
+        `plans`
+          The number of times the search plan was computed.
+        `probes`
+          The number of candidate paths that were actually looked up.
+        `cached`
+          The number of candidate paths that were skipped because they
+          were remembered as missing.
+        `validations`
+          The number of directories that were checked to decide whether
+          a remembered result was still valid.
+        """
+
+        return dict(self._stats)
+
+    def _get_plan(self):
+        """Return the list of resolved candidate paths."""
+
+        key = (os.getcwd(), tuple(sorted(self.env().items())) if self.env else ())
+
+        if self._plan is None or key != self._plan_key:
+            self._plan = [self.resolve(p) for p in self.paths]
+            self._plan_key = key
+            self._missing.clear()
+            self._stats['plans'] += 1
+
+        return self._plan
+
+    @staticmethod
+    def _nearest_dir(path):
+        """Return (dir, mtime) for the nearest existing directory above `path`."""
+
+        d = os.path.dirname(os.path.abspath(path))
+        while True:
+            try:
+                return (d, os.stat(d).st_mtime_ns)
+            except OSError:
+                parent = os.path.dirname(d)
+                if parent == d:
+                    return (d, None)
+                d = parent
+
+    def _known_missing(self, path, mtimes):
+        """Is `path` remembered as missing, and still valid?
+
+        `mtimes` caches directory modification times for the duration
+        of one search, because several candidates often share a directory.
+        """
+
+        try:
+            (d, mtime) = self._missing[path]
+        except KeyError:
+            return False
+
+        try:
+            current = mtimes[d]
+        except KeyError:
+            self._stats['validations'] += 1
+            try:
+                current = os.stat(d).st_mtime_ns
+            except OSError:
+                current = None
+            mtimes[d] = current
+
+        if mtime is not None and current == mtime:
+            self._stats['cached'] += 1
+            return True
+
+        del self._missing[path]
+        return False
+
     def fetch(self):
         """Search for a readable file and return the data from it."""
 
-        tries = []
-        for p in self.paths:
-            p = self.resolve(p)
-            tries.append(p)
+        self._found = self._find()
+        return self._found.fetch()
+
+    def fetch_subset(self, wanted):
+
+        self._found = self._find()
+        return self._found.fetch_subset(wanted)
+
+    def _find(self):
+        """Search for a readable file and return a source for it."""
+
+        plan = self._get_plan()
+        mtimes = {}
+
+        for p in plan:
+            if self._known_missing(p, mtimes):
+                continue
+            self._stats['probes'] += 1
             if not os.path.exists(p):
-#                print("SearchPathConfigSource did not find %s" % (p))
+                self._missing[p] = self._nearest_dir(p)
+                continue
+            return self.loader(p)
+        raise ConfigSearchFailed(paths=list(plan))
+
+    def watch_paths(self):
+
+        # Any candidate can change the result, by appearing or disappearing,
+        # and so can anything the last one found depends on
+
+        paths = list(self._get_plan())
+
+        if self._found is not None:
+            paths.extend(p for p in self._found.watch_paths() if p not in paths)
+
+        return paths
+
+
+class LayeredConfigSource(ConfigSource):
+    """Reads all the files that match a pattern, such as ``/etc/{app}.conf.d/*.yaml``,
+    and merges them.
+
+    The files are merged in sorted order of their paths, each one overriding
+    those before it, as described for :func:`rjgtoys.config._ops.config_overlay`.
+
+    The files are read and parsed concurrently by a pool of threads.
+    """
+
+    def __init__(self, pattern, resolve=None, cache=None, parse=None, max_workers=None):
+        """
+        `pattern`
+          A :mod:`glob` pattern that matches the files to be read.
+
+        `resolve`
+          If not `None`, a callable that will be passed `pattern`
+          to 'resolve' it, as for :class:`YamlFileConfigSource`.
+
+        `cache`
+          If not `None`, a :class:`rjgtoys.config._cache.ParsedConfigCache`
+          used for each file, as for :class:`YamlFileConfigSource`.
+
+        `parse`
+          If not `None`, the callable used to read each file, as for
+          :class:`YamlFileConfigSource`.
+
+        `max_workers`
+          The maximum number of threads to use; the default is as for
+          :class:`concurrent.futures.ThreadPoolExecutor`.
+        """
+
+        super().__init__()
+        self.pattern = pattern
+        self.resolve = resolve or resolve_noop
+        self.cache = cache
+        self.parse = parse or config_load_path
+        self.max_workers = max_workers
+
+    def _paths(self):
+        """Return the sorted list of paths to be read."""
+
+        return sorted(glob.glob(self.resolve(self.pattern)))
+
+    def _load(self, path):
+
+        if self.cache is not None:
+            return self.cache.load(path, self.parse)
+        return self.parse(path)
+
+    def fetch(self):
+
+        paths = self._paths()
+
+        if len(paths) > 1:
+            with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+                parts = list(pool.map(self._load, paths))
+        else:
+            parts = [self._load(p) for p in paths]
+
+        result = Thing()
+        for part in parts:
+            if part:
+                result = config_overlay(part, result)
+        return result
+
+    def watch_paths(self):
+
+        # Watch the directory, to see files come and go, and the files
+
+        return [os.path.dirname(self.resolve(self.pattern))] + self._paths()
+
+
+class EnvironmentConfigSource(ConfigSource):
+    """Overlays values from environment variables on the data from another source.
+
+    A variable such as ``MYAPP__DB__HOST`` (with prefix ``MYAPP``) provides
+    the value of ``db.host``, overriding any value from the other source.
+    The values are always strings; Pydantic will usually convert them to
+    whatever type is needed.
+
+    The overlay is reused until the environment changes.   A change is
+    detected by comparing the names and values of the variables that have
+    the prefix with those that the overlay was built from; that still
+    means looking at the name of each variable, but it's much cheaper
+    than building the overlay again.
+    """
+
+    def __init__(self, prefix, source=None, separator='__', lowercase=True, environ=None):
+        """
+        `prefix`
+          The prefix that identifies variables of interest.
+        `source`
+          The :class:`ConfigSource` whose data is to be overlaid.
+          If `None`, only the environment is used.
+        `separator`
+          The string that separates the prefix and each level of the
+          key path in a variable name.
+        `lowercase`
+          If `True`, convert the key path to lower case.
+        `environ`
+          The mapping to read variables from; the default is :data:`os.environ`.
+        """
+
+        super().__init__()
+        self.prefix = prefix + separator
+        self.source = source
+        self.separator = separator
+        self.lowercase = lowercase
+        self.environ = os.environ if environ is None else environ
+
+        self.invalidate()
+
+    @property
+    def normalised(self):
+        return self.source is not None and self.source.normalised
+
+    @property
+    def validated(self):
+        return self.source.validated if self.source is not None else None
+
+    def invalidate(self):
+        """Forget the overlay, so that the next fetch builds it again."""
+
+        self._fingerprint = None
+        self._overlay = None
+
+    def _get_fingerprint(self):
+        """Return the set of (name, value) pairs of the variables that have the prefix."""
+
+        environ = self.environ
+        prefix = self.prefix
+        return frozenset((n, environ[n]) for n in environ if n.startswith(prefix))
+
+    def _scan(self, fingerprint):
+        """Build the overlay from the variables in `fingerprint`."""
+
+        overlay = Thing()
+        for (name, value) in sorted(fingerprint):
+            path = name[len(self.prefix):]
+            if self.lowercase:
+                path = path.lower()
+            keys = [k for k in path.split(self.separator) if k]
+            if not keys:
                 continue
-#            print("SearchPathConfigSource using %s" % (p))
-            return self.loader(p).fetch()
-        raise ConfigSearchFailed(paths=tries)
+            node = overlay
+            for k in keys[:-1]:
+                child = node.get(k)
+                if not isinstance(child, Thing):
+                    child = node[k] = Thing()
+                node = child
+            # A variable that names a section can't replace its content
+            if not isinstance(node.get(keys[-1]), Thing):
+                node[keys[-1]] = value
+
+        self._overlay = overlay
+        self._fingerprint = fingerprint
+
+    def overlay(self):
+        """Return the data derived from the environment."""
+
+        fingerprint = self._get_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._scan(fingerprint)
+        return self._overlay
+
+    def fetch(self):
+
+        return self._apply(self.source.fetch() if self.source is not None else None)
+
+    def fetch_subset(self, wanted):
+
+        if self.source is None:
+            return self.fetch()
+
+        overlay = self.overlay()
+
+        def wanted_or_overlaid(partial):
+            return set(wanted(partial)).union(overlay.keys())
+
+        return self._apply(self.source.fetch_subset(wanted_or_overlaid))
+
+    def _apply(self, base):
+        """Apply the overlay to `base`."""
+
+        overlay = self.overlay()
+
+        if not base:
+            base = Thing()
+
+        if not overlay:
+            return base
+
+        return config_overlay(overlay, base)
+
+    def watch_paths(self):
 
+        return self.source.watch_paths() if self.source is not None else []
@@ -0,0 +1,373 @@
+"""
+
+Watching for configuration changes
+----------------------------------
+
+A :class:`WatchingConfigSource` wraps another :class:`ConfigSource`, watches
+the files it depends upon (see :meth:`ConfigSource.watch_paths`) and
+calls :meth:`ConfigSource.notify` when any of them change.
+
+The :class:`ConfigManager` uses this to reload configuration data in the
+background; see :meth:`ConfigManager.watch`.
+
+On Linux, changes are detected using inotify; elsewhere, or if inotify is
+not available, the files are polled for changes in their modification time,
+size and inode number.
+
+Editors tend to save a file in several steps (write a temporary file, rename,
+change permissions...) so changes are 'debounced': notification is deferred
+until no change has been seen for a short while.
+
+.. autoclass:: WatchingConfigSource
+   :members: start, stop
+
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from rjgtoys.config._source import ConfigSource
+
+
+class _PollingWatcher:
+    """Detects changes by polling the status of a set of paths."""
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._stopped = threading.Event()
+        self._state = {}
+
+    @staticmethod
+    def _signature(path):
+        try:
+            s = os.stat(path)
+        except OSError:
+            return None
+        return (s.st_ino, s.st_size, s.st_mtime_ns)
+
+    def set_paths(self, paths):
+        self._state = {p: self._signature(p) for p in paths}
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds for a change; return `True` if there was one."""
+
+        remaining = timeout
+        while not self._stopped.is_set():
+            interval = min(self.poll_interval, remaining)
+            if self._stopped.wait(interval):
+                break
+            remaining -= interval
+            changed = False
+            for (path, sig) in self._state.items():
+                new_sig = self._signature(path)
+                if new_sig != sig:
+                    self._state[path] = new_sig
+                    changed = True
+            if changed:
+                return True
+            if remaining <= 0:
+                break
+        return False
+
+    def close(self):
+        self._stopped.set()
+
+    def release(self):
+        pass
+
+
+class _InotifyWatcher:
+    """Detects changes using the Linux inotify interface.
+
+    Each path is watched by watching the nearest existing directory
+    above it, because editors commonly replace files by renaming,
+    and because a file (or the directory that should contain it)
+    may not exist yet.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = os.O_CLOEXEC
+
+    WATCH_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    )
+
+    # Events that mean a watched directory has gone away
+
+    RESCAN_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+
+    _EVENT = struct.Struct('iIII')
+
+    _libc = None
+
+    @classmethod
+    def available(cls):
+        """Is inotify usable on this system?"""
+
+        if not sys.platform.startswith('linux'):
+            return False
+
+        if cls._libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+            except (OSError, AttributeError):
+                return False
+            libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+            libc.inotify_rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+            cls._libc = libc
+
+        return True
+
+    def __init__(self):
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+        (self._wakeup_r, self._wakeup_w) = os.pipe()
+
+        self._paths = []
+
+        # Watch descriptor -> (directory, set of names of interest)
+
+        self._watches = {}
+
+    @staticmethod
+    def _watch_point(path):
+        """Return (directory, name) where directory is the nearest existing
+        directory above `path`, and name is the entry in it that leads to `path`.
+
+        If `path` is itself an existing directory, then return (path, None)
+        because any change to its content is of interest.
+        """
+
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            return (path, None)
+        (d, name) = os.path.split(path)
+        while not os.path.isdir(d):
+            (d, name) = os.path.split(d)
+        return (d, name)
+
+    def set_paths(self, paths):
+        self._paths = list(paths)
+        self._rescan()
+
+    def _rescan(self):
+        """(Re)establish watches for the current set of paths."""
+
+        for wd in self._watches:
+            self._libc.inotify_rm_watch(self._fd, wd)
+        self._watches = {}
+
+        for path in self._paths:
+            (d, name) = self._watch_point(path)
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), self.WATCH_MASK)
+            if wd < 0:
+                continue
+            (_, names) = self._watches.setdefault(wd, (d, set()))
+            names.add(os.fsencode(name) if name is not None else None)
+
+    def _read_events(self):
+        """Read pending events; return `True` if any are of interest."""
+
+        changed = False
+        rescan = False
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset < len(buf):
+                (wd, mask, _, length) = self._EVENT.unpack_from(buf, offset)
+                offset += self._EVENT.size
+                name = buf[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    # Lost track; assume the worst
+                    rescan = changed = True
+                    continue
+                try:
+                    (_, names) = self._watches[wd]
+                except KeyError:
+                    # A watch that has since been removed
+                    continue
+                if mask & self.RESCAN_MASK:
+                    rescan = changed = True
+                elif name in names or None in names:
+                    changed = True
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO | self.IN_DELETE | self.IN_MOVED_FROM):
+                        # The nearest existing directory may have changed
+                        rescan = True
+        if rescan:
+            self._rescan()
+        return changed
+
+    def wait(self, timeout):
+        """Wait up to `timeout` seconds for a change; return `True` if there was one."""
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                (ready, _, _) = select.select([self._fd, self._wakeup_r], [], [], remaining)
+            except InterruptedError:
+                continue
+            if self._wakeup_r in ready:
+                return False
+            if self._fd in ready and self._read_events():
+                return True
+
+    def close(self):
+        os.write(self._wakeup_w, b'x')
+
+    def release(self):
+        for fd in (self._fd, self._wakeup_r, self._wakeup_w):
+            os.close(fd)
+
+
+class WatchingConfigSource(ConfigSource):
+    """A :class:`ConfigSource` that delivers the data from another source,
+    and notifies its subscribers when that data may have changed.
+
+    Watching is done by a background thread, started by :meth:`start`.
+    """
+
+    def __init__(self, source, debounce=0.25, poll_interval=1.0, use_inotify=None):
+        """
+        `source`
+          The :class:`ConfigSource` to wrap.
+
+        `debounce`
+          Notification is deferred until no change has been seen
+          for this many seconds.
+
+        `poll_interval`
+          How often to check the files, in seconds, if they have to be polled.
+
+        `use_inotify`
+          Whether to use inotify.  The default, `None`, means use it
+          if it is available.
+        """
+
+        super().__init__()
+        self.source = source
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        if use_inotify is None:
+            use_inotify = _InotifyWatcher.available()
+        self.use_inotify = use_inotify
+
+        self._thread = None
+        self._watcher = None
+        self._stopping = False
+
+    @property
+    def normalised(self):
+        return self.source.normalised
+
+    @property
+    def validated(self):
+        return self.source.validated
+
+    def fetch(self):
+
+        return self.source.fetch()
+
+    async def afetch(self):
+
+        return await self.source.afetch()
+
+    def fetch_subset(self, wanted):
+
+        return self.source.fetch_subset(wanted)
+
+    def watch_paths(self):
+
+        return self.source.watch_paths()
+
+    def start(self):
+        """Start watching for changes, if not already doing so."""
+
+        if self._thread is not None:
+            return
+
+        if self.use_inotify:
+            self._watcher = _InotifyWatcher()
+        else:
+            self._watcher = _PollingWatcher(self.poll_interval)
+
+        self._watcher.set_paths(self.watch_paths())
+
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name='rjgtoys.config watcher',
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching for changes, and wait for the watcher thread to finish."""
+
+        if self._thread is None:
+            return
+
+        self._stopping = True
+        self._watcher.close()
+        self._thread.join()
+        self._watcher.release()
+        self._thread = None
+        self._watcher = None
+
+    def _run(self):
+
+        watcher = self._watcher
+        while not self._stopping:
+            if not watcher.wait(self.poll_interval):
+                continue
+
+            # Wait for things to settle down
+
+            while not self._stopping and watcher.wait(self.debounce):
+                pass
+
+            if self._stopping:
+                break
+
+            self.notify()
+
+            # The set of paths may depend on the data (e.g. a search path)
+
+            watcher.set_paths(self.watch_paths())
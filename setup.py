@@ -22,5 +22,9 @@ setup(
         'rjgtoys-xc',
         'rjgtoys-thing',
         'rjgtoys-yaml',
-    ]
+    ],
+    extras_require={
+        'libyaml': ['PyYAML'],
+        'toml': ['tomli; python_version < "3.11"'],
+    }
 )
@@ -0,0 +1,123 @@
+"""
+Fixtures, sources and models shared by the unit tests.
+
+The sources and models are provided as fixtures, so that test modules
+don't need to import this one, which works only in some of pytest's
+import modes.
+
+"""
+
+import threading
+
+import pytest
+
+from rjgtoys.config import Config
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._source import ConfigSource
+
+
+class ServerModel(Config):
+
+    host: str
+    port: int
+
+
+class ClientModel(Config):
+
+    retries: int
+
+
+class StaticSource(ConfigSource):
+    """A config source that provides the same literal every time."""
+
+    def __init__(self, data):
+        super().__init__()
+        self._data = data
+
+    def fetch(self):
+        return self._data
+
+
+class ListSource(ConfigSource):
+    """A config source that provides each of a list of literals in turn."""
+
+    def __init__(self, *data):
+        super().__init__()
+        self._data = list(data)
+
+    def fetch(self):
+        return self._data.pop(0)
+
+
+class CountingSource(StaticSource):
+    """A config source that counts fetches, and records the thread doing them."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.fetches = 0
+        self.threads = set()
+
+    def fetch(self):
+        self.fetches += 1
+        self.threads.add(threading.get_ident())
+        return super().fetch()
+
+
+@pytest.fixture
+def server_model():
+    """A model with a host and a port."""
+
+    return ServerModel
+
+
+@pytest.fixture
+def client_model():
+    """A model with a number of retries."""
+
+    return ClientModel
+
+
+@pytest.fixture
+def static_source():
+    """Make a :class:`StaticSource`."""
+
+    return StaticSource
+
+
+@pytest.fixture
+def list_source():
+    """Make a :class:`ListSource`."""
+
+    return ListSource
+
+
+@pytest.fixture
+def counting_source():
+    """Make a :class:`CountingSource`."""
+
+    return CountingSource
+
+
+@pytest.fixture(autouse=True)
+def fresh_manager():
+    """Leave the manager as other tests expect to find it: unloaded,
+    with no proxies, no statistics, and every option turned off."""
+
+    yield
+
+    ConfigManager.source = None
+    ConfigManager.data = None
+    ConfigManager.index = None
+    ConfigManager.loaded = False
+
+    del ConfigManager.proxies[:]
+
+    ConfigManager._wanted = None
+    ConfigManager._trusted = {}
+    ConfigManager._update_stats = dict(rebuilt=0, skipped=0)
+    ConfigManager._validation_stats = dict(validated=0, reused=0, trusted=0)
+
+    ConfigManager.demand_driven = False
+    ConfigManager.lazy = False
+    ConfigManager.bind_values = False
+    ConfigManager.intern_strings = None
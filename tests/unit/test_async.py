@@ -0,0 +1,48 @@
+"""
+Tests for asynchronous loading.
+
+"""
+
+import asyncio
+import threading
+
+from rjgtoys.config import Config
+from rjgtoys.config._proxy import ConfigProxy
+from rjgtoys.config._manager import ConfigManager
+
+
+class AsyncModel(Config):
+
+    a_int: int
+
+
+def test_aload_shares_one_load(counting_source):
+    """Concurrent callers share a single load, done off the event loop thread."""
+
+    cfg = ConfigProxy(AsyncModel)
+
+    source = counting_source(dict(a_int=5))
+
+    ConfigManager.source = source
+
+    async def main():
+        await asyncio.gather(*(ConfigManager.aload(always=True) for _ in range(10)))
+
+    asyncio.run(main())
+
+    assert source.fetches == 1
+    assert threading.get_ident() not in source.threads
+    assert cfg.a_int == 5
+
+
+def test_aload_when_loaded(counting_source):
+    """Nothing is done if the data is already loaded."""
+
+    source = counting_source(dict(a_int=5))
+
+    ConfigManager.source = source
+    ConfigManager.load()
+
+    asyncio.run(ConfigManager.aload())
+
+    assert source.fetches == 1
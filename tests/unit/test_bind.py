@@ -0,0 +1,71 @@
+"""
+Tests for binding values to proxies
+"""
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config import Config
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._proxy import ConfigProxy
+
+
+class BindModel(Config):
+
+    host: str
+    update: int = 0
+
+    def url(self):
+        return 'http://%s/' % (self.host,)
+
+
+def test_bind_values(list_source):
+    """Values are bound to the proxy, and replaced by each load."""
+
+    cfg = ConfigProxy(BindModel, name='test.bind')
+
+    ConfigManager.source = list_source(Thing(host='a', update=1), Thing(host='b'))
+    ConfigManager.set_bind_values()
+    ConfigManager.load(always=True)
+
+    assert vars(cfg)['host'] == 'a'
+    assert cfg.host == 'a'
+
+    # Names used by the proxy are left alone
+
+    assert 'update' not in vars(cfg)
+    assert callable(cfg.update)
+
+    # Anything else still comes from the model
+
+    assert cfg.url() == 'http://a/'
+
+    ConfigManager.load(always=True)
+
+    assert cfg.host == 'b'
+    assert cfg.url() == 'http://b/'
+
+
+def test_bind_invalidated(list_source):
+    """Values are unbound when the data becomes stale, or binding is turned off."""
+
+    cfg = ConfigProxy(BindModel, name='test.bind')
+
+    ConfigManager.source = list_source(Thing(host='a'))
+    ConfigManager.load(always=True)
+
+    assert 'host' not in vars(cfg)
+
+    ConfigManager.set_bind_values()
+
+    assert vars(cfg)['host'] == 'a'
+
+    ConfigManager._set_source(list_source(Thing(host='b')))
+
+    assert 'host' not in vars(cfg)
+    assert cfg.host == 'b'
+    assert vars(cfg)['host'] == 'b'
+
+    ConfigManager.set_bind_values(False)
+
+    assert 'host' not in vars(cfg)
+    assert cfg.host == 'b'
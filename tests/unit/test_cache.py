@@ -0,0 +1,100 @@
+"""
+Tests for the parsed configuration cache.
+
+"""
+
+import os
+
+from unittest.mock import Mock
+
+from rjgtoys.yaml import yaml_load_path
+
+from rjgtoys.config._cache import ParsedConfigCache
+from rjgtoys.config._parsers import config_load_path
+from rjgtoys.config._source import YamlFileConfigSource
+
+
+def write_config(path, text):
+
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def test_cache_hit_skips_parse(tmp_path):
+    """An unchanged file is not parsed a second time."""
+
+    path = tmp_path / 'app.conf'
+    write_config(path, "a: 1\nb: {c: two}\n")
+
+    cache = ParsedConfigCache(str(tmp_path / 'cache'))
+
+    parse = Mock(side_effect=yaml_load_path)
+
+    first = cache.load(str(path), parse)
+    second = cache.load(str(path), parse)
+
+    assert parse.call_count == 1
+    assert first == second == dict(a=1, b=dict(c='two'))
+    assert second.b.c == 'two'      # Still made of Things
+
+
+def test_cache_stale_entry_reparsed(tmp_path):
+    """A changed file is parsed again."""
+
+    path = tmp_path / 'app.conf'
+    write_config(path, "a: 1\n")
+
+    source = YamlFileConfigSource(str(path), cache=ParsedConfigCache(str(tmp_path / 'cache')))
+
+    assert source.fetch() == dict(a=1)
+
+    write_config(path, "a: 22\n")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+    assert source.fetch() == dict(a=22)
+
+
+def test_cache_corrupt_entry_reparsed(tmp_path):
+    """A corrupt cache entry is ignored and replaced."""
+
+    path = tmp_path / 'app.conf'
+    write_config(path, "a: 1\n")
+
+    cache = ParsedConfigCache(str(tmp_path / 'cache'))
+    cache.load(str(path), yaml_load_path)
+
+    (entry,) = os.listdir(cache.directory)
+    write_config(os.path.join(cache.directory, entry), "garbage")
+
+    parse = Mock(side_effect=yaml_load_path)
+
+    assert cache.load(str(path), parse) == dict(a=1)
+    assert parse.call_count == 1
+
+    assert cache.load(str(path), parse) == dict(a=1)
+    assert parse.call_count == 1
+
+
+def test_cache_included_file_changed(tmp_path):
+    """A file is parsed again when a file that it includes changes."""
+
+    path = tmp_path / 'app.conf'
+    part = tmp_path / 'part.conf'
+    write_config(path, "a: 1\nb: !include part.conf\n")
+    write_config(part, "c: two\n")
+
+    cache = ParsedConfigCache(str(tmp_path / 'cache'))
+
+    parse = Mock(side_effect=config_load_path)
+
+    assert cache.load(str(path), parse) == dict(a=1, b=dict(c='two'))
+    assert cache.load(str(path), parse) == dict(a=1, b=dict(c='two'))
+    assert parse.call_count == 1
+
+    write_config(part, "c: three\n")
+    st = os.stat(part)
+    os.utime(part, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+    assert cache.load(str(path), parse) == dict(a=1, b=dict(c='three'))
+    assert parse.call_count == 2
@@ -0,0 +1,200 @@
+"""
+Tests for compiled configuration snapshots.
+
+"""
+
+import pickle
+
+import pydantic
+import pytest
+
+from unittest.mock import patch
+
+from rjgtoys.yaml import yaml_load
+
+from rjgtoys.config import Config
+from rjgtoys.config._proxy import ConfigProxy
+from rjgtoys.config._manager import ConfigManager, ConfigUpdateError
+from rjgtoys.config._compiled import (
+    CompiledConfigSource, ConfigSnapshotInvalid,
+    compile_config, read_snapshot, write_snapshot
+)
+
+
+class ConfigModel(Config):
+
+    a_int: int
+    b_str: str
+
+
+SOURCE = """
+---
+my_a: 222
+
+defaults:
+  my_b: "remapped b"
+  __view__:
+     test.compiled.model:
+       a_int: my_a
+       b_str: my_b
+"""
+
+
+def test_compile_and_load(tmp_path, static_source):
+    """A snapshot delivers the normalised data without renormalising it."""
+
+    path = str(tmp_path / 'app.snapshot')
+
+    expected = compile_config(static_source(yaml_load(SOURCE)), path)
+
+    cfg = ConfigProxy(ConfigModel, name='test.compiled.model')
+
+    ConfigManager.source = CompiledConfigSource(path)
+
+    with patch('rjgtoys.config._manager.config_normalise') as normalise:
+        ConfigManager.load(always=True)
+
+    normalise.assert_not_called()
+
+    assert ConfigManager.data == expected
+    assert cfg.a_int == 222
+    assert cfg.b_str == "remapped b"
+
+
+def test_manager_compile(tmp_path, static_source):
+    """The manager can write a snapshot of what it loaded."""
+
+    path = str(tmp_path / 'app.snapshot')
+
+    ConfigManager.source = static_source(yaml_load(SOURCE))
+    ConfigManager.load(always=True)
+    ConfigManager.compile(path)
+
+    assert read_snapshot(path) == ConfigManager.data
+
+
+def test_snapshot_bad_magic(tmp_path):
+
+    path = tmp_path / 'app.snapshot'
+    path.write_bytes(b"a: 1\n" * 10)
+
+    with pytest.raises(ConfigSnapshotInvalid):
+        read_snapshot(str(path))
+
+
+def test_snapshot_wrong_version(tmp_path):
+
+    path = str(tmp_path / 'app.snapshot')
+
+    with patch('rjgtoys.config._compiled.SNAPSHOT_VERSION', 0):
+        write_snapshot(path, dict(a=1))
+
+    with pytest.raises(ConfigSnapshotInvalid):
+        read_snapshot(path)
+
+
+def test_snapshot_truncated(tmp_path):
+
+    path = tmp_path / 'app.snapshot'
+    write_snapshot(str(path), dict(a=1))
+
+    path.write_bytes(path.read_bytes()[:-1])
+
+    with pytest.raises(ConfigSnapshotInvalid):
+        read_snapshot(str(path))
+
+
+def test_snapshot_corrupt_payload(tmp_path):
+    """A payload that can't be unpickled is reported as an invalid snapshot."""
+
+    path = tmp_path / 'app.snapshot'
+    write_snapshot(str(path), dict(a=1))
+
+    content = path.read_bytes()
+    header = len(content) - len(pickle.dumps((dict(a=1), {}), protocol=pickle.HIGHEST_PROTOCOL))
+    path.write_bytes(content[:header] + b'\xff' * (len(content) - header))
+
+    with pytest.raises(ConfigSnapshotInvalid):
+        read_snapshot(str(path))
+
+
+def test_snapshot_trusted_values(tmp_path, static_source):
+    """Models are not validated again when loaded from a snapshot of the same input."""
+
+    path = str(tmp_path / 'app.snapshot')
+
+    cfg = ConfigProxy(ConfigModel, name='test.compiled.model')
+
+    ConfigManager.source = static_source(yaml_load(SOURCE))
+    ConfigManager.load(always=True)
+    ConfigManager.compile(path)
+
+    # A fresh proxy and manager, as if in another process
+
+    del cfg
+
+    ConfigManager.data = None
+    ConfigManager.loaded = False
+
+    cfg = ConfigProxy(ConfigModel, name='test.compiled.model')
+
+    ConfigManager.source = CompiledConfigSource(path)
+    ConfigManager.validation_stats(reset=True)
+
+    with patch.object(ConfigModel, '__init__', side_effect=AssertionError("validated")):
+        ConfigManager.load(always=True)
+
+    assert ConfigManager.validation_stats() == dict(validated=0, reused=0, trusted=1)
+    assert cfg.a_int == 222
+    assert cfg.b_str == "remapped b"
+    assert cfg._value.__fields_set__ == {'a_int', 'b_str'}
+
+
+def port_model(privileged):
+    """Return a model with a port, which must be privileged if `privileged`
+    is false.   Both versions have the same name."""
+
+    class PortModel(Config):
+
+        port: int
+
+        if not privileged:
+            @pydantic.validator('port')
+            def check_port(cls, v):
+                if v < 1024:
+                    raise ValueError("port must be at least 1024")
+                return v
+
+    return PortModel
+
+
+def test_snapshot_model_changed(tmp_path, static_source):
+    """Values recorded for one definition of a model are not trusted by another."""
+
+    path = str(tmp_path / 'app.snapshot')
+
+    cfg = ConfigProxy(port_model(True), name='test.compiled.port')
+
+    ConfigManager.source = static_source(yaml_load("port: 80\n__view__: {test.compiled.port: {port: port}}\n"))
+    ConfigManager.load(always=True)
+    ConfigManager.compile(path)
+
+    assert cfg.port == 80
+
+    # A fresh proxy and manager, with a stricter model
+
+    del cfg
+
+    ConfigManager.data = None
+    ConfigManager.loaded = False
+
+    cfg = ConfigProxy(port_model(False), name='test.compiled.port')
+
+    ConfigManager.source = CompiledConfigSource(path)
+    ConfigManager.validation_stats(reset=True)
+
+    with pytest.raises(ConfigUpdateError) as e:
+        ConfigManager.load(always=True)
+
+    assert [p for (p, _) in e.value.errors] == [cfg]
+    assert ConfigManager.validation_stats()['trusted'] == 0
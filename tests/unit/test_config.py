@@ -4,10 +4,17 @@ Tests for the config machinery.
 
 """
 
+import copy
+import json
+from typing import Any
+
+import pytest
+
 from rjgtoys.thing import Thing
 from rjgtoys.config import Config
+from rjgtoys.config._node import config_freeze
 from rjgtoys.config._proxy import ConfigProxy
-from rjgtoys.config._ops import config_resolve, config_merge
+from rjgtoys.config._ops import config_normalise, config_resolve, config_merge, config_overlay
 
 
 def test_config_merge_to_empty():
@@ -66,6 +73,26 @@ def test_config_merge_mapping():
     )
 
 
+def test_config_overlay_shares():
+    """Overlaying copies only what it must, and modifies nothing."""
+
+    base = dict(
+        common=dict(fromdest=2, final='dest'),
+        other=dict(x=1)
+    )
+
+    part = dict(common=dict(final='part'))
+
+    result = config_overlay(part, base)
+
+    assert result == dict(
+        common=dict(fromdest=2, final='part'),
+        other=dict(x=1)
+    )
+    assert base['common'] == dict(fromdest=2, final='dest')
+    assert result['other'] is base['other']
+
+
 def test_config_resolve_triv():
     """Resolution works when there are no defaults."""
 
@@ -125,6 +152,29 @@ def test_config_resolve_nested():
     )
 
 
+def test_config_resolve_leaves_raw_alone():
+    """Resolve doesn't modify its input, and its result is read-only."""
+
+    data = Thing.from_object(
+        defaults=[
+            dict(common=dict(a=0, b=1))
+        ],
+        common=dict(a=1)
+    )
+
+    original = copy.deepcopy(data)
+    original_common = data.common
+
+    result = config_resolve(data)
+
+    assert result == Thing(common=dict(a=1, b=1))
+    assert data == original
+    assert data.common is original_common
+
+    with pytest.raises(TypeError):
+        result.common.a = 2
+
+
 def test_get_view_simple():
     """The view mechanism works for a simple case."""
 
@@ -189,3 +239,30 @@ def test_get_view_path():
     assert m.a == 'test1-a'
     assert m.b == 'test1-b'
 
+
+
+def test_get_view_plain_values():
+    """Model values are ordinary containers, not frozen data, so
+    the model can be serialised."""
+
+    data = config_normalise(config_freeze(Thing({
+        '__view__': {'test1': {'a': 't1'}},
+        't1': {'hosts': [{'name': 'x', 'tags': ['p', 'q']}]},
+    })))
+
+    class TestConfig(Config):
+        a: Any
+
+    cfg = ConfigProxy(TestConfig)
+
+    m = cfg._get_view(data, 'test1', TestConfig)
+
+    assert isinstance(m.a, dict)
+    assert isinstance(m.a['hosts'], list)
+    assert m.a.hosts[0].name == 'x'
+
+    assert json.loads(m.json()) == {'a': {'hosts': [{'name': 'x', 'tags': ['p', 'q']}]}}
+
+    yaml = pytest.importorskip('yaml')
+
+    assert yaml.safe_load(yaml.safe_dump(m.dict())) == json.loads(m.json())
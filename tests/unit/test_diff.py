@@ -0,0 +1,213 @@
+"""
+Tests for configuration differences and selective proxy updates.
+
+"""
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config import Config
+from rjgtoys.config._diff import config_diff
+from rjgtoys.config._index import ConfigIndex
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._ops import config_normalise
+from rjgtoys.config._proxy import ConfigProxy
+
+
+def indexed(**kwargs):
+    return ConfigIndex(config_normalise(Thing(kwargs)))
+
+
+def test_diff_paths():
+    """Changed, added and removed values are reported by their paths."""
+
+    old = indexed(a=Thing(b=1, c=2), d=[1, 2], e='same', gone=1)
+    new = indexed(a=Thing(b=1, c=3), d=[1, 2, 3], e='same', added=Thing(x=1))
+
+    changes = config_diff(old, new)
+
+    assert changes.old is old.data
+    assert changes.new is new.data
+
+    for path in ('a', 'a.c', 'd', 'gone', 'added', 'added.x'):
+        assert changes.affects(path)
+
+    assert not changes.affects('a.b')
+    assert not changes.affects('e')
+    assert not changes.affects('missing')
+
+    assert changes.affects_any(['e', 'a.c'])
+    assert not changes.affects_any(['e', 'a.b'])
+
+
+def test_diff_defaults():
+    """Values are compared with defaults applied."""
+
+    old = indexed(a=1, b=Thing(c=1), defaults=Thing(b=Thing(c=1, d=1), e=1))
+    new = indexed(a=1, b=Thing(c=1), defaults=Thing(b=Thing(c=2, d=2), e=1))
+
+    changes = config_diff(old, new)
+
+    # b.c is hidden by the value in the top layer
+
+    assert not changes.affects('b.c')
+    assert changes.affects('b.d')
+    assert changes.affects('b')
+    assert not changes.affects('e')
+
+
+def test_diff_views():
+    """A change to the view mapping for a proxy is reported."""
+
+    old = indexed(__view__=Thing(v=Thing(x='a.b'), w=Thing(y='c')))
+    new = indexed(__view__=Thing(v=Thing(x='a.c'), w=Thing(y='c')))
+
+    changes = config_diff(old, new)
+
+    assert changes.affects('__view__.v')
+    assert not changes.affects('__view__.w')
+    assert changes.affects('__view__.missing') is False
+
+
+def test_diff_views_in_defaults():
+    """A change to the view mapping for a proxy in a layer of defaults is reported."""
+
+    old = indexed(__view__=Thing(v=Thing(a='z')), defaults=Thing(__view__=Thing(v=Thing(a='x'))))
+    new = indexed(__view__=Thing(v=Thing(a='z')), defaults=Thing(__view__=Thing(v=Thing(a='y'))))
+
+    changes = config_diff(old, new)
+
+    assert changes.affects('__view__.v')
+
+    # Moving a mapping into the defaults is a change too
+
+    moved = indexed(defaults=Thing(__view__=Thing(v=Thing(a='z'))))
+
+    assert config_diff(indexed(__view__=Thing(v=Thing(a='z'))), moved).affects('__view__.v')
+
+
+def test_selective_update_view_in_defaults(list_source):
+    """A proxy whose view mapping changes only in the defaults is rebuilt."""
+
+    class ValueModel(Config):
+        a: int
+
+    cfg = ConfigProxy(ValueModel, name='v')
+
+    ConfigManager.source = list_source(
+        Thing(__view__=Thing(v=Thing(a='z')), defaults=Thing(x=1, y=2, __view__=Thing(v=Thing(a='x')))),
+        Thing(__view__=Thing(v=Thing(a='z')), defaults=Thing(x=1, y=2, __view__=Thing(v=Thing(a='y'))))
+    )
+
+    ConfigManager.load(always=True)
+    assert cfg.a == 1
+
+    ConfigManager.load(always=True)
+
+    assert ConfigManager.update_stats() == dict(rebuilt=1, skipped=0)
+    assert cfg.a == 2
+
+
+def test_diff_shared():
+    """Identical data has no differences."""
+
+    old = indexed(a=Thing(b=1), __view__=Thing(v=Thing(x='a.b')))
+
+    assert not config_diff(old, old).affects_any(['a', 'a.b', '__view__.v'])
+
+    changes = config_diff(old, indexed(a=Thing(b=1), __view__=Thing(v=Thing(x='a.b'))))
+
+    assert not changes.affects_any(['a', 'a.b', '__view__.v'])
+
+
+def test_selective_update(server_model, client_model, list_source):
+    """Only the proxies affected by a change are rebuilt."""
+
+    server = ConfigProxy(server_model, name='server')
+    client = ConfigProxy(client_model, name='client')
+
+    view = Thing(server=Thing(host='srv.host', port='srv.port'))
+
+    ConfigManager.source = list_source(
+        Thing(srv=Thing(host='a', port=1), retries=3, __view__=view),
+        Thing(srv=Thing(host='b', port=1), retries=3, __view__=view),
+        Thing(srv=Thing(host='b', port=1), retries=3, __view__=view),
+        Thing(srv=Thing(host='b', port=1), retries=3,
+              __view__=Thing(server=Thing(host='srv.host', port='srv.port'), client=Thing()))
+    )
+
+    ConfigManager.load(always=True)
+
+    assert ConfigManager.update_stats() == dict(rebuilt=2, skipped=0)
+
+    client_value = client._value
+
+    ConfigManager.load(always=True)
+
+    assert ConfigManager.update_stats() == dict(rebuilt=1, skipped=1)
+    assert server.host == 'b'
+    assert client._value is client_value
+
+    ConfigManager.load(always=True)
+
+    assert ConfigManager.update_stats() == dict(rebuilt=0, skipped=2)
+
+    # A change to a view counts as a change to the proxy's inputs
+
+    ConfigManager.load(always=True)
+
+    assert ConfigManager.update_stats() == dict(rebuilt=1, skipped=1)
+    assert client.retries == 3
+
+
+def test_unchanged_view_not_revalidated(server_model, list_source):
+    """A proxy whose view is rebuilt, but comes out the same, keeps its value."""
+
+    server = ConfigProxy(server_model, name='server')
+
+    view = Thing(server=Thing(host='srv.host', port='srv.port'))
+
+    moved = Thing(server=Thing(host='alt.host', port='srv.port'))
+
+    ConfigManager.source = list_source(
+        Thing(srv=Thing(host='a', port=1), __view__=view),
+        Thing(srv=Thing(host='a', port=1), alt=Thing(host='a'), __view__=moved),
+        Thing(srv=Thing(host='b', port=1), __view__=view)
+    )
+
+    ConfigManager.load(always=True)
+    ConfigManager.validation_stats(reset=True)
+
+    value = server._value
+
+    # The view mapping has changed, but the view it makes hasn't
+
+    ConfigManager.load(always=True)
+
+    assert ConfigManager.update_stats() == dict(rebuilt=1, skipped=0)
+    assert ConfigManager.validation_stats() == dict(validated=0, reused=1, trusted=0)
+    assert server._value is value
+
+    ConfigManager.load(always=True)
+
+    assert ConfigManager.validation_stats(reset=True) == dict(validated=1, reused=1, trusted=0)
+    assert server.host == 'b'
+    assert ConfigManager.validation_stats() == dict(validated=0, reused=0, trusted=0)
+
+
+def test_attach_counted(server_model, list_source):
+    """A proxy that is made after the data is loaded is counted when it's updated."""
+
+    view = Thing(server=Thing(host='srv.host', port='srv.port'))
+
+    ConfigManager.source = list_source(Thing(srv=Thing(host='a', port=1), retries=3, __view__=view))
+
+    ConfigManager.load(always=True)
+    ConfigManager.validation_stats(reset=True)
+
+    assert ConfigManager.update_stats() == dict(rebuilt=0, skipped=0)
+
+    server = ConfigProxy(server_model, name='server')
+
+    assert ConfigManager.update_stats() == dict(rebuilt=1, skipped=0)
+    assert ConfigManager.validation_stats() == dict(validated=1, reused=0, trusted=0)
+    assert server.host == 'a'
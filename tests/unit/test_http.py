@@ -0,0 +1,153 @@
+"""
+Tests for fetching configuration over HTTP.
+
+"""
+
+import http.server
+import json
+import threading
+
+import pytest
+
+from rjgtoys.config._http import HttpConfigSource, ConfigFetchFailed
+
+
+class ConfigServer(http.server.ThreadingHTTPServer):
+    """A stand-in for a configuration service."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ConfigHandler)
+        self.document = dict(a=1)
+        self.content_type = 'application/json'
+        self.version = 1
+        self.requests = []
+        self.connections = set()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/config" % (self.server_address[1],)
+
+
+class ConfigHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        server.connections.add(self.client_address)
+
+        etag = '"v%d"' % (server.version,)
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = server.document
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', server.content_type)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+
+    server = ConfigServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_conditional(server):
+    """An unchanged document is not transferred again, and the connection is reused."""
+
+    source = HttpConfigSource(server.url)
+
+    first = source.fetch()
+    assert first == dict(a=1)
+    assert first.a == 1
+    assert source.last_result == 'fetched'
+
+    assert source.fetch() is first
+    assert source.last_result == 'not-modified'
+    assert server.requests[-1]['If-None-Match'] == '"v1"'
+
+    server.document = dict(a=2)
+    server.version = 2
+
+    assert source.fetch() == dict(a=2)
+    assert source.last_result == 'fetched'
+
+    assert len(server.connections) == 1
+
+    source.close()
+
+
+def test_http_fallback_to_disk(server, tmp_path):
+    """A program can start from the saved copy when the server is down."""
+
+    cache_path = str(tmp_path / 'config.cache')
+
+    HttpConfigSource(server.url, cache_path=cache_path).fetch()
+
+    url = server.url
+    server.shutdown()
+    server.server_close()
+
+    source = HttpConfigSource(url, cache_path=cache_path, timeout=1)
+
+    assert source.fetch() == dict(a=1)
+    assert source.last_result == 'cached'
+
+
+def test_http_startup_revalidates(server, tmp_path):
+    """At startup, the saved copy is revalidated rather than fetched again."""
+
+    cache_path = str(tmp_path / 'config.cache')
+
+    HttpConfigSource(server.url, cache_path=cache_path).fetch()
+
+    source = HttpConfigSource(server.url, cache_path=cache_path)
+
+    assert source.fetch() == dict(a=1)
+    assert source.last_result == 'not-modified'
+
+
+def test_http_failure(server):
+    """Without a saved copy, failure is reported."""
+
+    url = server.url
+    server.shutdown()
+    server.server_close()
+
+    with pytest.raises(ConfigFetchFailed):
+        HttpConfigSource(url, timeout=1).fetch()
+
+
+@pytest.mark.parametrize('document', [
+    b'a: !include /etc/hostname\n',
+    b'a: !!python/object/apply:os.getpid []\n',
+])
+def test_http_untrusted(server, document):
+    """A YAML response can't read local files or run code."""
+
+    server.document = document
+    server.content_type = 'application/yaml'
+
+    with pytest.raises(ConfigFetchFailed):
+        HttpConfigSource(server.url).fetch()
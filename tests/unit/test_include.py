@@ -0,0 +1,95 @@
+"""
+Tests for included files in defaults.
+
+"""
+
+import pytest
+
+from rjgtoys.config._include import IncludeCache, ConfigIncludeCycle
+from rjgtoys.config._ops import config_normalise
+from rjgtoys.config._source import YamlFileConfigSource, SearchPathConfigSource
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def test_include_defaults(tmp_path):
+    """Files named in defaults are included, relative to the including file."""
+
+    write(tmp_path / 'common' / 'base.yaml', """
+defaults: [more.yaml]
+a: base
+b: base
+""")
+    write(tmp_path / 'common' / 'more.yaml', """
+a: more
+b: more
+c: more
+""")
+    main = write(tmp_path / 'main.yaml', """
+defaults:
+  - common/base.yaml
+  - {b: inline}
+a: main
+""")
+
+    includes = IncludeCache()
+    src = YamlFileConfigSource(str(main), includes=includes)
+
+    data = config_normalise(src.fetch())
+
+    assert (data.a, data.defaults.a, data.defaults.b) == ('main', 'base', 'inline')
+    assert data.defaults.defaults.c == 'more'
+
+    assert sorted(src.watch_paths()) == sorted(
+        str(p.resolve()) for p in (main, tmp_path / 'common' / 'base.yaml', tmp_path / 'common' / 'more.yaml')
+    )
+
+    # Nothing is parsed again if it hasn't changed
+
+    misses = includes.misses
+    src.fetch()
+    assert includes.misses == misses
+
+
+def test_include_shared(tmp_path):
+    """A file included from several places is read once."""
+
+    write(tmp_path / 'shared.yaml', "s: 1\n")
+    for name in 'abc':
+        write(tmp_path / f"{name}.yaml", f"defaults: shared.yaml\n{name}: 1\n")
+    main = write(tmp_path / 'main.yaml', "defaults: [a.yaml, b.yaml, c.yaml]\n")
+
+    includes = IncludeCache()
+
+    data = config_normalise(YamlFileConfigSource(str(main), includes=includes).fetch())
+
+    assert (data.defaults.a, data.defaults.b, data.defaults.c) == (1, 1, 1)
+    assert data.defaults.defaults.s == 1
+    assert includes.misses == 4
+
+
+def test_include_cycle(tmp_path):
+    """A file that includes itself is an error."""
+
+    write(tmp_path / 'a.yaml', "defaults: [b.yaml]\n")
+    write(tmp_path / 'b.yaml', "defaults: a.yaml\n")
+    main = write(tmp_path / 'main.yaml', "defaults: [a.yaml]\n")
+
+    with pytest.raises(ConfigIncludeCycle):
+        YamlFileConfigSource(str(main), includes=IncludeCache()).fetch()
+
+
+def test_include_search(tmp_path):
+    """Included files are watched when found by a search."""
+
+    write(tmp_path / 'inc.yaml', "x: 1\n")
+    main = write(tmp_path / 'main.yaml', "defaults: inc.yaml\n")
+
+    src = SearchPathConfigSource(str(tmp_path / 'missing.yaml'), str(main))
+
+    assert src.fetch().defaults[0] == dict(x=1)
+    assert str((tmp_path / 'inc.yaml').resolve()) in src.watch_paths()
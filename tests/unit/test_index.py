@@ -0,0 +1,235 @@
+"""
+Tests for the path index
+"""
+
+import sys
+
+import pytest
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config import Config
+from rjgtoys.config._index import ConfigIndex
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._ops import config_normalise, config_resolve
+from rjgtoys.config._proxy import ConfigProxy
+from rjgtoys.config._source import ConfigSource
+
+
+def test_index_paths():
+    """All paths are indexed, including those through dotted keys."""
+
+    index = ConfigIndex(config_normalise(Thing({
+        'a': {'b': {'c': 1}},
+        'x.y': {'z': 2},
+        'p': {'q.r': 3}
+    })))
+
+    assert index['a'] == {'b': {'c': 1}}
+    assert index['a.b.c'] == 1
+    assert index['x.y.z'] == 2
+    assert index['p.q.r'] == 3
+
+    assert 'a.b.d' not in index
+    assert index.defaults is None
+
+
+def test_index_preference():
+    """Where a path can be reached in more than one way, the old preference applies."""
+
+    index = ConfigIndex(config_normalise(Thing({
+        'a.b.c': 'whole',
+        'a': {'b': {'c': 'split'}, 'b.c': 'first-split'},
+        'a.b': {'c': 'second-split'},
+        'p': {'q': {'r': 'shortest'}},
+        'p.q': {'r': 'longer'},
+    })))
+
+    assert index['a.b.c'] == 'whole'
+    assert index['p.q.r'] == 'shortest'
+
+
+def test_index_no_dead_ends():
+    """A path is found even if the shortest key doesn't lead to it."""
+
+    index = ConfigIndex(config_normalise(Thing({
+        'x': {'a': {'other': 0}},
+        'x.a': {'b': 'found'}
+    })))
+
+    assert index['x.a.b'] == 'found'
+
+
+def test_index_recursive():
+    """Recursive structures don't cause trouble."""
+
+    loop = Thing(v=1)
+    loop.self = loop
+
+    index = ConfigIndex(config_normalise(Thing(loop=loop)))
+
+    assert index['loop.v'] == 1
+    assert index['loop.self'] is loop
+
+
+def test_index_defaults():
+    """Defaults are indexed separately."""
+
+    index = ConfigIndex(config_normalise(Thing({
+        'a': 1,
+        'defaults': {'b': {'c': 2}}
+    })))
+
+    assert 'b.c' not in index
+    assert index.defaults['b.c'] == 2
+
+
+def test_view_dotted_key():
+    """A view can refer to a value under a key that contains a dot."""
+
+    class TestConfig(Config):
+        host: str
+
+    data = config_normalise(Thing({
+        '__view__': {'test1': {'host': 'servers.db.primary.host'}},
+        'servers': {'db.primary': {'host': 'db1'}, 'db': {'backup': {'host': 'db2'}}}
+    }))
+
+    cfg = ConfigProxy(TestConfig)
+
+    assert cfg._get_view(data, 'test1', TestConfig).host == 'db1'
+
+
+def test_index_get_many():
+    """Many paths can be looked up at once, with defaults applied."""
+
+    index = ConfigIndex(config_normalise(Thing({
+        'route': {'a': {'port': 1}, 'b': 'direct'},
+        'timeout': 5,
+        'defaults': [
+            {'route': {'a': {'host': 'x'}, 'b': {'host': 'y'}}, 'retries': 3},
+            {'timeout': 10, 'route': {'c': {'host': 'z'}}}
+        ]
+    })))
+
+    paths = ['route.a', 'route.a.host', 'route.b', 'route.c.host', 'timeout', 'retries', 'missing']
+
+    result = index.get_many(paths + ['route.a'])
+
+    assert result == {
+        'route.a': {'port': 1, 'host': 'x'},
+        'route.a.host': 'x',
+        'route.b': 'direct',
+        'route.c.host': 'z',
+        'timeout': 5,
+        'retries': 3
+    }
+
+    for path in paths:
+        if path in result:
+            assert index.get_defaulted(path) == result[path]
+
+    with pytest.raises(KeyError):
+        index.get_defaulted('missing')
+
+
+def test_index_scalar_hides_paths_below():
+    """A value that isn't a mapping hides the paths beneath a default mapping."""
+
+    data = config_normalise(Thing({
+        'a': 5,
+        'b': {'c': 'x'},
+        'defaults': {'a': {'b': 2}, 'b': {'c': {'d': 1}, 'e': 3}}
+    }))
+
+    index = ConfigIndex(data)
+
+    assert index.get_defaulted('a') == 5
+
+    with pytest.raises(KeyError):
+        index.get_defaulted('a.b')
+
+    with pytest.raises(KeyError):
+        index.get_defaulted('b.c.d')
+
+    assert index.get_many(['a', 'a.b', 'b.c', 'b.e']) == {'a': 5, 'b.c': 'x', 'b.e': 3}
+
+    assert config_resolve(data)['a'] == 5
+
+
+def test_manager_get_many(tmp_path):
+    """The manager loads the data to look up paths."""
+
+    path = tmp_path / 'app.yaml'
+    path.write_text("a: {b: 1}\ndefaults: {a: {c: 2}, d: 3}\n")
+
+    ConfigManager.set_path(str(path))
+
+    assert ConfigManager.get_many(['a', 'a.c', 'd', 'e']) == {
+        'a': {'b': 1, 'c': 2},
+        'a.c': 2,
+        'd': 3
+    }
+
+    # The values are shared, so they can't be changed
+
+    with pytest.raises(TypeError):
+        ConfigManager.get_many(['a'])['a']['b'] = 99
+
+    assert ConfigManager.get_many(['a.b']) == {'a.b': 1}
+
+
+def test_index_flatten():
+    """The chain of defaults is flattened once, and values are remembered."""
+
+    index = ConfigIndex(config_normalise(Thing({
+        'a': {'b': 1},
+        'c': 'top',
+        'defaults': Thing({
+            'a': {'d': 2},
+            'c': {'hidden': True},
+            'defaults': {'a': {'e': 3}, 'f': 4}
+        })
+    })))
+
+    flat = index.flatten()
+
+    assert index.flatten() is flat
+    assert flat['c'] == ('top',)
+    assert flat['f'] == (4,)
+    assert [dict(v) for v in flat['a']] == [{'b': 1}, {'d': 2}, {'e': 3}]
+
+    # The layers below have their own tables, made along the way
+
+    assert index.defaults._flat['a'] == flat['a'][1:]
+
+    a = index.get_defaulted('a')
+
+    assert a == {'b': 1, 'd': 2, 'e': 3}
+    assert index.get_defaulted('a') is a
+    assert index.defaults.get_defaulted('a') == {'d': 2, 'e': 3}
+
+
+def test_manager_deep_defaults():
+    """Defaults nested deeper than the recursion limit can be loaded and used."""
+
+    class DeepSource(ConfigSource):
+        def fetch(self):
+            data = Thing(n=0, leaf='bottom')
+            for i in range(1, depth):
+                data = Thing(n=i, defaults=data)
+            return data
+
+    class DeepModel(Config):
+        n: int
+        leaf: str
+
+    depth = sys.getrecursionlimit() + 100
+
+    cfg = ConfigProxy(DeepModel, name='test.deep')
+
+    ConfigManager.source = DeepSource()
+    ConfigManager.load(always=True)
+
+    assert cfg.n == depth - 1
+    assert cfg.leaf == 'bottom'
@@ -0,0 +1,78 @@
+"""
+Tests for lazy updating of proxies
+"""
+
+import pytest
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._manager import ConfigManager, ConfigUpdateError
+from rjgtoys.config._proxy import ConfigProxy
+
+
+VIEW = Thing(server=Thing(host='srv.host', port='srv.port'))
+
+
+@pytest.fixture(autouse=True)
+def lazy_manager():
+    """Run each test with the manager in lazy mode; the shared
+    fixture puts it back."""
+
+    ConfigManager.set_lazy()
+
+
+def test_lazy_update(server_model, client_model, list_source):
+    """Proxies are updated when they are first used after each load."""
+
+    server = ConfigProxy(server_model, name='server')
+    client = ConfigProxy(client_model, name='client')
+
+    ConfigManager.source = list_source(
+        Thing(srv=Thing(host='a', port=1), retries=3, __view__=VIEW),
+        Thing(srv=Thing(host='b', port=1), retries=3, __view__=VIEW)
+    )
+
+    ConfigManager.load(always=True)
+    ConfigManager.validation_stats(reset=True)
+
+    assert server._value is None
+    assert client._value is None
+
+    assert server.host == 'a'
+    assert client._value is None
+
+    assert ConfigManager.update_stats() == dict(rebuilt=1, skipped=0)
+    assert ConfigManager.validation_stats() == dict(validated=1, reused=0, trusted=0)
+
+    ConfigManager.load(always=True)
+
+    assert server._value.host == 'a'
+    assert server.host == 'b'
+
+
+def test_lazy_errors(server_model, client_model, list_source):
+    """Errors are reported by the first use, or by validate_all."""
+
+    server = ConfigProxy(server_model, name='server')
+    client = ConfigProxy(client_model, name='client')
+
+    ConfigManager.source = list_source(
+        Thing(srv=Thing(host='a', port='bad'), __view__=VIEW)
+    )
+
+    ConfigManager.load(always=True)
+
+    with pytest.raises(ConfigUpdateError) as e:
+        server.host
+
+    assert [p for (p, _) in e.value.errors] == [server]
+
+    # It's still stale, and fails again
+
+    with pytest.raises(ConfigUpdateError):
+        server.port
+
+    with pytest.raises(ConfigUpdateError) as e:
+        ConfigManager.validate_all()
+
+    assert {p for (p, _) in e.value.errors} == {server, client}
@@ -0,0 +1,128 @@
+"""
+Tests for frozen configuration data.
+
+"""
+
+import pickle
+
+import pytest
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._node import ConfigNode, config_freeze, config_thaw
+
+
+def test_freeze_copies():
+    """Freezing makes a read-only copy, leaving the original alone."""
+
+    data = Thing(a=Thing(b=[1, Thing(c=2)]), d='x')
+
+    frozen = config_freeze(data)
+
+    assert frozen == dict(a=dict(b=(1, dict(c=2))), d='x')
+    assert isinstance(frozen, ConfigNode)
+    assert isinstance(frozen.a.b[1], ConfigNode)
+
+    with pytest.raises(TypeError):
+        frozen.a.x = 1
+
+    with pytest.raises(TypeError):
+        frozen.a.b[1].update(c=3)
+
+    data.a.b[1].c = 3
+
+    assert frozen.a.b[1].c == 2
+    assert isinstance(data.a, Thing) and not isinstance(data.a, ConfigNode)
+
+
+def test_freeze_shares():
+    """Shared data stays shared, and frozen data isn't copied again."""
+
+    shared = Thing(x=1, y=Thing(z=2))
+    data = Thing(a=shared, b=[shared])
+
+    frozen = config_freeze(data)
+
+    assert frozen.a is frozen.b[0]
+    assert config_freeze(frozen) is frozen
+
+    memo = {}
+    assert config_freeze(shared, memo) is config_freeze(Thing(s=shared), memo).s
+
+
+def test_freeze_recursive():
+    """A structure that contains itself can be frozen."""
+
+    data = Thing(a=1)
+    data.me = data
+
+    frozen = config_freeze(data)
+
+    assert frozen.a == 1
+    assert frozen.me is data
+
+
+def test_node_pickle():
+    """Frozen data can be pickled."""
+
+    frozen = config_freeze(Thing(a=Thing(b=1)))
+
+    copy = pickle.loads(pickle.dumps(frozen))
+
+    assert copy == frozen
+    assert isinstance(copy.a, ConfigNode)
+
+
+def test_node_mapping():
+    """A node behaves like a read-only Thing."""
+
+    node = ConfigNode({'a': 1, 'b': Thing(c=2), 'x.y': 3, '__view__': 4})
+
+    assert node == dict(a=1, b=dict(c=2), **{'x.y': 3, '__view__': 4})
+    assert dict(a=1, b=dict(c=2), **{'x.y': 3, '__view__': 4}) == node
+    assert len(node) == 4
+    assert list(node) == ['a', 'b', 'x.y', '__view__']
+    assert list(node.items())[0] == ('a', 1)
+    assert list(node.values())[0] == 1
+    assert 'a' in node and 'z' not in node
+    assert node.get('z', 5) == 5
+
+    assert node.a == 1
+    assert node.__view__ == 4
+    assert node['b.c'] == 2
+    assert node['x.y'] == 3
+
+    with pytest.raises(KeyError):
+        node['b.d']
+
+    with pytest.raises(AttributeError):
+        node.z
+
+
+def test_node_shares_keys():
+    """Nodes with the same keys share them."""
+
+    a = ConfigNode(dict(host='a', port=1))
+    b = ConfigNode(dict(host='b', port=2))
+
+    assert a._shape is b._shape
+    assert ConfigNode(dict(port=1, host='a'))._shape is not a._shape
+
+
+def test_thaw():
+    """Thawing makes an ordinary copy, in which shared data stays shared."""
+
+    shared = Thing(x=1, y=[2, 3])
+    frozen = config_freeze(Thing(a=shared, b=[shared, 'c']))
+
+    thawed = config_thaw(frozen)
+
+    assert thawed == dict(a=dict(x=1, y=[2, 3]), b=[dict(x=1, y=[2, 3]), 'c'])
+    assert isinstance(thawed, Thing) and isinstance(thawed.a, Thing)
+    assert isinstance(thawed.b, list) and isinstance(thawed.a.y, list)
+    assert thawed.a is thawed.b[0]
+
+    thawed.a.x = 5
+
+    assert frozen.a.x == 1
+    assert config_thaw('plain') == 'plain'
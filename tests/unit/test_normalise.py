@@ -1,6 +1,15 @@
 
+import gc
+import sys
+import tracemalloc
+
+import pytest
+
 from rjgtoys.thing import Thing
-from rjgtoys.config._ops import config_normalise, normalise_defaults
+
+from rjgtoys.config._node import config_freeze
+from rjgtoys.config._ops import config_normalise, normalise_defaults, _normalised_layers
+from rjgtoys.config._ops import config_merge, config_overlay
 
 def test_normalise_defaults_missing():
 
@@ -105,3 +114,202 @@ def test_config_normalise_merging():
                 'x.z': Thing(z='b')
         })
     )
+
+def test_config_normalise_leaves_raw_alone():
+    """Normalising doesn't modify its input, even where layers share data."""
+
+    shared = Thing(x=1, y=Thing(z=2))
+
+    data = Thing(
+        defaults=[
+            Thing(settings=shared, __view__=Thing(v=Thing(a='settings.x'))),
+            Thing(settings=Thing(y=Thing(z=3)))
+        ],
+        other=shared
+    )
+
+    result = config_normalise(data)
+
+    assert result.defaults.settings == dict(x=1, y=dict(z=3))
+    assert shared == dict(x=1, y=dict(z=2))
+
+def test_config_normalise_shares():
+    """Parts of the tree that don't change are shared, and copied only once."""
+
+    views = Thing(v=Thing(a='b'))
+    big = Thing(items=list(range(100)))
+
+    data = Thing(
+        defaults=Thing(__view__=views, big=big),
+        big=big
+    )
+
+    result = config_normalise(data)
+
+    assert result.__view__ is result.defaults.__view__
+    assert result.defaults.big is result.big
+
+def test_normalise_defaults_remembered():
+    """Defaults layers that have been seen before are not normalised again."""
+
+    shared = Thing(a=Thing(b=1), __view__=Thing(v=Thing(x='a.b')))
+    other = Thing(c=2)
+
+    first = config_normalise(Thing(top=1, defaults=[shared, other]))
+
+    hits = _normalised_layers.hits
+
+    # Equal content, but different objects
+
+    second = config_normalise(Thing(top=2, defaults=[Thing(shared), Thing(other)]))
+
+    assert _normalised_layers.hits == hits + 1
+    assert second.defaults is first.defaults
+
+    # A layer on its own has been seen too
+
+    third = config_normalise(Thing(defaults=Thing(c=2)))
+
+    assert third.defaults == dict(c=2, defaults={}, __view__={})
+    assert _normalised_layers.hits > hits + 1
+
+def test_normalise_nested_defaults_hashed_once(monkeypatch):
+    """Each layer of nested defaults is hashed once, and a change
+    deep within them is noticed."""
+
+    def nested(depth, leaf):
+        data = Thing(leaf=leaf)
+        for i in range(depth):
+            data = Thing(n=i, defaults=data)
+        return Thing(defaults=[data])
+
+    calls = []
+    key = _normalised_layers.key
+
+    def counted_key(*args, **kwargs):
+        calls.append(1)
+        return key(*args, **kwargs)
+
+    monkeypatch.setattr(_normalised_layers, 'key', counted_key)
+
+    first = config_normalise(nested(50, 'a'))
+
+    assert len(calls) == 51
+
+    second = config_normalise(nested(50, 'b'))
+
+    def leaf(data):
+        while 'leaf' not in data:
+            data = data.defaults
+        return data.leaf
+
+    assert leaf(first) == 'a'
+    assert leaf(second) == 'b'
+
+def test_normalise_deep():
+    """Deeply nested data and defaults don't exceed the recursion limit."""
+
+    depth = sys.getrecursionlimit() + 100
+
+    data = Thing(n=0)
+    for i in range(1, depth):
+        data = Thing(n=i, defaults=data)
+
+    result = config_normalise(data)
+
+    assert result.n == depth - 1
+    assert result.defaults.n == depth - 2
+
+    a = Thing(leaf='a')
+    b = Thing(leaf='b')
+    for i in range(depth):
+        a = Thing(child=a)
+        b = Thing(child=b, other=i)
+
+    merged = config_overlay(a, b)
+
+    assert merged.other == depth - 1
+
+    config_merge(a, b)
+
+    node = b
+    while 'child' in node:
+        node = node.child
+    assert node.leaf == 'a'
+
+
+def test_config_normalise_read_only():
+    """The normalised data can't be modified."""
+
+    data = Thing(a=Thing(b=[1, 2]), defaults=Thing(c=Thing(d=1)))
+
+    result = config_normalise(data)
+
+    with pytest.raises(TypeError):
+        result.a.b = 3
+
+    with pytest.raises(TypeError):
+        del result.defaults['c']
+
+    assert result.a.b == (1, 2)
+
+    data.a.b.append(3)
+
+    assert result.a.b == (1, 2)
+
+
+def _retained(intern):
+    """Return the memory held by normalised data that repeats a few strings many times."""
+
+    def records():
+        # Each string is a separate object, as if it had been parsed
+        return [
+            Thing(host='host-%d' % (i % 10), region='-'.join(('eu', 'west', '1')))
+            for i in range(5000)
+        ]
+
+    tracemalloc.start()
+    try:
+        result = config_normalise(Thing(servers=records()), intern=intern)
+        gc.collect()
+        (size, _) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return (size, result)
+
+def test_config_normalise_intern():
+    """Interning short strings makes the normalised data smaller."""
+
+    (plain, plain_result) = _retained(None)
+    (interned, interned_result) = _retained(64)
+
+    assert interned_result == plain_result
+
+    servers = interned_result.servers
+    assert servers[0].region is servers[1].region
+    assert servers[0].host is servers[10].host
+
+    assert interned < 0.75 * plain
+
+def test_config_normalise_intern_length():
+    """Only strings up to the given length are interned."""
+
+    def make(s):
+        # A new string each time, not a shared constant
+        return ''.join(list(s))
+
+    data = Thing(a=[make('xxx'), make('y' * 30)], b=Thing(c=make('xxx'), d=make('y' * 30)))
+
+    result = config_normalise(data, intern=8)
+
+    assert result.a[0] is sys.intern('xxx')
+    assert result.b.c is result.a[0]
+    assert result.b.d is not result.a[1]
+
+    # Data that's already frozen, as parsed data is, is interned too
+
+    result = config_normalise(config_freeze(data), intern=8)
+
+    assert result.a[0] is sys.intern('xxx')
+    assert result.b.c is result.a[0]
@@ -0,0 +1,138 @@
+"""
+Tests for the configuration file format registry.
+
+"""
+
+import pytest
+
+from rjgtoys.yaml import yaml_load_path
+
+from rjgtoys.config._node import ConfigNode, config_freeze
+from rjgtoys.config._parsers import config_load_path, config_loads, find_format, _yaml_load_path
+
+
+YAML_SCALARS = """
+---
+plain_yes: yes
+decimal: 012
+octal: 0o17
+hex: 0x1f
+underscored: 1_000
+float: 1.5e+3
+infinity: -.inf
+nothing: ~
+empty:
+date: 2020-01-01
+stamp: 2001-12-14t21:59:43.10-05:00
+quoted: '12'
+anchored: &anchor {p: 1}
+alias: *anchor
+merged: {<<: *anchor, q: 2}
+listed: [1, two, null, true]
+"""
+
+
+def test_yaml_parsers_agree(tmp_path):
+    """The libyaml parser (if present) produces the same tree as rjgtoys.yaml,
+    but read-only."""
+
+    path = tmp_path / 'scalars.yaml'
+    path.write_text(YAML_SCALARS)
+
+    fast = _yaml_load_path(str(path))
+
+    assert fast == config_freeze(yaml_load_path(str(path)))
+    assert isinstance(fast, ConfigNode)
+    assert isinstance(fast.merged, ConfigNode)
+    assert fast.listed == (1, 'two', None, True)
+
+
+def test_yaml_include(tmp_path):
+    """The !include tag is supported, relative to the including file."""
+
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'part.json').write_text('{"x": 1}')
+    (tmp_path / 'main.yaml').write_text("part: !include sub/part.json\n")
+
+    assert config_load_path(str(tmp_path / 'main.yaml')) == dict(part=dict(x=1))
+
+
+@pytest.mark.parametrize('name, text, fmt', [
+    ('app.yaml', 'a: 1\n', 'yaml'),
+    ('app.json', '{"a": 1}', 'json'),
+    ('app.toml', 'a = 1\n', 'toml'),
+    ('app.conf', '  {"a": 1}', 'json'),
+    ('app.conf', '# comment\n\n[server]\nport = 1\n', 'toml'),
+    ('app.conf', 'a: 1\n', 'yaml'),
+    ('app.conf', '[server]\n', 'yaml'),
+    ('app.conf', '[server]\n- not toml\n', 'yaml'),
+])
+def test_find_format(tmp_path, name, text, fmt):
+
+    path = tmp_path / name
+    path.write_text(text)
+
+    assert find_format(str(path)) == fmt
+
+
+@pytest.mark.parametrize('name, text', [
+    ('app.yaml', 'server: {host: example.com, ports: [1, 2]}\n'),
+    ('app.json', '{"server": {"host": "example.com", "ports": [1, 2]}}'),
+    ('app.toml', '[server]\nhost = "example.com"\nports = [1, 2]\n'),
+])
+def test_formats_agree(tmp_path, name, text):
+    """Every format produces the same read-only tree."""
+
+    path = tmp_path / name
+    path.write_text(text)
+
+    data = config_load_path(str(path))
+
+    assert data == dict(server=dict(host='example.com', ports=(1, 2)))
+    assert data.server.host == 'example.com'
+    assert isinstance(data.server, ConfigNode)
+    assert config_freeze(data) is data
+
+
+@pytest.mark.parametrize('text, media_type', [
+    (b'server: {host: example.com, ports: [1, 2]}\n', 'application/yaml'),
+    (b'{"server": {"host": "example.com", "ports": [1, 2]}}', 'application/json; charset=utf-8'),
+    (b'{"server": {"host": "example.com", "ports": [1, 2]}}', None),
+    (b'[server]\nhost = "example.com"\nports = [1, 2]\n', 'text/plain'),
+])
+def test_config_loads(text, media_type):
+    """Data can be parsed from bytes, identified by media type or sniffing."""
+
+    data = config_loads(text, media_type)
+
+    assert data == dict(server=dict(host='example.com', ports=(1, 2)))
+    assert data.server.host == 'example.com'
+
+
+@pytest.mark.parametrize('text', [
+    b'a: !include other.yaml\n',
+    b'a: !!python/object/apply:os.getpid []\n',
+])
+def test_config_loads_safe(text):
+    """Untrusted data can't include files or construct objects."""
+
+    with pytest.raises(Exception):
+        config_loads(text, 'application/yaml', safe=True)
+
+    assert config_loads(b'a: {b: [1, 2]}\n', 'application/yaml', safe=True) == dict(a=dict(b=(1, 2)))
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{name: Bob, port: 80}\n', dict(name='Bob', port=80)),
+    ('[server]\n', ('server',)),
+    ('{"name": "Bob"}', dict(name='Bob')),
+    ('[server]\nport = 1\n', dict(server=dict(port=1))),
+])
+def test_sniffed_yaml(tmp_path, text, expected):
+    """YAML that looks like another format is still read as YAML."""
+
+    path = tmp_path / 'app.conf'
+    path.write_text(text)
+
+    assert config_load_path(str(path)) == expected
+    assert config_loads(text.encode('utf-8')) == expected
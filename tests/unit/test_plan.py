@@ -0,0 +1,68 @@
+"""
+Tests for view plans
+"""
+
+from rjgtoys.thing import Thing
+
+from rjgtoys.config import Config
+from rjgtoys.config._ops import config_normalise
+from rjgtoys.config._plan import get_view_plan
+from rjgtoys.config._proxy import ConfigProxy
+
+
+class PlanModel(Config):
+
+    host: str
+    port: int = 80
+
+
+def test_plan_mapping():
+    """Fields not mentioned by the view come from their own names."""
+
+    data = config_normalise(Thing({
+        '__view__': {'test.plan': {'host': 'servers.db.host'}}
+    }))
+
+    plan = get_view_plan(PlanModel, 'test.plan', data)
+
+    assert plan.fields == ('host', 'port')
+    assert plan.mapping == {'host': 'servers.db.host', 'port': 'port'}
+    assert plan.paths == {'servers.db.host', 'port'}
+    assert plan.keys == {'servers', 'servers.db', 'servers.db.host', 'port'}
+
+
+def test_plan_remembered(monkeypatch):
+    """A plan is made once for each view, and the schema is not consulted again."""
+
+    class CountedModel(Config):
+        value: int
+
+    calls = []
+    schema = CountedModel.schema
+
+    def counted_schema(*args, **kwargs):
+        calls.append(1)
+        return schema(*args, **kwargs)
+
+    monkeypatch.setattr(CountedModel, 'schema', counted_schema)
+
+    def load(view, value):
+        return config_normalise(Thing({'__view__': {'test.counted': view}, 'x': value, 'y': value + 1}))
+
+    cfg = ConfigProxy(CountedModel, name='test.counted')
+
+    for value in range(3):
+        # Equal views, but different objects each time
+        data = load({'value': 'x'}, value)
+        assert get_view_plan(CountedModel, 'test.counted', data) is \
+            get_view_plan(CountedModel, 'test.counted', load({'value': 'x'}, 0))
+        cfg.update(data)
+        assert cfg._value.value == value
+
+    # A changed view gets a new plan
+
+    data = load({'value': 'y'}, 5)
+    cfg.update(data)
+    assert cfg._value.value == 6
+
+    assert len(calls) == 1
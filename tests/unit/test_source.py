@@ -11,7 +11,12 @@ import pytest
 
 from rjgtoys.config import Config
 from rjgtoys.config._proxy import ConfigProxy
-from rjgtoys.config._source import ConfigSearchFailed
+from rjgtoys.thing import Thing
+
+from rjgtoys.config._source import (
+    ConfigSource, ConfigSearchFailed, YamlFileConfigSource,
+    SearchPathConfigSource, LayeredConfigSource, EnvironmentConfigSource
+)
 
 
 def test_use_default_search():
@@ -48,3 +53,167 @@ def test_use_default_search():
     assert e.value.paths == expect_paths
 
 
+
+def test_search_memoises_missing(tmp_path):
+    """Missing candidates are not probed again until their directory changes."""
+
+    missing = tmp_path / 'a' / 'b' / 'app.conf'
+    fallback = tmp_path / 'fallback.conf'
+    fallback.write_text("a: 1\n")
+
+    source = SearchPathConfigSource(str(missing), str(fallback))
+
+    assert source.fetch() == dict(a=1)
+    assert source.stats() == dict(plans=1, probes=2, cached=0, validations=0)
+
+    assert source.fetch() == dict(a=1)
+    assert source.stats() == dict(plans=1, probes=3, cached=1, validations=1)
+
+    # Creating the missing file's directory invalidates the memo
+
+    missing.parent.mkdir(parents=True)
+    missing.write_text("a: 2\n")
+
+    assert source.fetch() == dict(a=2)
+    assert source.stats()['probes'] == 4
+
+
+def test_search_plan_follows_env(tmp_path):
+    """The search plan is recomputed when the environment changes."""
+
+    (tmp_path / 'one.conf').write_text("name: one\n")
+    (tmp_path / 'two.conf').write_text("name: two\n")
+
+    env = dict(app='one')
+
+    source = SearchPathConfigSource(
+        str(tmp_path / '{app}.conf'),
+        resolve=lambda p: p.format(**env),
+        env=lambda: env
+    )
+
+    assert source.fetch() == dict(name='one')
+    assert source.fetch() == dict(name='one')
+    assert source.stats()['plans'] == 1
+
+    env['app'] = 'two'
+
+    assert source.fetch() == dict(name='two')
+    assert source.stats()['plans'] == 2
+
+
+def test_search_plan_follows_cwd(tmp_path, monkeypatch):
+    """A relative candidate is looked for in the current directory."""
+
+    (tmp_path / 'here').mkdir()
+    (tmp_path / 'there').mkdir()
+    (tmp_path / 'there' / 'app.conf').write_text("a: 1\n")
+
+    monkeypatch.chdir(tmp_path / 'here')
+
+    source = SearchPathConfigSource('./app.conf')
+
+    with pytest.raises(ConfigSearchFailed):
+        source.fetch()
+
+    monkeypatch.chdir(tmp_path / 'there')
+
+    assert source.fetch() == dict(a=1)
+    assert source.stats()['plans'] == 2
+
+
+def test_layered_merges_in_order(tmp_path):
+    """Fragments are merged in sorted order, later ones overriding earlier ones."""
+
+    confd = tmp_path / 'app.conf.d'
+    confd.mkdir()
+
+    (confd / '10-base.yaml').write_text("db: {host: base, port: 1}\nname: base\n")
+    (confd / '20-site.yaml').write_text("db: {host: site}\n")
+    (confd / '30-empty.yaml').write_text("")
+    (confd / '90-host.json').write_text('{"name": "host"}')
+    (confd / 'README').write_text("not a fragment")
+
+    source = LayeredConfigSource(str(confd / '*.*'), max_workers=4)
+
+    assert source.fetch() == dict(
+        db=dict(host='site', port=1),
+        name='host'
+    )
+
+
+def test_layered_no_fragments(tmp_path):
+    """An empty directory provides no data."""
+
+    source = LayeredConfigSource(str(tmp_path / '*.yaml'))
+
+    assert source.fetch() == {}
+    assert source.watch_paths() == [str(tmp_path)]
+
+
+def test_environment_overlay(tmp_path):
+    """Environment variables override values from the underlying source."""
+
+    path = tmp_path / 'app.conf'
+    path.write_text("db: {host: file, port: 5432}\nname: file\n")
+
+    environ = {
+        'MYAPP__DB__HOST': 'env',
+        'MYAPP__LOG__LEVEL': 'debug',
+        'OTHER__NAME': 'ignored',
+    }
+
+    source = EnvironmentConfigSource('MYAPP', YamlFileConfigSource(str(path)), environ=environ)
+
+    data = source.fetch()
+
+    assert data == dict(
+        db=dict(host='env', port=5432),
+        log=dict(level='debug'),
+        name='file'
+    )
+    assert data.db.host == 'env'
+
+
+def test_environment_overlay_cached():
+    """The environment is only rescanned when it has changed."""
+
+    environ = {'MYAPP__A': '1'}
+
+    source = EnvironmentConfigSource('MYAPP', environ=environ)
+
+    first = source.overlay()
+    assert source.overlay() is first
+
+    environ['MYAPP__A'] = '2'
+    assert source.fetch() == dict(a='2')
+
+    environ['MYAPP__B__C'] = '3'
+    assert source.fetch() == dict(a='2', b=dict(c='3'))
+
+    # Swap one variable for another, leaving the number the same
+
+    del environ['MYAPP__A']
+    environ['MYAPP__D'] = '4'
+    assert source.fetch() == dict(b=dict(c='3'), d='4')
+
+    # A variable without the prefix doesn't matter
+
+    first = source.overlay()
+    environ['OTHER'] = '5'
+    assert source.overlay() is first
+
+
+def test_environment_overlay_leaves_source_alone():
+    """The underlying source's data is not modified."""
+
+    class StaticSource(ConfigSource):
+        def fetch(self):
+            return base
+
+    base = Thing(db=Thing(host='file'))
+
+    source = EnvironmentConfigSource('MYAPP', StaticSource(), environ={'MYAPP__DB__HOST': 'env'})
+
+    assert source.fetch() == dict(db=dict(host='env'))
+    assert base == dict(db=dict(host='file'))
@@ -0,0 +1,91 @@
+"""
+Tests for demand-driven loading of configuration data.
+
+"""
+
+import pytest
+
+from rjgtoys.config._proxy import ConfigProxy
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._parsers import config_load_path_subset
+
+
+CONFIG = """
+---
+unwanted: &big
+  - {a: 1, b: 2}
+  - {a: 3, b: 4}
+
+also.unwanted: {x: 1}
+
+srv:
+  host: example.com
+
+retries: 3
+
+defaults:
+  port: 80
+  __view__:
+    test.subset.server:
+      host: srv.host
+      port: port
+"""
+
+
+@pytest.mark.parametrize('name', ['app.yaml', 'app.json'])
+def test_subset_of_file(tmp_path, name):
+    """Only the wanted top-level entries, and defaults and views, are loaded."""
+
+    path = tmp_path / name
+    if name.endswith('.json'):
+        path.write_text('{"a": 1, "b": {"c": 2}, "__view__": {}, "d": [3]}')
+        expected = {'b': {'c': 2}, '__view__': {}}
+    else:
+        path.write_text("a: 1\nb: {c: 2}\n__view__: {}\nd: [3]\n")
+        expected = {'b': {'c': 2}, '__view__': {}}
+
+    seen = []
+
+    def wanted(partial):
+        seen.append(partial)
+        return {'b', 'x'}
+
+    assert config_load_path_subset(str(path), wanted) == expected
+    assert seen == [{'__view__': {}}]
+
+
+def test_subset_alias_to_unwanted(tmp_path):
+    """If a wanted entry refers to an unwanted one, the whole file is read."""
+
+    path = tmp_path / 'app.yaml'
+    path.write_text("a: &anchor {x: 1}\nb: *anchor\n")
+
+    assert config_load_path_subset(str(path), lambda partial: {'b'}) == {'b': {'x': 1}}
+
+
+def test_demand_driven_load(tmp_path, server_model, client_model):
+    """The manager loads only what the live proxies need."""
+
+    path = tmp_path / 'app.yaml'
+    path.write_text(CONFIG)
+
+    server = ConfigProxy(server_model, name='test.subset.server')
+
+    ConfigManager.set_path(str(path))
+    ConfigManager.set_demand_driven()
+    ConfigManager.load()
+
+    assert server.host == 'example.com'
+    assert server.port == 80
+
+    assert 'unwanted' not in ConfigManager.data
+    assert 'also.unwanted' not in ConfigManager.data
+    assert 'retries' not in ConfigManager.data
+
+    # A proxy that needs more data causes a reload
+
+    client = ConfigProxy(client_model, name='test.subset.client')
+
+    assert client.retries == 3
+    assert 'retries' in ConfigManager.data
+    assert 'unwanted' not in ConfigManager.data
@@ -0,0 +1,147 @@
+"""
+Tests for watching configuration files for changes.
+
+"""
+
+import os
+import threading
+
+import pytest
+
+from rjgtoys.config import Config
+from rjgtoys.config._proxy import ConfigProxy
+from rjgtoys.config._manager import ConfigManager
+from rjgtoys.config._source import YamlFileConfigSource, LayeredConfigSource
+from rjgtoys.config._watch import WatchingConfigSource, _InotifyWatcher
+
+
+WATCHERS = [
+    pytest.param(False, id='polling'),
+    pytest.param(
+        True,
+        id='inotify',
+        marks=pytest.mark.skipif(not _InotifyWatcher.available(), reason="no inotify")
+    )
+]
+
+
+def replace_file(path, text):
+    """Replace a file the way an editor might: write a new one and rename it."""
+
+    tmp = str(path) + '.new'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+@pytest.mark.parametrize('use_inotify', WATCHERS)
+def test_watch_notifies(tmp_path, use_inotify):
+    """Subscribers are told about a change, once per burst of writes."""
+
+    path = tmp_path / 'app.conf'
+    path.write_text("a: 1\n")
+
+    source = WatchingConfigSource(
+        YamlFileConfigSource(str(path)),
+        debounce=0.1,
+        poll_interval=0.02,
+        use_inotify=use_inotify
+    )
+
+    changed = threading.Event()
+    calls = []
+
+    def callback():
+        calls.append(source.fetch())
+        changed.set()
+
+    source.subscribe(callback)
+    source.start()
+    try:
+        for i in range(2, 5):
+            replace_file(path, "a: %d\n" % i)
+        assert changed.wait(5)
+    finally:
+        source.stop()
+
+    assert calls == [dict(a=4)]
+
+
+@pytest.mark.parametrize('use_inotify', WATCHERS)
+def test_watch_file_appears(tmp_path, use_inotify):
+    """A file that doesn't yet exist, in a directory that doesn't yet exist, is watched."""
+
+    path = tmp_path / 'sub' / 'app.conf'
+
+    source = WatchingConfigSource(
+        YamlFileConfigSource(str(path)),
+        debounce=0.05,
+        poll_interval=0.02,
+        use_inotify=use_inotify
+    )
+
+    changed = threading.Event()
+    source.subscribe(changed.set)
+    source.start()
+    try:
+        path.parent.mkdir()
+        path.write_text("a: 1\n")
+        assert changed.wait(5)
+    finally:
+        source.stop()
+
+
+class WatchedModel(Config):
+
+    a_int: int
+
+
+def test_manager_reloads(tmp_path):
+    """The manager reloads the data when the file changes."""
+
+    path = tmp_path / 'app.conf'
+    path.write_text("a_int: 1\n")
+
+    cfg = ConfigProxy(WatchedModel)
+
+    ConfigManager.set_path(str(path))
+    ConfigManager.watch(debounce=0.05, poll_interval=0.02)
+    try:
+        assert cfg.a_int == 1
+
+        reloaded = threading.Event()
+        ConfigManager.watcher.subscribe(reloaded.set)
+
+        replace_file(path, "a_int: 2\n")
+
+        assert reloaded.wait(5)
+        assert cfg.a_int == 2
+    finally:
+        ConfigManager.unwatch()
+
+
+@pytest.mark.parametrize('use_inotify', WATCHERS)
+def test_watch_directory(tmp_path, use_inotify):
+    """A new fragment in a conf.d directory is noticed."""
+
+    confd = tmp_path / 'app.conf.d'
+    confd.mkdir()
+    (confd / '10-base.yaml').write_text("a: 1\n")
+
+    source = WatchingConfigSource(
+        LayeredConfigSource(str(confd / '*.yaml')),
+        debounce=0.05,
+        poll_interval=0.02,
+        use_inotify=use_inotify
+    )
+
+    changed = threading.Event()
+    source.subscribe(changed.set)
+    source.start()
+    try:
+        (confd / '20-more.yaml').write_text("a: 2\n")
+        assert changed.wait(5)
+    finally:
+        source.stop()
+
+    assert source.fetch() == dict(a=2)